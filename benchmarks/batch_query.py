@@ -0,0 +1,76 @@
+"""
+Batch Aggregate Query Throughput
+
+This script compares two ways of getting the aggregates of every county in every year:
+
+- one POST to `/api/aggregates` with all the filter sets,
+- one chart request per filter set (the filter step and every chart callback), as driving the
+  dashboard would.
+
+Both go through the Flask test client of the app in this process, so the numbers measure the
+server-side work only. The callback requests are timed on a sample and reported in filter sets
+per second.
+
+Usage
+-----
+Run from the root of the repository:
+
+    ```bash
+    python benchmarks/batch_query.py
+    python benchmarks/batch_query.py --callback-sample 50 --repeat 5
+    ```
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the batch aggregate endpoint with callback requests.")
+    parser.add_argument("--callback-sample", type=int, default=20, help="callback requests to time (default 20)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed batch requests, the median is reported (default 3)")
+    args = parser.parse_args(argv)
+
+    os.chdir(REPO_ROOT)
+    from load_test import PayloadFactory
+    from src.app import app, server
+    from src.components import counties, min_year, max_year
+
+    client = server.test_client()
+    specs = [{"counties": [county], "years": [year, year]} for county in counties for year in range(min_year, max_year + 1)]
+
+    batch_times = []
+    for _ in range(args.repeat + 1):
+        start = time.perf_counter()
+        response = client.post("/api/aggregates", json={"filters": specs})
+        batch_times.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    batch_time = statistics.median(batch_times[1:])  # the first request builds the aggregator
+
+    factory = PayloadFactory(client.get("/_dash-layout").get_json(), client.get("/_dash-dependencies").get_json())
+    callback_times = []
+    for i, spec in enumerate(specs[:args.callback_sample + 1]):
+        payloads = factory.build_from_values({"county.value": spec["counties"], "year.value": spec["years"]}, "submit.n_clicks")
+        start = time.perf_counter()
+        for payload in payloads:
+            response = client.post("/_dash-update-component", json=payload)
+            assert response.status_code == 200, response.get_data(as_text=True)
+        callback_times.append(time.perf_counter() - start)
+    callback_time = statistics.mean(callback_times[1:])  # the first request imports the chart modules
+
+    print(f"{len(specs)} filter sets ({len(counties)} counties x {max_year - min_year + 1} years)")
+    print(f"batch endpoint:    {batch_time * 1000:10.1f} ms in total, {len(specs) / batch_time:12.0f} filter sets/s")
+    print(f"callback requests: {callback_time * 1000:10.1f} ms each,    {1 / callback_time:12.1f} filter sets/s "
+          f"(mean of {len(callback_times) - 1})")
+    print(f"speed-up: {callback_time * len(specs) / batch_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Cross-filtering Latency
+
+This script writes synthetic raw DINS data (see `src/synthetic_dins.py`), runs it through
+`data_import.py` into a temporary directory and times a click on the charts (see
+`src/crossfilter.py`) for typical filter states. It reports the median time of:
+
+- "reduce", the first click of a filter state: reducing the cube to its partial aggregates,
+- "frames", every other click: the data of the charts from the partial aggregates,
+- "click", the server side of a click on a chart: the frames, the four chart specs and the
+  summary card,
+- "pipeline", the same outputs for the filter state without a selection, through the query
+  backend and VegaFusion, for comparison.
+
+Usage
+-----
+Run from the root of the repository:
+
+    ```bash
+    python benchmarks/crossfilter_latency.py
+    python benchmarks/crossfilter_latency.py --rows 2000000 --repeat 10
+    ```
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+
+from query_backends import FILTER_STATES, median_ms
+
+SELECTIONS = {
+    "roof": {"roof": ["Wood"], "damage": [], "structure": []},
+    "roof x damage": {"roof": ["Asphalt", "Tile"], "damage": ["E. Destroyed (>50%)"], "structure": []},
+    "all three": {"roof": ["Asphalt"], "damage": ["E. Destroyed (>50%)"], "structure": ["A. Single Residence"]},
+}
+
+
+def write_cube(directory, rows):
+    """Runs synthetic raw data through the pipeline and returns the cube written."""
+    import pandas as pd
+    from data_import import load_calfire_df
+    from synthetic_dins import load_profile, write_synthetic_dins
+
+    write_synthetic_dins(os.path.join(directory, "raw"), rows, files=4)
+    counties = sorted(load_profile()["incidents"]["County"].unique())
+    geojson_file = os.path.join(directory, "counties.geojson")
+    with open(geojson_file, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {"name": county},
+             "geometry": {"type": "Polygon", "coordinates": [[[-121, 39], [-121, 40], [-122, 40], [-121, 39]]]}}
+            for county in counties]}, f)
+    load_calfire_df(os.path.join(directory, "raw"), output_dir=os.path.join(directory, "out"),
+                    geojson_file_path=geojson_file, cache_dir=None)
+    return pd.read_pickle(os.path.join(directory, "out", "crossfilter_cube.pkl"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time a click on the cross-filtering charts.")
+    parser.add_argument("--rows", type=int, default=500_000, help="synthetic structures (default 500000)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per state, the median is reported (default 5)")
+    args = parser.parse_args(argv)
+
+    os.chdir(REPO_ROOT)
+    from src.chart_specs import CHART_NAMES, build_chart_spec, crossfilter_chart_data
+    from src.crossfilter import CrossfilterCube
+    from src.data import calfire_df, default_region
+    from src.query_backend import PandasBackend
+    from src.summary_chart import make_summary_chart
+
+    with tempfile.TemporaryDirectory() as directory:
+        cube = write_cube(directory, args.rows)
+    crossfilter = CrossfilterCube(cube, calfire_df)
+    # Without a cache every call reduces the cube again
+    cold = CrossfilterCube(cube, calfire_df, cache_size=0)
+    backend = PandasBackend(default_region)
+
+    def outputs(chart_data):
+        make_summary_chart(chart_data.calfire_df)
+        for chart in CHART_NAMES:
+            build_chart_spec(chart, chart_data)
+
+    print(f"# {args.rows} structures, cube of {len(cube)} rows")
+    print(f"{'filter':<18} {'selection':<14} {'reduce ms':>9} {'frames ms':>9} {'click ms':>8} {'pipeline ms':>11}")
+    for label, filters in FILTER_STATES.items():
+        state = (filters.get("county"), filters.get("year"), filters.get("incident_name"), "Year")
+        pipeline = median_ms(lambda: outputs(backend.chart_data(*state)), args.repeat)
+        for name, selection in SELECTIONS.items():
+            reduce = median_ms(lambda: cold.partial_aggregates(*state), args.repeat)
+            frames = median_ms(lambda: crossfilter.chart_frames(*state, selection), args.repeat)
+            click = median_ms(lambda: outputs(crossfilter_chart_data(crossfilter, *state, selection)), args.repeat)
+            print(f"{label:<18} {name:<14} {reduce:>9.2f} {frames:>9.2f} {click:>8.1f} {pipeline:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
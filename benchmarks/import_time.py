@@ -0,0 +1,128 @@
+"""
+Import Time Report for Worker Cold Starts
+
+This script imports a module (by default `src.app`, which is what every gunicorn worker does on
+spawn) in a fresh interpreter with `python -X importtime` and prints:
+
+- the wall time of the import,
+- the cumulative import time of every top-level package, slowest first,
+- whether the heavy libraries we keep off the serving path (geopandas, plotly.express,
+  altair, vegafusion) were imported.
+
+Usage
+-----
+Run from the root of the repository:
+
+    ```bash
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module src.callbacks --top 30 --repeat 5
+    ```
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HEAVY_MODULES = ["geopandas", "plotly.express", "altair", "vegafusion"]
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure_import(module):
+    """
+    Imports a module in a fresh interpreter under `-X importtime`.
+
+    Parameters
+    ----------
+    module : str
+        Dotted name of the module to import.
+
+    Returns
+    -------
+    tuple of (float, list of tuple)
+        The wall time in seconds, and (self_us, cumulative_us, depth, module) for every
+        imported module in the order reported by the interpreter.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=REPO_ROOT, capture_output=True, text=True)
+    wall_time = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return wall_time, entries
+
+
+def top_level_packages(entries):
+    """
+    Sums the cumulative import time by top-level package.
+
+    An import is attributed to a package when it is not imported from within that same
+    package, so the submodules of a package are not counted twice. The cumulative time of
+    a package includes the packages it imports itself (e.g. pandas includes numpy).
+
+    Parameters
+    ----------
+    entries : list of tuple
+        The entries returned by `measure_import`.
+
+    Returns
+    -------
+    dict
+        Cumulative microseconds keyed by package name.
+    """
+    totals = {}
+    parents = []
+    # -X importtime lists children before their parent, walk backwards to see parents first
+    for _, cumulative_us, depth, name in reversed(entries):
+        package = name.split(".")[0]
+        del parents[depth:]
+        if not parents or parents[-1] != package:
+            totals[package] = totals.get(package, 0) + cumulative_us
+        parents.append(package)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report the import time of the dashboard.")
+    parser.add_argument("--module", default="src.app", help="module to import (default %(default)s)")
+    parser.add_argument("--top", type=int, default=20, help="number of packages to list (default 20)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of fresh imports, the median is reported (default 3)")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    wall_times = [wall_time for wall_time, _ in runs]
+    _, entries = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+    packages = sorted(top_level_packages(entries).items(), key=lambda item: item[1], reverse=True)
+    imported = {name for _, _, _, name in entries}
+    heavy = {module: module in imported for module in HEAVY_MODULES}
+
+    print(f"import {args.module}: median wall time {statistics.median(wall_times):.2f} s over {args.repeat} runs "
+          f"({len(entries)} modules)")
+    print(f"{'package':<32}{'cumulative ms (incl. dependencies)':>36}")
+    for package, cumulative_us in packages[:args.top]:
+        print(f"{package:<32}{cumulative_us / 1000:>36.1f}")
+    print("heavy modules imported: " + ", ".join(f"{module}={'yes' if loaded else 'no'}" for module, loaded in heavy.items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"module": args.module,
+                       "wall_times_s": wall_times,
+                       "packages_ms": {package: cumulative_us / 1000 for package, cumulative_us in packages},
+                       "heavy_modules": heavy}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,565 @@
+"""
+Load Testing Harness for the Dashboard Callbacks
+
+This script starts the dashboard locally under gunicorn and replays a configurable mix of
+filter changes against `/_dash-update-component` at a target concurrency. Every filter change is
+a chart request answered by several callbacks (the filter step and one callback per chart),
+sent in parallel as the browser does. It reports throughput, the latency percentiles of the
+first chart and of the whole request, error rates and the resident memory of every gunicorn
+worker, which is what we need to size the number of workers and threads of a deployment.
+
+Everything runs offline on one Linux box: the payloads are built from the app's own
+`/_dash-layout` and `/_dash-dependencies`, so no browser is needed.
+
+Scenarios
+---------
+- `reset`: Click "Reset All Filters".
+- `year`: Submit a random year range with no other filter.
+- `county`: Submit one to three random counties.
+- `map`: Submit a selection of one to three counties made on the map.
+- `incident`: Submit one to three random incidents.
+
+Usage
+-----
+Run from the root of the repository:
+
+    ```bash
+    python benchmarks/load_test.py --workers 2 --threads 4 --concurrency 8 --duration 30
+    python benchmarks/load_test.py --mix reset=1,year=4,county=3,map=1,incident=1 --json results.json
+    ```
+
+Use `--url` to target a server that is already running instead of starting one.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_MIX = {"reset": 1, "year": 3, "county": 3, "map": 2, "incident": 1}
+# Filter changes reach the server as chart requests, see src/assets/chart_cache.js
+CHART_REQUEST = "chart_request.data"
+FILTER_OUTPUT = "filter_response.data"
+
+
+def parse_mix(mix):
+    """
+    Parses a scenario mix such as "reset=1,year=3" into a dictionary of weights.
+
+    Parameters
+    ----------
+    mix : str
+        Comma separated `scenario=weight` pairs.
+
+    Returns
+    -------
+    dict
+        The weight of every scenario.
+    """
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f"Unknown scenario '{name}', expected one of {sorted(DEFAULT_MIX)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def find_free_port():
+    """Returns a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workers, threads, timeout=120):
+    """
+    Starts `src.app:server` under gunicorn and waits until it answers.
+
+    Parameters
+    ----------
+    port : int
+        Local port to bind.
+    workers : int
+        Number of gunicorn worker processes.
+    threads : int
+        Number of threads per worker.
+    timeout : float, optional
+        Seconds to wait for the server to come up (default is 120).
+
+    Returns
+    -------
+    subprocess.Popen
+        The gunicorn master process.
+    """
+    command = [sys.executable, "-m", "gunicorn", "src.app:server",
+               "--bind", f"127.0.0.1:{port}",
+               "--workers", str(workers),
+               "--threads", str(threads),
+               "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=REPO_ROOT)
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/_dash-layout")
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError("Timed out waiting for the dashboard to start")
+
+
+def stop_server(process):
+    """Gracefully stops the gunicorn master and its workers."""
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def get_json(host, port, path):
+    """Sends a GET request and returns the decoded JSON body."""
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    connection.request("GET", path)
+    response = connection.getresponse()
+    return json.loads(response.read())
+
+
+def collect_props(layout, props=None):
+    """
+    Walks the serialized Dash layout and collects the properties of every component with an id.
+
+    Parameters
+    ----------
+    layout : dict or list
+        The JSON returned by `/_dash-layout`.
+
+    Returns
+    -------
+    dict
+        Component properties keyed by component id.
+    """
+    if props is None:
+        props = {}
+    if isinstance(layout, list):
+        for child in layout:
+            collect_props(child, props)
+    elif isinstance(layout, dict):
+        component_props = layout.get("props", {})
+        if isinstance(component_props.get("id"), str):
+            props[component_props["id"]] = component_props
+        for value in component_props.values():
+            if isinstance(value, (dict, list)):
+                collect_props(value, props)
+    return props
+
+
+def option_values(options):
+    """Returns the values of a dropdown's options, which may be plain values or dicts."""
+    return [option["value"] if isinstance(option, dict) else option for option in options or []]
+
+
+class PayloadFactory:
+    """
+    Builds `/_dash-update-component` payloads for the callbacks answering a chart request from
+    the app's own metadata.
+
+    Parameters
+    ----------
+    layout : dict
+        The JSON returned by `/_dash-layout`.
+    dependencies : list
+        The JSON returned by `/_dash-dependencies`.
+    seed : int, optional
+        Seed of the random filter choices.
+    """
+
+    def __init__(self, layout, dependencies, seed=None):
+        self.props = collect_props(layout)
+        # The filter step first, then the callback of every chart
+        self.callbacks = sorted((dependency for dependency in dependencies
+                                 if any(f"{dependency_input['id']}.{dependency_input['property']}" == CHART_REQUEST
+                                        for dependency_input in dependency["inputs"])),
+                                key=lambda dependency: dependency["output"] != FILTER_OUTPUT)
+        self.counties = option_values(self.props["county"]["options"])
+        self.incidents = option_values(self.props["incident_name"]["options"])
+        self.min_year = self.props["year"]["min"]
+        self.max_year = self.props["year"]["max"]
+        self.random = random.Random(seed)
+
+    @staticmethod
+    def outputs(callback):
+        """Returns the output specification of a callback (a list for multi-output callbacks)."""
+        outputs = []
+        for output in callback["output"].strip(".").split("..."):
+            component_id, _, prop = output.rpartition(".")
+            outputs.append({"id": component_id, "property": prop})
+        return outputs if callback["output"].startswith("..") else outputs[0]
+
+    def filter_state(self, scenario):
+        """
+        Draws the filter values and the triggering input of a scenario.
+
+        Parameters
+        ----------
+        scenario : str
+            One of the scenarios in `DEFAULT_MIX`.
+
+        Returns
+        -------
+        tuple of (dict, str)
+            The value of every input and state keyed by "id.property", and the triggering "id.property".
+        """
+        values = {"county.value": None,
+                  "year.value": [self.min_year, self.max_year],
+                  "incident_name.value": None,
+                  "fire_damage_map.selectedData": None}
+        trigger = "submit.n_clicks"
+
+        if scenario == "reset":
+            trigger = "reset.n_clicks"
+        elif scenario == "year":
+            start = self.random.randint(self.min_year, self.max_year)
+            values["year.value"] = [start, self.random.randint(start, self.max_year)]
+        elif scenario == "county":
+            values["county.value"] = self.random.sample(self.counties, self.random.randint(1, 3))
+        elif scenario == "map":
+            selected = self.random.sample(self.counties, self.random.randint(1, 3))
+            values["fire_damage_map.selectedData"] = {"points": [{"hovertext": county} for county in selected]}
+        elif scenario == "incident":
+            values["incident_name.value"] = self.random.sample(self.incidents, self.random.randint(1, 3))
+        return values, trigger
+
+    def build(self, scenario):
+        """
+        Builds the JSON bodies of the requests of one filter change of the given scenario.
+
+        Parameters
+        ----------
+        scenario : str
+            One of the scenarios in `DEFAULT_MIX`.
+
+        Returns
+        -------
+        list of dict
+            The request body of every callback answering the chart request, see `build_from_values`.
+        """
+        values, trigger = self.filter_state(scenario)
+        return self.build_from_values(values, trigger)
+
+    def build_from_values(self, values, trigger):
+        """
+        Builds the JSON bodies of the requests of a filter change from explicit input values.
+
+        The bodies carry the chart request the browser sends on a miss of its client-side cache,
+        so every request reaches the server.
+
+        Parameters
+        ----------
+        values : dict
+            Input and state values keyed by "id.property". Anything missing takes its
+            default from the layout.
+        trigger : str
+            The "id.property" of the triggering input.
+
+        Returns
+        -------
+        list of dict
+            The request body of the filter step, then of the callback of every chart.
+        """
+        def value(key):
+            component_id, _, prop = key.partition(".")
+            return values.get(key, self.props.get(component_id, {}).get(prop))
+
+        chart_request = {"trigger": trigger.partition(".")[0],
+                         "county": value("county.value"),
+                         "year": value("year.value"),
+                         "incident_name": value("incident_name.value"),
+                         "selectedData": value("fire_damage_map.selectedData"),
+                         "granularity": value("granularity.value") or "Year"}
+        chart_request["key"] = json.dumps(chart_request, sort_keys=True)
+
+        def fill(dependencies):
+            return [{**dependency, "value": chart_request if dependency["id"] == "chart_request" else None}
+                    for dependency in dependencies]
+
+        return [{"output": callback["output"],
+                 "outputs": self.outputs(callback),
+                 "inputs": fill(callback["inputs"]),
+                 "state": fill(callback.get("state", [])),
+                 "changedPropIds": [CHART_REQUEST]}
+                for callback in self.callbacks]
+
+
+def worker_pids(master_pid):
+    """Returns the pids of the direct children of a process, i.e. the gunicorn workers."""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == master_pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def rss_mb(pid):
+    """Returns the resident set size of a process in MB, or None if it has exited."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler(threading.Thread):
+    """
+    Background thread that samples the RSS of every gunicorn worker.
+
+    Parameters
+    ----------
+    master_pid : int
+        Pid of the gunicorn master process.
+    interval : float, optional
+        Seconds between samples (default is 0.5).
+    """
+
+    def __init__(self, master_pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.samples = defaultdict(list)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def sample(self):
+        for pid in worker_pids(self.master_pid):
+            rss = rss_mb(pid)
+            if rss is not None:
+                self.samples[pid].append(rss)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+    def summary(self):
+        """Returns the first, last and peak RSS in MB of every worker."""
+        return {pid: {"start_mb": round(values[0], 1), "end_mb": round(values[-1], 1), "peak_mb": round(max(values), 1)}
+                for pid, values in self.samples.items()}
+
+
+def percentile(sorted_values, q):
+    """Returns the q-th percentile (0-100) of already sorted values using the nearest rank."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies):
+    """Returns the count and latency percentiles in milliseconds of a list of latencies in seconds."""
+    values = sorted(latency * 1000 for latency in latencies)
+    return {"count": len(values),
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+            "max_ms": values[-1] if values else None}
+
+
+def run_load(host, port, factory, weights, concurrency, duration=None, total_requests=None, headers=None):
+    """
+    Replays requests of the weighted scenarios against the server.
+
+    Parameters
+    ----------
+    host, port : str, int
+        Address of the dashboard.
+    factory : PayloadFactory
+        Builds the request bodies.
+    weights : dict
+        Relative weight of every scenario.
+    concurrency : int
+        Number of filter changes in flight at any time, each one sends a request per callback.
+    duration : float, optional
+        Seconds to run for.
+    total_requests : int, optional
+        Number of filter changes to send instead of running for a duration.
+    headers : dict, optional
+        Extra headers sent with every request.
+
+    Returns
+    -------
+    dict
+        Throughput of filter changes, latency percentiles of all the outputs (overall and per
+        scenario) and of the first chart, and error counts.
+    """
+    scenarios, scenario_weights = zip(*weights.items())
+    lock = threading.Lock()
+    results = []
+    errors = defaultdict(int)
+    sent = [0]
+    deadline = time.perf_counter() + duration if duration else None
+    request_headers = {"Content-Type": "application/json", **(headers or {})}
+
+    def next_payload():
+        with lock:
+            if total_requests is not None and sent[0] >= total_requests:
+                return None
+            sent[0] += 1
+            scenario = factory.random.choices(scenarios, scenario_weights)[0]
+            return scenario, [json.dumps(body) for body in factory.build(scenario)]
+
+    def client():
+        # One connection per callback, the requests of a filter change are sent in parallel like the browser does
+        connections = [http.client.HTTPConnection(host, port, timeout=120) for _ in factory.callbacks]
+
+        def post(index, body, start):
+            try:
+                connections[index].request("POST", "/_dash-update-component", body=body, headers=request_headers)
+                response = connections[index].getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException) as error:
+                status = type(error).__name__
+                connections[index].close()
+                connections[index] = http.client.HTTPConnection(host, port, timeout=120)
+            return status, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=len(connections)) as sender:
+            while deadline is None or time.perf_counter() < deadline:
+                item = next_payload()
+                if item is None:
+                    break
+                scenario, bodies = item
+                start = time.perf_counter()
+                answers = list(sender.map(post, range(len(bodies)), bodies, [start] * len(bodies)))
+                failed = [status for status, _ in answers if status != 200]
+                status = failed[0] if failed else 200
+                # The first body is the filter step, the others build the charts
+                first_chart = min(elapsed for _, elapsed in answers[1:]) if len(answers) > 1 else answers[0][1]
+                elapsed = max(elapsed for _, elapsed in answers)
+                with lock:
+                    results.append((scenario, status, elapsed, first_chart))
+                    if status != 200:
+                        errors[str(status)] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(client) for _ in range(concurrency)]:
+            future.result()
+    wall_time = time.perf_counter() - start
+
+    by_scenario = defaultdict(list)
+    for scenario, status, elapsed, _ in results:
+        if status == 200:
+            by_scenario[scenario].append(elapsed)
+
+    return {"requests": len(results),
+            "wall_time_s": round(wall_time, 2),
+            "throughput_rps": round(len(results) / wall_time, 2) if wall_time else None,
+            "error_rate": round(sum(errors.values()) / len(results), 4) if results else None,
+            "errors": dict(errors),
+            "latency": summarize([elapsed for _, status, elapsed, _ in results if status == 200]),
+            "first_chart": summarize([first_chart for _, status, _, first_chart in results if status == 200]),
+            "scenarios": {scenario: summarize(latencies) for scenario, latencies in sorted(by_scenario.items())}}
+
+
+def format_report(report):
+    """Formats a load test report as a plain text table."""
+    lines = [f"Requests: {report['requests']} in {report['wall_time_s']} s "
+             f"({report['throughput_rps']} req/s), error rate {report['error_rate']} {report['errors'] or ''}",
+             f"{'scenario':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    rows = [("all", report["latency"]), ("first chart", report["first_chart"])] + list(report["scenarios"].items())
+    for name, stats in rows:
+        cells = [f"{stats[key]:>10.1f}" if stats[key] is not None else f"{'-':>10}"
+                 for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        lines.append(f"{name:<12}{stats['count']:>8}" + "".join(cells))
+    for pid, rss in report.get("worker_rss", {}).items():
+        lines.append(f"worker {pid}: RSS {rss['start_mb']} -> {rss['end_mb']} MB (peak {rss['peak_mb']} MB)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a mix of filter changes against the dashboard.")
+    parser.add_argument("--url", help="Target an already running dashboard instead of starting one, e.g. http://127.0.0.1:8050")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes (default 2)")
+    parser.add_argument("--threads", type=int, default=1, help="gunicorn threads per worker (default 1)")
+    parser.add_argument("--concurrency", type=int, default=4, help="filter changes in flight (default 4)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run (default 30)")
+    parser.add_argument("--requests", type=int, help="send this many filter changes instead of running for --duration")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed filter changes per worker before measuring (default 5)")
+    parser.add_argument("--mix", default=",".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+                        help="scenario weights (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=532, help="random seed of the filter choices")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    weights = parse_mix(args.mix)
+    process = None
+    if args.url:
+        parsed = urllib.parse.urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+    else:
+        host, port = "127.0.0.1", find_free_port()
+        process = start_server(port, args.workers, args.threads)
+
+    try:
+        factory = PayloadFactory(get_json(host, port, "/_dash-layout"),
+                                 get_json(host, port, "/_dash-dependencies"),
+                                 seed=args.seed)
+        if args.warmup:
+            run_load(host, port, factory, weights, args.concurrency, total_requests=args.warmup * args.workers)
+
+        sampler = RssSampler(process.pid) if process else None
+        if sampler:
+            sampler.start()
+        report = run_load(host, port, factory, weights, args.concurrency,
+                          duration=None if args.requests else args.duration,
+                          total_requests=args.requests)
+        if sampler:
+            sampler.stop()
+            report["worker_rss"] = sampler.summary()
+        report["config"] = {"workers": args.workers, "threads": args.threads,
+                            "concurrency": args.concurrency, "mix": weights}
+    finally:
+        if process:
+            stop_server(process)
+
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Query Backend Comparison
+
+This script times the pandas and DuckDB query backends (see `src/query_backend.py`) on the
+summary dataset replicated 1, 10 and 100 times. Every copy of an incident is renamed, so the
+filters match as many incidents as copies. For a set of typical filter states it reports the
+median time of:
+
+- "aggregate", getting the `ChartData` of the filter state from the backend,
+- "charts", the same plus building the four chart specs, as the chart callbacks do.
+
+The leaderboard of the top counties is the one of the original data, the replicas do not
+change the ranking.
+
+Usage
+-----
+Run from the root of the repository:
+
+    ```bash
+    python benchmarks/query_backends.py
+    python benchmarks/query_backends.py --scales 1 10 100 1000 --repeat 10
+    ```
+"""
+
+import argparse
+import copy
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+FILTER_STATES = {
+    "all": {},
+    "years": {"year": [2018, 2020]},
+    "county": {"county": ["Butte"]},
+    "counties x years": {"county": ["Butte", "Los Angeles", "Sonoma", "Shasta"], "year": [2017, 2021]},
+    "incidents": {"incident_name": ["Camp", "Woolsey", "Tubbs"]},
+}
+
+
+def replicate(region, scale):
+    """Returns a copy of a region whose summary dataset and rollups hold `scale` copies of every incident."""
+    import pandas as pd
+
+    def copies(df):
+        frames = [df] + [df.assign(**{"Incident Name": df["Incident Name"] + f" #{i}"}) for i in range(1, scale)]
+        return pd.concat(frames, ignore_index=True)
+
+    scaled = copy.copy(region)
+    scaled.calfire_df = copies(region.calfire_df)
+    scaled.timeseries_rollups = {granularity: scaled.calfire_df if granularity == "Year" else copies(df)
+                                 for granularity, df in region.timeseries_rollups.items()}
+    scaled.version = f"{region.version}x{scale}"
+    return scaled
+
+
+def median_ms(func, repeat):
+    func()  # warm-up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the pandas and DuckDB query backends.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="data sizes (default 1 10 100)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per filter state, the median is reported (default 5)")
+    args = parser.parse_args(argv)
+
+    os.chdir(REPO_ROOT)
+    from src.chart_specs import CHART_NAMES, build_chart_spec
+    from src.data import default_region
+    from src.query_backend import make_query_backend
+
+    print(f"{'scale':>5} {'rows':>8} {'filter':<18} {'backend':<7} {'aggregate ms':>12} {'charts ms':>10}")
+    for scale in args.scales:
+        region = replicate(default_region, scale)
+        start = time.perf_counter()
+        backends = {name: make_query_backend(name, region) for name in ("pandas", "duckdb")}
+        print(f"# {scale}x: backends loaded in {time.perf_counter() - start:.2f} s")
+        for label, filters in FILTER_STATES.items():
+            for name, backend in backends.items():
+                aggregate = median_ms(lambda: backend.chart_data(**filters), args.repeat)
+
+                def charts():
+                    chart_data = backend.chart_data(**filters)
+                    for chart in CHART_NAMES:
+                        build_chart_spec(chart, chart_data)
+
+                print(f"{scale:>5} {len(region.calfire_df):>8} {label:<18} {name:<7} {aggregate:>12.2f} "
+                      f"{median_ms(charts, args.repeat):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Replay of Recorded Slow Requests
+
+Replays the slow chart callback calls recorded by the flight recorder (see
+`src/flight_recorder.py`) against a server, to reproduce a latency spike locally. The recorded
+Dash request bodies are sent as they were, and the recorded and replayed latencies are compared.
+
+The source is either the `/debug/slow-requests` endpoint of a running server (with the debug
+token in `--token` or `CALFIRE_DEBUG_TOKEN`) or a file holding its JSON output.
+
+Usage
+-----
+Run from the root of the repository, with the dashboard running locally:
+
+    ```bash
+    curl -H "X-Debug-Token: $TOKEN" https://<server>/debug/slow-requests > slow.json
+    python benchmarks/replay_slow_requests.py slow.json --url http://127.0.0.1:8050 --repeat 3
+    python benchmarks/replay_slow_requests.py https://<server>/debug/slow-requests --token $TOKEN
+    ```
+"""
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import time
+import urllib.parse
+import urllib.request
+
+
+def load_entries(source, token=None):
+    """
+    Reads the recorded slow calls.
+
+    Parameters
+    ----------
+    source : str
+        A `/debug/slow-requests` URL or a file holding its output.
+    token : str, optional
+        The debug token of the server.
+
+    Returns
+    -------
+    list of dict
+        The recorded entries, oldest first.
+    """
+    if source.startswith(("http://", "https://")):
+        request = urllib.request.Request(source, headers={"X-Debug-Token": token or ""})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            dump = json.loads(response.read())
+    else:
+        with open(source) as f:
+            dump = json.load(f)
+    return dump["entries"] if isinstance(dump, dict) else dump
+
+
+def replay(entry, url, repeat=1):
+    """
+    Sends the recorded request of an entry to a server.
+
+    Parameters
+    ----------
+    entry : dict
+        A recorded slow call.
+    url : str
+        Base URL of the server.
+    repeat : int, optional
+        Number of times the request is sent (default is 1).
+
+    Returns
+    -------
+    list of float
+        The latency of every replay in milliseconds.
+
+    Raises
+    ------
+    RuntimeError
+        If the server does not answer with 200 or 204.
+    """
+    parsed = urllib.parse.urlparse(url)
+    connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+    connection = connection_class(parsed.netloc, timeout=120)
+    body = json.dumps(entry["request"])
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.request("POST", parsed.path.rstrip("/") + "/_dash-update-component", body=body,
+                           headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status not in (200, 204):
+            raise RuntimeError(f"Replay failed with status {response.status}")
+    connection.close()
+    return latencies
+
+
+def format_replays(results):
+    """Formats the recorded and replayed latencies of every entry."""
+    lines = [f"{'recorded ms':>12}{'replay ms':>12}  {'slowest stage':<28}filters"]
+    for entry, latencies in results:
+        stages = entry.get("stages_ms") or {}
+        slowest = max(stages, key=stages.get) if stages else ""
+        slowest = f"{slowest} ({stages[slowest]:.0f} ms)" if slowest else ""
+        filters = {key: value for key, value in (entry.get("filters") or {}).items() if value}
+        lines.append(f"{entry['duration_ms']:>12.0f}{statistics.median(latencies):>12.0f}  {slowest:<28}"
+                     f"{json.dumps(filters)} trigger={entry.get('trigger')}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay the slow requests recorded by the flight recorder.")
+    parser.add_argument("source", help="/debug/slow-requests URL or a file holding its JSON output")
+    parser.add_argument("--url", default="http://127.0.0.1:8050", help="server to replay against (default %(default)s)")
+    parser.add_argument("--token", default=os.environ.get("CALFIRE_DEBUG_TOKEN"), help="debug token of the source server")
+    parser.add_argument("--repeat", type=int, default=1, help="replays of every request (default 1)")
+    args = parser.parse_args(argv)
+
+    entries = [entry for entry in load_entries(args.source, args.token) if entry.get("request")]
+    results = [(entry, replay(entry, args.url, args.repeat)) for entry in entries]
+    print(format_replays(results))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Gunicorn settings, read automatically when gunicorn is started from the root of the repository.
+
+Only the hooks keeping the multiprocess Prometheus metrics of `src/metrics.py` correct and the
+cache warm-up of new workers (see `src/query_log.py`) are set here, the worker and thread counts
+are still given on the command line.
+"""
+
+import glob
+import os
+
+
+def _metrics_dir():
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("CALFIRE_METRICS_DIR")
+
+
+def on_starting(server):
+    # Metrics files of a previous server would be added to the new totals
+    metrics_dir = _metrics_dir()
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    # Drops the live gauges (in-flight requests, RSS) of the exited worker
+    if _metrics_dir():
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", _metrics_dir())
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # The app is loaded, the worker starts accepting requests once the popular filter states are cached
+    from src.callbacks import precompute
+    from src.query_log import warm_up
+
+    warm_up(precompute)
@@ -52,13 +52,51 @@ Date:
 from dash import Dash, html
 import dash_bootstrap_components as dbc
 from . import callbacks
-from .components import title, global_widgets, cali_map, summary_card, damage_level, timeseries_chart, structure_count, roof_chart, info_section, reference_info, hover_info
+from .memory_profiler import register_memory_routes, start_snapshot_writer
+from .structure_store import register_structure_routes
+from .batch_query import register_batch_routes
+from .chart_render import register_render_routes
+from .static_export import register_export_routes
+from .regions import register_region_routes
+from .metrics import register_metrics_routes
+from .request_profiler import register_profiler_routes
+from .flight_recorder import register_flight_recorder_routes
+from .query_log import warm_up
+from .components import title, global_widgets, cali_map, summary_card, damage_level, timeseries_chart, structure_count, roof_chart, info_section, reference_info, hover_info, chart_cache_stores, value_distribution
 
 # Initiatlize the app
 app = Dash(__name__, 
            external_stylesheets=[dbc.themes.FLATLY], title="California Wildfire Dashboard", assets_folder = "assets")
 server = app.server
 
+# Prometheus metrics, aggregated across gunicorn workers when CALFIRE_METRICS_DIR is set
+register_metrics_routes(server)
+
+# Opt-in memory instrumentation (see memory_profiler.py)
+register_memory_routes(server)
+start_snapshot_writer()
+
+# On-demand cProfile of flagged requests (see request_profiler.py)
+register_profiler_routes(server)
+
+# Ring buffer of slow chart callback calls (see flight_recorder.py)
+register_flight_recorder_routes(server)
+
+# Structure-level drill-down queries
+register_structure_routes(server)
+
+# Batch aggregates of many filter sets for reports
+register_batch_routes(server)
+
+# Charts rendered to SVG and PNG for clients without Vega
+register_render_routes(server)
+
+# Chart specs as JSON, for the static export to fall back to
+register_export_routes(server)
+
+# Regions with a data partition and the ones held in memory
+register_region_routes(server)
+
 # Layout
 app.layout = dbc.Container([
     title, 
@@ -76,11 +114,15 @@ app.layout = dbc.Container([
             dbc.Row([
                 structure_count,
                 timeseries_chart],
+            style={"marginTop": "20px"}),
+            dbc.Row([
+                value_distribution],
             style={"marginTop": "20px"})]),
             ],
             style={"marginTop": "10px",
                    "marginRight":"5px"}),
-    reference_info],
+    reference_info,
+    chart_cache_stores],
     fluid=True,
     style={'margin': 0,
            'padding': 0,
@@ -91,4 +133,6 @@ app.layout = dbc.Container([
 
 # Run the app/dashboard
 if __name__ == '__main__':
+    # Caches the most frequent filter states of the query log first (see query_log.py)
+    warm_up(callbacks.precompute)
     app.server.run(debug=False)
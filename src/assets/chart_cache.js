@@ -0,0 +1,177 @@
+/*
+ * Client-side cache of the chart outputs of the dashboard.
+ *
+ * Outputs are kept in the `chart_cache` store (session storage by default), keyed by the
+ * normalized filter state. A filter state already in the cache is served without a request to
+ * the server. Otherwise it is written to `chart_request`, and the server answers it in several
+ * stores: `filter_response` (the summary card and the filter values) and one
+ * `<chart>_response` per chart. Every answer is drawn as soon as it arrives, and the filter
+ * state is cached once all of its outputs are in. The least recently used entries are evicted
+ * when the cache grows above `max_bytes`, and the cache is emptied when the version of the outputs
+ * (the dataset version and the configuration of the server) changes.
+ *
+ * The values selected on the roof, damage and structure charts (their `signalData`) are part of
+ * the filter state: a click on a chart is served like a filter change, with the county, year and
+ * incident filters last applied. Charts report their selection again whenever they are redrawn,
+ * a state equal to the current one is ignored. A reset clears the selections.
+ *
+ * The time from a filter change to the first and to the last chart drawn is reported to
+ * `timings_url` (see metrics.py).
+ */
+
+(function () {
+    const OUTPUTS = ["roof_chart", "damage_chart", "structure_chart", "summary_card", "timeseries_chart",
+                     "county", "year", "incident_name"];
+    const CHARTS = ["roof_chart", "damage_chart", "structure_chart", "timeseries_chart"];
+    const RESPONSES = ["filter_response"].concat(CHARTS.map(chart => chart + "_response"));
+    // Filter dimension, chart, selection signal and field of the cross-filtering charts (see crossfilter.py)
+    const SELECTIONS = [["roof", "roof_chart", "roof_select", "Roof Construction"],
+                        ["damage", "damage_chart", "damage_select", "Damage Category"],
+                        ["structure", "structure_chart", "structure_select", "Structure Category"]];
+
+    function normalizeList(values) {
+        if (values === null || values === undefined || values.length === 0) {
+            return null;
+        }
+        values = Array.isArray(values) ? values : [values];
+        return Array.from(new Set(values)).sort();
+    }
+
+    function selectedCounties(selectedData) {
+        // Points of the density layer (curve 1) are not counties
+        return ((selectedData && selectedData.points) || [])
+            .filter(point => (point.curveNumber || 0) === 0)
+            .map(point => point.hovertext);
+    }
+
+    function chartSelections(signals) {
+        // The selection signal of a chart is {field: [values]}, empty when nothing is selected
+        const selections = {};
+        SELECTIONS.forEach(([dimension, chart, signal, field], i) => {
+            const value = signals[i] && signals[i][signal];
+            selections[dimension] = normalizeList(value ? value[field] : null);
+        });
+        return selections;
+    }
+
+    function filterState(reset, county, year, incidentName, selectedData, granularity, selections, config) {
+        if (reset) {
+            return {county: null, year: [config.min_year, config.max_year], incident_name: null,
+                    granularity: granularity || "Year", roof: null, damage: null, structure: null};
+        }
+        const counties = (county || []).concat(selectedCounties(selectedData));
+        return Object.assign({county: normalizeList(counties), year: year ? [year[0], year[1]] : null,
+                              incident_name: normalizeList(incidentName), granularity: granularity || "Year"},
+                             selections);
+    }
+
+    function stateKey(state) {
+        return JSON.stringify([state.county, state.year, state.incident_name, state.granularity,
+                               state.roof, state.damage, state.structure]);
+    }
+
+    function emptyCache(config) {
+        return {version: config.version, entries: {}, order: [], bytes: 0, pending: null, current: null};
+    }
+
+    function storeEntry(cache, key, outputs, maxBytes) {
+        const bytes = JSON.stringify(outputs).length;
+        if (cache.entries[key]) {
+            cache.bytes -= cache.entries[key].bytes;
+            cache.order = cache.order.filter(other => other !== key);
+        }
+        if (bytes > maxBytes) {
+            return cache;
+        }
+        cache.entries[key] = {outputs: outputs, bytes: bytes};
+        cache.order.push(key);
+        cache.bytes += bytes;
+        while (cache.bytes > maxBytes && cache.order.length > 0) {
+            const evicted = cache.order.shift();
+            cache.bytes -= cache.entries[evicted].bytes;
+            delete cache.entries[evicted];
+        }
+        return cache;
+    }
+
+    function reportTiming(config, metric, seconds, source) {
+        if (config.timings_url && navigator.sendBeacon) {
+            navigator.sendBeacon(config.timings_url, JSON.stringify({metric: metric, seconds: seconds, source: source}));
+        }
+    }
+
+    function outputList(outputs, noUpdate) {
+        return OUTPUTS.map(name => name in outputs ? outputs[name] : noUpdate);
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        chart_cache: {
+            serve: function (nSubmit, nReset, granularity, ...args) {
+                const responses = args.slice(0, RESPONSES.length);
+                const signals = args.slice(RESPONSES.length, RESPONSES.length + SELECTIONS.length);
+                const [county, year, incidentName, selectedData, storedCache, config] =
+                    args.slice(RESPONSES.length + SELECTIONS.length);
+                const noUpdate = window.dash_clientside.no_update;
+                const triggered = window.dash_clientside.callback_context.triggered.map(t => t.prop_id);
+                const cache = storedCache && storedCache.version === config.version ? storedCache : emptyCache(config);
+
+                const answered = RESPONSES.filter(name => triggered.includes(name + ".data"));
+                if (answered.length > 0) {
+                    // Answers to an older request are dropped, the charts show the latest filter state
+                    const pending = cache.pending;
+                    const received = {};
+                    answered.forEach(name => {
+                        const response = responses[RESPONSES.indexOf(name)];
+                        if (pending && response && response.key === pending.key) {
+                            Object.assign(received, response.outputs);
+                        }
+                    });
+                    if (Object.keys(received).length === 0) {
+                        return OUTPUTS.map(() => noUpdate).concat([noUpdate, noUpdate]);
+                    }
+                    Object.assign(pending.outputs, received);
+                    const seconds = (Date.now() - pending.sent) / 1000;
+                    if (!pending.first_chart && CHARTS.some(chart => chart in received)) {
+                        pending.first_chart = seconds;
+                        reportTiming(config, "first_chart", seconds, "server");
+                    }
+                    if (OUTPUTS.every(name => name in pending.outputs)) {
+                        reportTiming(config, "all_charts", seconds, "server");
+                        storeEntry(cache, pending.key, pending.outputs, config.max_bytes);
+                        cache.pending = null;
+                    }
+                    return outputList(received, noUpdate).concat([noUpdate, cache]);
+                }
+
+                const reset = triggered.includes("reset.n_clicks");
+                const selections = chartSelections(signals);
+                const clicked = SELECTIONS.some(([, chart]) => triggered.includes(chart + ".signalData"));
+                // A click on a chart keeps the filters last applied, not the ones edited in the sidebar since
+                const state = clicked && cache.current ? Object.assign({}, cache.current, selections)
+                    : filterState(reset, county, year, incidentName, selectedData, granularity, selections, config);
+                const key = stateKey(state);
+                if (clicked && cache.current && key === stateKey(cache.current)) {
+                    // A redrawn chart reporting the selection it was drawn with
+                    return OUTPUTS.map(() => noUpdate).concat([noUpdate, noUpdate]);
+                }
+                cache.current = state;
+                const entry = cache.entries[key];
+                if (entry) {
+                    // Most recently used entries are evicted last
+                    cache.order = cache.order.filter(other => other !== key).concat([key]);
+                    cache.pending = null;
+                    reportTiming(config, "first_chart", 0, "cache");
+                    reportTiming(config, "all_charts", 0, "cache");
+                    return outputList(entry.outputs, noUpdate).concat([noUpdate, cache]);
+                }
+
+                const sent = Date.now();
+                cache.pending = {key: key, sent: sent, outputs: {}, first_chart: null};
+                // The state is sent resolved, the map selection is already in its counties
+                const request = Object.assign({key: key, trigger: reset ? "reset" : "submit", selectedData: null,
+                                               sent: sent}, state);
+                return OUTPUTS.map(() => noUpdate).concat([request, cache]);
+            }
+        }
+    });
+})();
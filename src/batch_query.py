@@ -0,0 +1,227 @@
+"""
+Batch Aggregate Queries over the Summary Data
+
+Reports need the chart aggregates of many filter sets at once, e.g. every county in every
+year. Instead of one chart request per filter set, `BatchAggregator` evaluates all of
+them in one vectorized pass over the summary data:
+
+- every filter set becomes one row of a boolean matrix over the summary rows, built by
+  indexing small per-filter lookup tables with the county and incident codes of the rows and
+  broadcasting the year ranges,
+- the roof x damage counts, structure counts and economic loss of every filter set are then a
+  single matrix product of that matrix with the value columns.
+
+A filter set is a dict with any of "counties" (list of names), "years" (inclusive [first, last])
+and "incidents" (list of names); missing keys do not filter, as in the dashboard.
+
+Examples
+--------
+>>> aggregator = BatchAggregator(calfire_df)
+>>> aggregator.aggregate([{"counties": ["Butte"], "years": [2018, 2018]}, {"incidents": ["Camp"]}])
+"""
+
+import numpy as np
+import pandas as pd
+
+from .summary_columns import split_summary_columns
+
+FILTER_KEYS = {"counties", "years", "incidents"}
+MAX_FILTER_SPECS = 10000
+CHUNK_SIZE = 2048
+
+
+def _strip_prefix(category):
+    # The summary columns carry sorting prefixes such as "A. No Damage", see data_import.py
+    return category.split(". ", 1)[1] if ". " in category[:4] else category
+
+
+def validate_filter_specs(specs):
+    """
+    Checks that filter sets are well formed.
+
+    Parameters
+    ----------
+    specs : list of dict
+        The filter sets.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError
+        If `specs` is not a list of filter sets, or a filter set has unknown keys, a
+        malformed year range or counties or incidents that are not a list of names.
+    """
+    if not isinstance(specs, list):
+        raise ValueError("Expected a list of filter sets")
+    if len(specs) > MAX_FILTER_SPECS:
+        raise ValueError(f"At most {MAX_FILTER_SPECS} filter sets can be queried at once")
+    for i, spec in enumerate(specs):
+        if not isinstance(spec, dict):
+            raise ValueError(f"Filter set {i} is not an object")
+        unknown = set(spec) - FILTER_KEYS
+        if unknown:
+            raise ValueError(f"Filter set {i} has unknown keys {sorted(unknown)}, expected some of {sorted(FILTER_KEYS)}")
+        years = spec.get("years")
+        if years is not None and (not isinstance(years, list) or len(years) != 2
+                                  or not all(isinstance(year, int) for year in years)):
+            raise ValueError(f"Filter set {i} has invalid years {years!r}, expected [first, last]")
+        for key in ("counties", "incidents"):
+            if spec.get(key) is not None and (not isinstance(spec[key], list)
+                                              or not all(isinstance(value, str) for value in spec[key])):
+                raise ValueError(f"Filter set {i} has invalid {key}, expected a list of names")
+
+
+class BatchAggregator:
+    """
+    Evaluates the chart aggregates of many filter sets at once.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame
+        The summary dataset of `data_import.py`: the roof x damage and structure count
+        columns (whichever categories the data has, see `summary_columns.py`), then
+        "Incident Name", "Year", "County" and "Total Economic Loss".
+    """
+
+    def __init__(self, calfire_df):
+        # Same columns as the charts (see roof_chart.py and structure_chart.py)
+        self.roof_damage_columns, self.structure_columns = split_summary_columns(calfire_df.columns)
+        self.values = calfire_df[self.roof_damage_columns + self.structure_columns + ["Total Economic Loss"]].to_numpy(dtype=np.float64)
+
+        self.county_codes, counties = pd.factorize(calfire_df["County"])
+        self.incident_codes, incidents = pd.factorize(calfire_df["Incident Name"])
+        self.county_lookup = {county: code for code, county in enumerate(counties)}
+        self.incident_lookup = {incident: code for code, incident in enumerate(incidents)}
+        self.years = calfire_df["Year"].to_numpy(dtype=np.int64)
+
+    def _accepted(self, specs, key, lookup):
+        # One row per filter set, one column per category: the categories it accepts
+        accepted = np.ones((len(specs), len(lookup)), dtype=bool)
+        for i, spec in enumerate(specs):
+            if spec.get(key):
+                accepted[i] = False
+                accepted[i, [lookup[value] for value in spec[key] if value in lookup]] = True
+        return accepted
+
+    def masks(self, specs):
+        """
+        Returns the summary rows matched by every filter set.
+
+        Parameters
+        ----------
+        specs : list of dict
+            The filter sets.
+
+        Returns
+        -------
+        np.ndarray
+            A boolean matrix with one row per filter set and one column per summary row.
+        """
+        mask = self._accepted(specs, "counties", self.county_lookup)[:, self.county_codes]
+        mask &= self._accepted(specs, "incidents", self.incident_lookup)[:, self.incident_codes]
+
+        first = np.array([spec["years"][0] if spec.get("years") else np.iinfo(np.int64).min for spec in specs])
+        last = np.array([spec["years"][1] if spec.get("years") else np.iinfo(np.int64).max for spec in specs])
+        mask &= (self.years >= first[:, None]) & (self.years <= last[:, None])
+        return mask
+
+    def totals(self, specs):
+        """
+        Sums the value columns over the rows of every filter set.
+
+        Parameters
+        ----------
+        specs : list of dict
+            The filter sets.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            The totals, one row per filter set with the roof x damage counts, the structure
+            counts and the economic loss, and the number of summary rows matched.
+        """
+        totals = np.empty((len(specs), self.values.shape[1]))
+        matched = np.empty(len(specs), dtype=np.int64)
+        # Chunks bound the size of the mask matrix for large batches
+        for start in range(0, len(specs), CHUNK_SIZE):
+            mask = self.masks(specs[start:start + CHUNK_SIZE])
+            totals[start:start + CHUNK_SIZE] = mask.astype(np.float64) @ self.values
+            matched[start:start + CHUNK_SIZE] = mask.sum(axis=1)
+        return totals, matched
+
+    def aggregate(self, specs):
+        """
+        Computes the chart aggregates of every filter set.
+
+        Parameters
+        ----------
+        specs : list of dict
+            The filter sets, see `validate_filter_specs`.
+
+        Returns
+        -------
+        list of dict
+            For every filter set, in order: the filter set, the number of incident-county-year
+            rows matched ("records"), the structure counts by roof construction and damage
+            ("roof_damage"), by structure category ("structure"), and the total economic loss
+            ("economic_loss").
+        """
+        validate_filter_specs(specs)
+        totals, matched = self.totals(specs)
+
+        n_roof_damage, n_structure = len(self.roof_damage_columns), len(self.structure_columns)
+        results = []
+        for spec, row, records in zip(specs, totals.tolist(), matched.tolist()):
+            roof_damage = {}
+            for (roof, damage), count in zip(self.roof_damage_columns, row[:n_roof_damage]):
+                roof_damage.setdefault(roof, {})[_strip_prefix(damage)] = int(count)
+            results.append({
+                "filter": spec,
+                "records": records,
+                "roof_damage": roof_damage,
+                "structure": {_strip_prefix(category): int(count)
+                              for category, count in zip(self.structure_columns, row[n_roof_damage:n_roof_damage + n_structure])},
+                "economic_loss": row[-1],
+            })
+        return results
+
+
+_batch_aggregator = None
+
+
+def get_batch_aggregator():
+    """Returns the aggregator of the dashboard's summary data, built on first use."""
+    global _batch_aggregator
+    if _batch_aggregator is None:
+        from .data import calfire_df
+        _batch_aggregator = BatchAggregator(calfire_df)
+    return _batch_aggregator
+
+
+def register_batch_routes(server):
+    """
+    Adds the `/api/aggregates` endpoint to the Flask server.
+
+    The endpoint accepts a POST with a JSON body `{"filters": [filter set, ...]}` (or the list
+    itself) and returns `{"results": [...]}` as described in `BatchAggregator.aggregate`.
+    Malformed filter sets are answered with a 400.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    """
+    from flask import request
+
+    @server.route("/api/aggregates", methods=["POST"])
+    def aggregates():
+        body = request.get_json(silent=True)
+        specs = body.get("filters") if isinstance(body, dict) else body
+        try:
+            results = get_batch_aggregator().aggregate(specs)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        return {"results": results}
@@ -6,11 +6,28 @@ visualizations in the California wildfire dashboard.
 
 Functions
 ---------
-update_charts(county, year, incident_number, selectedData)
-    Filters the wildfire dataset based on user input and updates visualizations 
-    such as roof type distribution, damage severity, structure counts, 
-    economic loss summary, time series trends, and the interactive map.
-    
+update_filters(chart_request), update_roof_chart(chart_request), ...
+    Answer the filter states missing from the client-side cache of the browser (see
+    assets/chart_cache.js), which serves the other ones without a request. The filter step
+    returns the summary card and the filter values, and every chart has its own callback, so
+    each output is drawn as soon as it is ready. They share the filtered data through
+    `chart_data_cache`, and their outputs are kept in the persistent `spec_cache` when
+    `CALFIRE_SPEC_CACHE_PATH` is set. A click on the roof, damage or structure chart is a
+    chart request too, with the selection of the chart as an additional filter answered from
+    the partial aggregates of the cross-filter cube (see crossfilter.py).
+
+precompute(filters)
+    Computes the outputs of a filter state into the caches, used by the warm-up of new workers.
+
+chart_outputs(filters)
+    Returns the outputs of a filter state through the same caches, used by `/api/charts`.
+
+update_density_layer(density_layer, relayoutData, county, year, selectedData)
+    Redraws the hexagonal structure density layer of the map for the cells in view.
+
+update_value_distribution(n_clicks_s, n_clicks_r, county, year, incident_name, selectedData)
+    Updates the percentiles of the assessed value per structure from the quantile sketches.
+
 toggle_button(n, is_open)
     Controls the visibility of the information modal when the info button is clicked.
 
@@ -23,59 +40,138 @@ Callbacks
     - `summary_card` (Economic loss information)
     - `timeseries_chart` (Vega visualization)
     - `fire_damage_map` (Plotly map)
-    - `county` (User-selected counties)
-    - `fire_damage_map.selectedData` (Selection state reset)
+    - `county`, `year` and `incident_name` (Filter values after a reset or a map selection)
 
 Parameters
 ----------
-county : list or None
-    The selected counties for filtering the wildfire dataset.
-year : list
-    The range of years for filtering the dataset.
-incident_number : list or None
-    The selected incident numbers for filtering specific wildfire events.
-selectedData : dict or None
-    The selected data points from the map visualization.
+chart_request : dict
+    The filter state missing from the client-side cache: the cache "key", the "trigger"
+    ("submit" or "reset"), "county", "year", "incident_name", the "selectedData" of the map,
+    the "granularity" of the time series ("Year", "Month" or "Week") and the values selected
+    on the charts, "roof", "damage" and "structure".
 
 Returns
 -------
-tuple
-    A tuple containing updated versions of:
-    - `roof_chart` (dict): Vega visualization of roof types.
-    - `damage_chart` (dict): Vega visualization of damage severity.
-    - `structure_chart` (dict): Vega visualization of affected structures.
-    - `summary_card_update` (list): Dash component for displaying total economic loss.
-    - `timeseries_chart` (dict): Vega visualization of time-series wildfire trends.
-    - `fire_damage_map` (dict): Updated wildfire impact map.
-    - `county` (list or None): Updated county selection.
-    - `selectedData` (None): Reset selected data points.
+dict
+    The cache "key" of the request and the "outputs" of the callback keyed by name:
+    - `summary_card` (list), `county`, `year` and `incident_name` for `update_filters`,
+    - the Vega spec (dict) of its chart for every chart callback.
 
 Usage
 -----
 This script is part of a Dash app and should be run within a Dash context.
 
 Example:
-    >>> from callbacks import update_charts, toggle_button
-    >>> update_charts(["Los Angeles"], [2015, 2020], None, None)
+    >>> from callbacks import update_filters, update_roof_chart
+    >>> request = {"trigger": "submit", "county": ["Los Angeles"], "year": [2015, 2020]}
+    >>> update_filters(request)["outputs"]["summary_card"]
+    >>> update_roof_chart(request)["outputs"]["roof_chart"]
 """
 
-from dash import Output, Input, callback, State, html, ctx, no_update
+from dash import Output, Input, callback, clientside_callback, ClientsideFunction, State, html, ctx, no_update, Patch
 import dash_bootstrap_components as dbc
 import pandas as pd
 
-from .data import calfire_df, county_boundaries
-from .roof_chart import make_roof_chart
-from .damage_chart import make_damage_chart
-from .structure_chart import make_structure_chart
+from .data import calfire_df, hex_density, county_geojson
+from .chart_specs import CHART_NAMES, ChartDataCache, build_chart_spec
 from .summary_chart import make_summary_chart
-from .timeseries_chart import make_time_series_chart
-from .create_map import make_fire_damage_map
+from .distribution_panel import make_distribution_panel
 from .components import main_font_size, main_font_color, theme_color, min_year, max_year
+from .memory_profiler import profile_memory
+from .metrics import observe_callback
+from .flight_recorder import record_slow_calls, stage
+from .chart_render import normalize_filters
+from .spec_cache import get_spec_cache
+from .query_log import get_query_log
+from .crossfilter import SELECTION_CHARTS, SELECTION_FIELDS
 
-import pickle
+# Outputs of the fast filter step, every chart has its own callback
+FILTER_OUTPUTS = ["summary_card", "county", "year", "incident_name"]
 
-# Server side callbacks/reactivity
-@callback(
+# Filtered data shared by the callbacks answering the same chart request
+chart_data_cache = ChartDataCache()
+# Outputs shared by the workers and kept across restarts, None when disabled
+spec_cache = get_spec_cache()
+# Filter states of the chart requests, read by the warm-up of new workers (see query_log.py)
+query_log = get_query_log()
+
+
+def _resolve_filters(trigger, county, year, incident_name, selectedData, granularity="Year", selection=None):
+    """Returns the normalized filter state after a reset or a selection on the map, a reset clears the chart selections."""
+    if trigger == "reset":
+        county, year, incident_name, selection = None, [min_year, max_year], None, None
+    elif selectedData:
+        county = list(set(_selected_counties(selectedData) + (county or [])))
+    return normalize_filters(county, year, incident_name, granularity, **(selection or {}))
+
+
+def _request_filter_state(chart_request):
+    """Returns the normalized filters of a chart request sent by assets/chart_cache.js."""
+    return _resolve_filters(chart_request.get("trigger"), chart_request.get("county"), chart_request.get("year"),
+                            chart_request.get("incident_name"), chart_request.get("selectedData"),
+                            chart_request.get("granularity") or "Year",
+                            {dimension: chart_request.get(dimension) for dimension in SELECTION_FIELDS})
+
+
+def _chart_data(filters):
+    # Waits for the callback already filtering the same state, if any
+    with stage("aggregation"):
+        return chart_data_cache.get(filters)
+
+
+def _cached_output(filters, output, compute):
+    """Returns an output from the persistent cache, computing and storing it on a miss."""
+    if spec_cache is None:
+        return compute()
+    with stage("spec_cache"):
+        value = spec_cache.get(filters, output)
+    if value is None:
+        value = compute()
+        spec_cache.put(filters, output, value)
+    return value
+
+
+def _chart_spec(name, filters):
+    return _cached_output(filters, name, lambda: build_chart_spec(name, _chart_data(filters)))
+
+
+def _log_filters(filters):
+    if query_log is not None:
+        query_log.record(filters)
+
+
+def _total_cost(filters):
+    def total_cost():
+        chart_data = _chart_data(filters)
+        with stage("summary"):
+            return make_summary_chart(chart_data.calfire_df)
+
+    return _cached_output(filters, "summary_card", total_cost)
+
+
+def _summary_card(filters):
+    total_cost = _total_cost(filters)
+
+    return [
+        dbc.CardHeader("Total Economic Loss",
+                       style={"textAlign": "center",
+                              "fontWeight": "bold",
+                              "background-color": theme_color,
+                                "fontSize": main_font_size,
+                              'color':main_font_color}),
+        dbc.CardBody(
+            f'{total_cost} USD' if total_cost else "No Data Available",
+            style={"textAlign": "center", "fontSize": "21px"}
+        )
+    ]
+
+
+# Filter changes go through the client-side cache first (see assets/chart_cache.js), only cache
+# misses are sent to the server as a chart request, answered by the filter step and by one
+# callback per chart so that every output is drawn as soon as it is ready. The selections of the
+# roof, damage and structure charts are filters too, reported by the charts as their signalData
+clientside_callback(
+    ClientsideFunction(namespace="chart_cache", function_name="serve"),
     [Output('roof_chart', 'spec'),
      Output('damage_chart', 'spec'),
      Output('structure_chart', 'spec'),
@@ -84,82 +180,198 @@ import pickle
      Output('county', 'value'),
      Output('year', 'value'),
      Output('incident_name', 'value'),
+     Output('chart_request', 'data'),
+     Output('chart_cache', 'data'),
     ],
     [Input('submit', 'n_clicks'),
      Input('reset', 'n_clicks'),
+     Input('granularity', 'value'),
+     Input('filter_response', 'data'),
+     *[Input(f'{name}_response', 'data') for name in CHART_NAMES],
+     *[Input(chart, 'signalData') for chart in SELECTION_CHARTS.values()],
      State('county', 'value'),
      State('year', 'value'),
      State('incident_name', 'value'),
      State('fire_damage_map', 'selectedData'),
+     State('chart_cache', 'data'),
+     State('chart_cache_config', 'data'),
+    ],
+)
+
+
+# Server side callbacks/reactivity
+@callback(
+    Output('filter_response', 'data'),
+    Input('chart_request', 'data'),
+    prevent_initial_call=True
+)
+@observe_callback("update_filters")
+@record_slow_calls(FILTER_OUTPUTS, _request_filter_state)
+@profile_memory("callback:update_filters")
+def update_filters(chart_request):
+    """
+    Answers the cheap outputs of a chart request: the summary card and the filter values.
+
+    Parameters
+    ----------
+    chart_request : dict
+        The cache "key", the "trigger" ("submit" or "reset") and the filter values ("county",
+        "year", "incident_name", "selectedData" and "granularity", and the values selected on
+        the charts, "roof", "damage" and "structure").
+
+    Returns
+    -------
+    dict
+        The cache "key" and the "outputs" keyed by name, see `FILTER_OUTPUTS`.
+    """
+    filters = _request_filter_state(chart_request)
+    # Logged once per chart request, the chart callbacks answer the same one
+    _log_filters(filters)
+    return {"key": chart_request.get("key"),
+            "outputs": {"summary_card": _summary_card(filters),
+                        "county": filters["county"],
+                        "year": filters["year"],
+                        "incident_name": filters["incident_name"]}}
+
+
+def _chart_callback(name):
+    """Registers the callback building the spec of one chart for a chart request."""
+    def update_chart(chart_request):
+        filters = _request_filter_state(chart_request)
+        return {"key": chart_request.get("key"), "outputs": {name: _chart_spec(name, filters)}}
+
+    update_chart.__name__ = update_chart.__qualname__ = f"update_{name}"
+    update_chart.__doc__ = f"Answers the `{name}` output of a chart request, see `update_filters`."
+    update_chart = profile_memory(f"callback:update_{name}")(update_chart)
+    update_chart = record_slow_calls([name], _request_filter_state)(update_chart)
+    update_chart = observe_callback(f"update_{name}")(update_chart)
+    return callback(Output(f'{name}_response', 'data'), Input('chart_request', 'data'),
+                    prevent_initial_call=True)(update_chart)
+
+
+update_roof_chart, update_damage_chart, update_structure_chart, update_timeseries_chart = \
+    [_chart_callback(name) for name in CHART_NAMES]
+
+
+def precompute(filters):
+    """
+    Computes the outputs of a filter state into the chart data and spec caches, as a chart request would.
+
+    Parameters
+    ----------
+    filters : dict
+        A normalized filter state, see `chart_render.normalize_filters`.
+    """
+    chart_outputs(normalize_filters(filters.get("county"), filters.get("year"), filters.get("incident_name"),
+                                    filters.get("granularity") or "Year",
+                                    **{dimension: filters.get(dimension) for dimension in SELECTION_FIELDS}))
+
+
+def chart_outputs(filters):
+    """
+    Returns the outputs of a filter state through the caches of the chart callbacks.
+
+    Parameters
+    ----------
+    filters : dict
+        A normalized filter state, see `chart_render.normalize_filters`.
+
+    Returns
+    -------
+    tuple of (dict, str or None)
+        The Vega specs keyed by chart name, and the formatted total economic loss (`None`
+        without data).
+    """
+    return {name: _chart_spec(name, filters) for name in CHART_NAMES}, _total_cost(filters)
+
+
+def _selected_counties(selectedData):
+    """Returns the counties selected on the map, ignoring the cells of the density layer."""
+    return [point["hovertext"] for point in selectedData["points"] if point.get("curveNumber", 0) == 0]
+
+
+@callback(
+    Output('fire_damage_map', 'figure'),
+    [Input('density_layer', 'value'),
+     Input('fire_damage_map', 'relayoutData'),
+     Input('submit', 'n_clicks'),
+     Input('reset', 'n_clicks'),
+     State('county', 'value'),
+     State('year', 'value'),
+     State('fire_damage_map', 'selectedData'),
     ],
-    # prevent_initial_call=True
+    prevent_initial_call=True
 )
+@observe_callback("update_density_layer")
+def update_density_layer(density_layer, relayoutData, n_clicks_s, n_clicks_r, county, year, selectedData):
+    """
+    Redraws the structure density layer of the map.
 
-def update_charts(n_clicks_s, n_clicks_r, county, year, incident_name, selectedData):
+    The resolution of the hexagonal cells follows the zoom level and the extent of the
+    selected counties, and only the cells in view are sent. Only the density trace of the
+    figure is patched, the county boundaries are not sent again.
+    """
+    from .create_map import make_density_trace
+    from .hex_grid import choose_resolution, hexes_in_view, geojson_bounds, zoomed_bounds
 
-    with open('data/processed/processed_cal_fire.pkl', 'rb') as f:
-        calfire_df = pickle.load(f)
+    if hex_density is None or not density_layer:
+        patched_figure = Patch()
+        patched_figure["data"][1] = make_density_trace(None, 0)
+        return patched_figure
 
-    # Reset filters 
     if 'reset' == ctx.triggered_id:
-        county, year, incident_name, selectedData = None, [min_year, max_year], None, None
+        county, year, selectedData = None, [min_year, max_year], None
+    if selectedData:
+        county = list(set(_selected_counties(selectedData) + (county or [])))
 
-    else:
-        calfire_df = calfire_df[(calfire_df["Year"].between(year[0], year[1]))]
+    relayoutData = relayoutData or {}
+    state_bounds = geojson_bounds(county_geojson["features"])
+    view = zoomed_bounds(state_bounds, relayoutData.get("geo.projection.scale"),
+                         relayoutData.get("geo.center.lon"), relayoutData.get("geo.center.lat"))
+    county_bounds = geojson_bounds([feature for feature in county_geojson["features"] if feature["id"] in county]) if county else None
+    if county_bounds is not None:
+        # Counties missing from the boundaries (e.g. of another region) leave the view as it is
+        view = (max(view[0], county_bounds[0]), max(view[1], county_bounds[1]),
+                min(view[2], county_bounds[2]), min(view[3], county_bounds[3]))
 
-        if selectedData:
-            selected_counties = [point["hovertext"] for point in selectedData["points"]]
-            county = list(set(selected_counties + county)) if county else selected_counties
-            
-        if county:
-            calfire_df = calfire_df[calfire_df['County'].isin(list(county))]
-        
-        if incident_name:
-            calfire_df = calfire_df[calfire_df['Incident Name'].isin(list(incident_name))]
+    resolution = choose_resolution(view) if view[0] < view[2] and view[1] < view[3] else 0
+    cells = hexes_in_view(hex_density[resolution], resolution, view, county, year)
 
-    roof_chart = make_roof_chart(calfire_df)
-    damage_chart = make_damage_chart(calfire_df)
-    structure_chart = make_structure_chart(calfire_df)
-    total_cost = make_summary_chart(calfire_df)  
+    patched_figure = Patch()
+    patched_figure["data"][1] = make_density_trace(cells, resolution)
+    return patched_figure
 
-    # selectedData = None # To avoid filter being constantly overridden by map selection. Downside is map selection does not persist after filtering.
 
-    summary_card_update = [  
-        dbc.CardHeader("Total Economic Loss",
-                       style={"textAlign": "center",
-                              "fontWeight": "bold",
-                              "background-color": theme_color,
-                                "fontSize": main_font_size,
-                              'color':main_font_color}),
-        dbc.CardBody(
-            f'{total_cost} USD' if total_cost else "No Data Available",
-            style={"textAlign": "center", "fontSize": "21px"}
-        )
-    ]
-    
-
-    timeseries_chart = make_time_series_chart(calfire_df)
-    # fire_damage_map = make_fire_damage_map(county_boundaries, selectedData)
-
-    return (
-        roof_chart.to_dict(format="vega"),
-        damage_chart.to_dict(format="vega"),
-        structure_chart.to_dict(format="vega"),
-        summary_card_update, 
-        timeseries_chart.to_dict(format="vega"),
-        county,
-        year,
-        incident_name,
-    )
+@callback(
+    Output('value_distribution', 'children'),
+    [Input('submit', 'n_clicks'),
+     Input('reset', 'n_clicks'),
+     State('county', 'value'),
+     State('year', 'value'),
+     State('incident_name', 'value'),
+     State('fire_damage_map', 'selectedData'),
+    ],
+    prevent_initial_call=True
+)
+@observe_callback("update_value_distribution")
+def update_value_distribution(n_clicks_s, n_clicks_r, county, year, incident_name, selectedData):
+    """
+    Updates the percentiles of the assessed values for the filters.
+
+    They are merged from the quantile sketches of the matching County x Year (or incident)
+    rows, so the time taken does not depend on the number of structures.
+    """
+    filters = _resolve_filters(ctx.triggered_id, county, year, incident_name, selectedData)
+    return make_distribution_panel(filters["county"], filters["year"], filters["incident_name"])
+
 
 @callback(
     Output("info", "is_open"),
     [Input("info-button", "n_clicks")],
     [State("info", "is_open")],  
 )
+@observe_callback("toggle_button")
 def toggle_button(n, is_open):
-    print(n)  
-    print(is_open)  
     if n:
         return not is_open
     return is_open
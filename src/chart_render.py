@@ -0,0 +1,310 @@
+"""
+Server-side Chart Rendering to SVG and PNG
+
+Low-powered clients and e-mailed briefings need images rather than live Vega. The
+`/render/<chart>.<format>` endpoint builds the spec of any dashboard chart for a filter state
+(see `chart_specs.py`) and renders it with vl-convert.
+
+- Rendered bytes are kept in an LRU cache keyed by chart, normalized filter state, format and
+  size, bounded by `CALFIRE_RENDER_CACHE_MB` (default 64 MB).
+- Renders run on a pool of `CALFIRE_RENDER_WORKERS` threads (default 2). At most
+  `CALFIRE_RENDER_QUEUE` more renders (default 8) may wait for a thread, further image requests
+  are answered with a 503 right away, so they cannot tie up the server threads that answer the
+  dashboard callbacks.
+- A render that takes longer than `CALFIRE_RENDER_TIMEOUT` seconds (default 60) is answered with
+  a 503 too. It keeps its slot until it finishes, so slow renders cannot pile up on the pool.
+
+Examples
+--------
+>>> renderer = ChartRenderer()
+>>> svg = renderer.render("roof_chart", {"county": ["Butte"], "year": [2017, 2020]}, "svg")
+
+    ```
+    GET /render/roof_chart.png?county=Butte&year_start=2017&year_end=2020&width=800&height=300&scale=2
+    ```
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from .chart_specs import CHART_NAMES, make_chart_specs
+
+RENDER_FORMATS = {"svg": "image/svg+xml", "png": "image/png"}
+RENDER_WORKERS = int(os.environ.get("CALFIRE_RENDER_WORKERS", 2))
+RENDER_QUEUE = int(os.environ.get("CALFIRE_RENDER_QUEUE", 8))
+RENDER_CACHE_MB = float(os.environ.get("CALFIRE_RENDER_CACHE_MB", 64))
+RENDER_TIMEOUT = float(os.environ.get("CALFIRE_RENDER_TIMEOUT", 60))
+DEFAULT_WIDTH, DEFAULT_HEIGHT = 600, 200
+MAX_SIZE = 2000
+MAX_SCALE = 4
+
+
+class RenderBusy(Exception):
+    """Raised when the render pool and its queue are full."""
+
+
+class RenderTimeout(Exception):
+    """Raised when a render does not finish within the timeout."""
+
+
+def normalize_filters(county=None, year=None, incident_name=None, granularity="Year", roof=None, damage=None,
+                      structure=None):
+    """
+    Returns a canonical form of a filter state, so equal states share cache entries.
+
+    Returns
+    -------
+    dict
+        Sorted "county" and "incident_name" lists (or `None`), "year" as [first, last] (or
+        `None`) and "granularity", and the sorted values selected on the charts ("roof",
+        "damage" and "structure", see `crossfilter.py`) when there are some.
+    """
+    filters = {"county": sorted(set(county)) if county else None,
+               "year": [int(year[0]), int(year[1])] if year else None,
+               "incident_name": sorted(set(incident_name)) if incident_name else None,
+               "granularity": granularity or "Year"}
+    # Empty selections are left out, so the states of the sidebar filters alone keep their cache and log keys
+    for dimension, values in (("roof", roof), ("damage", damage), ("structure", structure)):
+        if values:
+            filters[dimension] = sorted(set(values))
+    return filters
+
+
+def resize_spec(spec, width, height):
+    """
+    Fixes the size of a Vega spec built with a container width.
+
+    Parameters
+    ----------
+    spec : dict
+        A Vega spec.
+    width, height : int
+        Size of the plotting area in pixels.
+
+    Returns
+    -------
+    dict
+        A copy of the spec with fixed "width" and "height" signals.
+    """
+    spec = dict(spec)
+    signals = [signal for signal in spec.get("signals", []) if signal["name"] not in ("width", "height")]
+    spec["signals"] = [{"name": "width", "value": width}, {"name": "height", "value": height}] + signals
+    spec.pop("width", None)
+    spec.pop("height", None)
+    return spec
+
+
+def render_chart(calfire_df, chart, filters, image_format, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, scale=1):
+    """
+    Renders one dashboard chart for a filter state.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame
+        The unfiltered summary dataset.
+    chart : str
+        One of `CHART_NAMES`.
+    filters : dict
+        The output of `normalize_filters`.
+    image_format : str
+        "svg" or "png".
+    width, height : int, optional
+        Size of the plotting area in pixels (default is 600 x 200).
+    scale : float, optional
+        Pixel density of PNG images (default is 1).
+
+    Returns
+    -------
+    bytes or None
+        The image, or `None` if no incident matches the filters.
+    """
+    import vl_convert as vlc
+
+    specs, _ = make_chart_specs(calfire_df, filters["county"], filters["year"], filters["incident_name"],
+                                filters["granularity"], charts=[chart])
+    if not specs[chart]:
+        return None
+    spec = resize_spec(specs[chart], width, height)
+    if image_format == "svg":
+        return vlc.vega_to_svg(spec).encode()
+    return vlc.vega_to_png(spec, scale=scale)
+
+
+class RenderCache:
+    """
+    Thread-safe LRU cache of rendered images bounded by their total size.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Size above which the least recently used images are evicted.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached image of `key`, or `None`."""
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        """Caches an image, evicting the least recently used ones to stay under the size bound."""
+        with self._lock:
+            if key in self._images:
+                self.nbytes -= len(self._images.pop(key))
+            if len(image) > self.max_bytes:
+                return
+            self._images[key] = image
+            self.nbytes += len(image)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def __len__(self):
+        return len(self._images)
+
+
+class ChartRenderer:
+    """
+    Renders charts on a bounded thread pool, through an LRU cache.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame, optional
+        The unfiltered summary dataset (default is the one loaded by `data.py`).
+    workers : int, optional
+        Number of render threads (default is `CALFIRE_RENDER_WORKERS`, or 2).
+    queue : int, optional
+        Number of renders that may wait for a thread (default is `CALFIRE_RENDER_QUEUE`, or 8).
+    cache_mb : float, optional
+        Size of the render cache in MB (default is `CALFIRE_RENDER_CACHE_MB`, or 64).
+    timeout : float, optional
+        Seconds to wait for a render (default is `CALFIRE_RENDER_TIMEOUT`, or 60).
+    """
+
+    def __init__(self, calfire_df=None, workers=RENDER_WORKERS, queue=RENDER_QUEUE, cache_mb=RENDER_CACHE_MB,
+                 timeout=RENDER_TIMEOUT):
+        if calfire_df is None:
+            from .data import calfire_df
+        self.calfire_df = calfire_df
+        self.cache = RenderCache(int(cache_mb * 1024 * 1024))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chart-render")
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self.timeout = timeout
+
+    def render(self, chart, filters, image_format, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, scale=1):
+        """
+        Returns the image of a chart, from the cache or rendered on the pool.
+
+        Parameters
+        ----------
+        chart, image_format, width, height, scale
+            See `render_chart`.
+        filters : dict
+            The filter state, see `normalize_filters`.
+
+        Returns
+        -------
+        bytes or None
+            The image, or `None` if no incident matches the filters.
+
+        Raises
+        ------
+        RenderBusy
+            If all the render threads are busy and the queue is full.
+        RenderTimeout
+            If the render does not finish within `timeout` seconds. It still holds its slot
+            until it finishes, and its image is cached then.
+        """
+        filters = normalize_filters(**filters)
+        key = json.dumps([chart, filters, image_format, width, height, scale], sort_keys=True)
+        image = self.cache.get(key)
+        if image is not None:
+            return image
+
+        if not self._slots.acquire(blocking=False):
+            raise RenderBusy()
+        try:
+            future = self._executor.submit(render_chart, self.calfire_df, chart, filters, image_format, width, height, scale)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is released when the render finishes, not when this request gives up waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        future.add_done_callback(lambda done: self._cache_result(key, done))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise RenderTimeout() from None
+
+    def _cache_result(self, key, future):
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            self.cache.put(key, future.result())
+
+
+_chart_renderer = None
+_chart_renderer_lock = threading.Lock()
+
+
+def get_chart_renderer():
+    """Returns the renderer of the dashboard's data, created on first use."""
+    global _chart_renderer
+    with _chart_renderer_lock:
+        if _chart_renderer is None:
+            _chart_renderer = ChartRenderer()
+    return _chart_renderer
+
+
+def register_render_routes(server):
+    """
+    Adds the `/render/<chart>.<format>` endpoint to the Flask server.
+
+    The filters are query parameters: `county` and `incident_name` (repeated), `year_start`
+    and `year_end`, and `granularity`. The size is set with `width` and `height` (plotting
+    area in pixels) and, for PNG, `scale`.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    """
+    from flask import Response, request
+
+    @server.route("/render/<chart>.<image_format>")
+    def render(chart, image_format):
+        if chart not in CHART_NAMES or image_format not in RENDER_FORMATS:
+            return {"error": f"Unknown chart or format, expected one of {CHART_NAMES} and {list(RENDER_FORMATS)}"}, 404
+
+        year_start, year_end = request.args.get("year_start", type=int), request.args.get("year_end", type=int)
+        filters = {"county": request.args.getlist("county"),
+                   "year": [year_start, year_end] if year_start is not None and year_end is not None else None,
+                   "incident_name": request.args.getlist("incident_name"),
+                   "granularity": request.args.get("granularity", "Year")}
+        width = min(max(request.args.get("width", DEFAULT_WIDTH, type=int), 50), MAX_SIZE)
+        height = min(max(request.args.get("height", DEFAULT_HEIGHT, type=int), 50), MAX_SIZE)
+        scale = min(max(request.args.get("scale", 1, type=float), 0.5), MAX_SCALE) if image_format == "png" else 1
+
+        try:
+            image = get_chart_renderer().render(chart, filters, image_format, width, height, scale)
+        except RenderBusy:
+            return {"error": "Too many render requests, try again shortly"}, 503, {"Retry-After": "5"}
+        except RenderTimeout:
+            return {"error": "The render timed out, try again shortly"}, 503, {"Retry-After": "30"}
+        if image is None:
+            return {"error": "No data for these filters"}, 404
+        return Response(image, mimetype=RENDER_FORMATS[image_format],
+                        headers={"Cache-Control": "public, max-age=3600"})
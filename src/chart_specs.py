@@ -0,0 +1,380 @@
+"""
+Chart Specs for a Filter State
+
+Filters the summary data the way the dashboard filters do and builds the Vega specs of the
+charts. The dashboard callbacks use it, and so does everything else that needs the same charts
+outside of a Dash callback (rendered images, reports, static exports).
+
+`prepare_chart_data` filters the data of a filter state once and `build_chart_spec` builds one
+chart from it, so that the charts of the dashboard can be built by separate callbacks sharing
+the entry of a `ChartDataCache`. The dashboard cache gets its filtered data from the query
+backend selected by `CALFIRE_QUERY_BACKEND` (see `query_backend.py`), and the data of the
+states with a selection on the charts from the cross-filter cube (see `crossfilter.py`).
+The specs of these states leave their few transforms to Vega in the browser instead of
+pre-computing them with VegaFusion, which makes a click on a chart several times cheaper.
+
+Altair and VegaFusion are imported on the first call, so importing this module is cheap.
+
+Examples
+--------
+>>> specs, filtered_df = make_chart_specs(calfire_df, county=["Butte"], year=[2017, 2020])
+>>> specs["roof_chart"]["$schema"]
+'https://vega.github.io/schema/vega/v5.json'
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from .data import timeseries_rollups, county_leaderboard
+from .leaderboard import TOP_COUNTIES
+from .memory_profiler import track_memory
+from .metrics import chart_build_duration
+from .flight_recorder import stage
+from .crossfilter import SELECTION_CHARTS, selection_of
+
+CHART_NAMES = ["roof_chart", "damage_chart", "structure_chart", "timeseries_chart"]
+CHART_DATA_CACHE_SIZE = int(os.environ.get("CALFIRE_CHART_DATA_CACHE_SIZE", 32))
+
+
+def filter_data(calfire_df, timeseries_df, county=None, year=None, incident_name=None):
+    """
+    Applies the dashboard filters to the summary data and a time series rollup.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame
+        The summary dataset.
+    timeseries_df : pd.DataFrame
+        The summary dataset or a rollup of `data_import.py`, with "Year", "County" and "Incident Name".
+    county : list of str, optional
+        Counties to keep, all if `None` or empty.
+    year : list of int, optional
+        Inclusive [first, last] year range, all years if `None`.
+    incident_name : list of str, optional
+        Incidents to keep, all if `None` or empty.
+
+    Returns
+    -------
+    tuple of pd.DataFrame
+        The filtered `calfire_df` and `timeseries_df`.
+    """
+    if year:
+        calfire_df = calfire_df[(calfire_df["Year"].between(year[0], year[1]))]
+        timeseries_df = timeseries_df[(timeseries_df["Year"].between(year[0], year[1]))]
+
+    if county:
+        calfire_df = calfire_df[calfire_df['County'].isin(list(county))]
+        timeseries_df = timeseries_df[timeseries_df['County'].isin(list(county))]
+
+    if incident_name:
+        calfire_df = calfire_df[calfire_df['Incident Name'].isin(list(incident_name))]
+        timeseries_df = timeseries_df[timeseries_df['Incident Name'].isin(list(incident_name))]
+
+    return calfire_df, timeseries_df
+
+
+class ChartData:
+    """
+    The filtered data every chart of a filter state is built from.
+
+    Attributes
+    ----------
+    calfire_df : pd.DataFrame
+        The filtered summary dataset, or its sums per County x Year when it comes from a SQL
+        backend (see `query_backend.py`).
+    timeseries_df : pd.DataFrame
+        The filtered rollup of the time series chart, or its sums per County x period.
+    granularity : str
+        The granularity of `timeseries_df`.
+    top_structure_counties, top_loss_counties : list of str or None
+        The top counties of the structure and time series charts, from the leaderboards when
+        there is no county or incident filter, `None` to rank the filtered data.
+    selection : dict or None
+        The values selected on the charts, keyed by "roof", "damage" and "structure", `None`
+        when cross-filtering is off and the charts have no click selection.
+    chart_frames : dict
+        The data of the roof, damage and structure charts keyed by name when it is not
+        `calfire_df`: under a selection, every chart is filtered by the other selections only.
+    """
+
+    def __init__(self, calfire_df, timeseries_df, granularity, top_structure_counties=None, top_loss_counties=None,
+                 selection=None, chart_frames=None):
+        self.calfire_df = calfire_df
+        self.timeseries_df = timeseries_df
+        self.granularity = granularity
+        self.top_structure_counties = top_structure_counties
+        self.top_loss_counties = top_loss_counties
+        self.selection = selection
+        self.chart_frames = chart_frames or {}
+
+    def chart_df(self, name):
+        """Returns the data of the roof, damage or structure chart."""
+        return self.chart_frames.get(name, self.calfire_df)
+
+    def selected(self, dimension):
+        """Returns the values selected on the chart of a dimension, `None` when cross-filtering is off."""
+        return None if self.selection is None else self.selection[dimension]
+
+    @property
+    def crossfiltered(self):
+        """Whether some values are selected on the charts."""
+        return bool(self.selection) and any(self.selection.values())
+
+
+def leaderboard_top_counties(leaderboard, county=None, year=None, incident_name=None):
+    """
+    Returns the top counties of the structure and time series charts from a leaderboard.
+
+    Returns
+    -------
+    tuple of (list of str or None, list of str or None)
+        The top counties by structures and by economic loss, `None` when there is a county or
+        incident filter and the filtered data has to be ranked instead.
+    """
+    if county or incident_name:
+        return None, None
+    first, last = year if year else (0, 9999)
+    return (leaderboard.top("Structures", first, last, TOP_COUNTIES),
+            leaderboard.top("Total Economic Loss", first, last, TOP_COUNTIES))
+
+
+def prepare_chart_data(calfire_df, county=None, year=None, incident_name=None, granularity="Year", region_data=None):
+    """
+    Filters the data of a filter state once for all of its charts.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame
+        The unfiltered summary dataset.
+    county, year, incident_name, granularity, region_data
+        See `make_chart_specs`.
+
+    Returns
+    -------
+    ChartData
+    """
+    rollups = region_data.timeseries_rollups if region_data else timeseries_rollups
+    leaderboard = region_data.county_leaderboard if region_data else county_leaderboard
+
+    # The time series is served from its own precomputed rollup for the selected granularity
+    granularity = granularity if granularity in rollups else "Year"
+    timeseries_df = rollups[granularity] if granularity != "Year" else calfire_df
+    calfire_df, timeseries_df = filter_data(calfire_df, timeseries_df, county, year, incident_name)
+
+    # Without county or incident filters the top counties come from the precomputed leaderboards
+    top_structure_counties, top_loss_counties = leaderboard_top_counties(leaderboard, county, year, incident_name)
+
+    return ChartData(calfire_df, timeseries_df, granularity, top_structure_counties, top_loss_counties)
+
+
+def crossfilter_chart_data(crossfilter, county=None, year=None, incident_name=None, granularity="Year",
+                           selection=None):
+    """
+    Returns the data of a cross-filter state from the partial aggregates of the cube.
+
+    Parameters
+    ----------
+    crossfilter : CrossfilterCube
+        The cube of the region, see `crossfilter.py`.
+    county, year, incident_name, granularity
+        See `make_chart_specs`.
+    selection : dict
+        The values selected on the charts, see `crossfilter.selection_of`.
+
+    Returns
+    -------
+    ChartData
+    """
+    frames = crossfilter.chart_frames(county, year, incident_name, granularity, selection)
+    # The selections change the ranking of the counties, the leaderboards do not apply
+    return ChartData(frames["summary"], frames["timeseries"], frames["granularity"], selection=selection,
+                     chart_frames={name: frames[name] for name in SELECTION_CHARTS.values()})
+
+
+def inline_spec(chart):
+    """
+    Compiles a chart to Vega without VegaFusion, its transforms run in the browser.
+
+    Parameters
+    ----------
+    chart : alt.Chart
+        A chart of one inline dataset.
+
+    Returns
+    -------
+    dict
+        The Vega spec, with the data of the chart inlined as values.
+    """
+    import altair as alt
+
+    # The same charts are validated on the VegaFusion path, only their data differs here
+    spec = chart.to_dict(format="vega", validate=False, context={"pre_transform": False})
+    values = alt.utils.data.to_values(chart.data)["values"]
+    for dataset in spec.get("data", []):
+        # VegaFusion refers to the data of the chart, it is not sent to the browser otherwise
+        if dataset.get("url", "").startswith("vegafusion+dataset://"):
+            del dataset["url"]
+            dataset["values"] = values
+    return spec
+
+
+def build_chart_spec(name, chart_data):
+    """
+    Builds the Vega spec of one chart.
+
+    Parameters
+    ----------
+    name : str
+        One of `CHART_NAMES`.
+    chart_data : ChartData
+        The filtered data, see `prepare_chart_data`.
+
+    Returns
+    -------
+    dict
+        The Vega spec, `{}` when no incident matches the filters.
+    """
+    # Chart modules pull in Altair and VegaFusion, they are imported on the first call instead of at worker start
+    from .roof_chart import make_roof_chart
+    from .damage_chart import make_damage_chart
+    from .structure_chart import make_structure_chart
+    from .timeseries_chart import make_time_series_chart
+
+    builders = {
+        "roof_chart": lambda: make_roof_chart(chart_data.chart_df(name), chart_data.selected("roof")),
+        "damage_chart": lambda: make_damage_chart(chart_data.chart_df(name), chart_data.selected("damage")),
+        "structure_chart": lambda: make_structure_chart(chart_data.chart_df(name), chart_data.top_structure_counties,
+                                                        chart_data.selected("structure")),
+        "timeseries_chart": lambda: make_time_series_chart(chart_data.timeseries_df, granularity=chart_data.granularity,
+                                                           top_counties=chart_data.top_loss_counties),
+    }
+    with track_memory(f"chart:{name}"), chart_build_duration.labels(name).time(), stage(f"chart:{name}"):
+        chart = builders[name]()
+        # make_time_series_chart returns {} when no incident matches the filters
+        if not chart:
+            return {}
+        return inline_spec(chart) if chart_data.crossfiltered else chart.to_dict(format="vega")
+
+
+def make_chart_specs(calfire_df, county=None, year=None, incident_name=None, granularity="Year", charts=CHART_NAMES,
+                     region_data=None):
+    """
+    Builds the Vega specs of the dashboard charts for a filter state.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame
+        The unfiltered summary dataset.
+    county, year, incident_name
+        The filters, see `filter_data`.
+    granularity : str, optional
+        Time period of the time series chart, one of "Year", "Month" or "Week" (default is
+        "Year"). Falls back to "Year" if its rollup has not been generated.
+    charts : list of str, optional
+        The charts to build, some of `CHART_NAMES` (default is all of them).
+    region_data : RegionData, optional
+        The region of `calfire_df`, whose rollups and leaderboard are used (default is the
+        data loaded by `data.py`, see `regions.py`).
+
+    Returns
+    -------
+    tuple of (dict, pd.DataFrame)
+        The Vega spec of every requested chart keyed by name (`{}` when no incident matches
+        the filters), and the filtered summary dataset.
+    """
+    chart_data = prepare_chart_data(calfire_df, county, year, incident_name, granularity, region_data)
+    specs = {name: build_chart_spec(name, chart_data) for name in charts}
+    return specs, chart_data.calfire_df
+
+
+class ChartDataCache:
+    """
+    Thread-safe LRU cache of the `ChartData` of the default region, keyed by filter state.
+
+    The dashboard builds every chart of a filter state in its own callback, the requests arrive
+    together and share one entry: the first one filters the data, the others wait for it
+    instead of filtering again.
+
+    Parameters
+    ----------
+    size : int, optional
+        Number of filter states kept (default is `CALFIRE_CHART_DATA_CACHE_SIZE`, or 32).
+    calfire_df : pd.DataFrame, optional
+        An unfiltered summary dataset to filter with pandas instead of the query backend.
+    backend : PandasBackend or DuckDBBackend, optional
+        The query backend filtering the data (default is `query_backend.get_query_backend()`).
+    crossfilter : CrossfilterCube, optional
+        The cube answering the states with a selection on the charts (default is
+        `crossfilter.get_crossfilter()` unless `calfire_df` is given). The selections are
+        ignored without it.
+    """
+
+    def __init__(self, size=CHART_DATA_CACHE_SIZE, calfire_df=None, backend=None, crossfilter=None):
+        self.size = size
+        self.calfire_df = calfire_df
+        self.backend = backend
+        if crossfilter is None and calfire_df is None:
+            from .crossfilter import get_crossfilter
+            crossfilter = get_crossfilter()
+        self.crossfilter = crossfilter
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._computing = {}
+
+    def get(self, filters):
+        """
+        Returns the chart data of a filter state, filtering the data on a miss.
+
+        Parameters
+        ----------
+        filters : dict
+            A normalized filter state, see `chart_render.normalize_filters`.
+
+        Returns
+        -------
+        ChartData
+        """
+        key = json.dumps(filters, sort_keys=True)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            computing = self._computing.setdefault(key, threading.Lock())
+
+        with computing:
+            try:
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return self._entries[key]
+                args = (filters.get("county"), filters.get("year"), filters.get("incident_name"),
+                        filters.get("granularity", "Year"))
+                selection = selection_of(filters) if self.crossfilter is not None else None
+                if selection and any(selection.values()):
+                    chart_data = crossfilter_chart_data(self.crossfilter, *args, selection)
+                elif self.calfire_df is not None:
+                    chart_data = prepare_chart_data(self.calfire_df, *args)
+                else:
+                    if self.backend is None:
+                        from .query_backend import get_query_backend
+                        self.backend = get_query_backend()
+                    chart_data = self.backend.chart_data(*args)
+                if not chart_data.crossfiltered:
+                    # The charts get their click selections, with nothing selected yet
+                    chart_data.selection = selection
+                with self._lock:
+                    self._entries[key] = chart_data
+                    self.misses += 1
+                    while len(self._entries) > self.size:
+                        self._entries.popitem(last=False)
+            finally:
+                # Also on a failed filter, so a later request for the state starts over instead of waiting on a stale entry
+                with self._lock:
+                    if self._computing.get(key) is computing:
+                        del self._computing[key]
+        return chart_data
@@ -26,9 +26,10 @@ Components
     - Map of wildfire damage by county.
     - Summary of total economic loss.
     - Damage category distribution.
-    - Top 10 counties with maximum loss over time.
+    - Top 10 counties with maximum loss over time, by year, month or week.
     - Structural damage by county.
     - Damage by roof type.
+    - Percentiles of the assessed value per structure.
 - **Info Section**: A collapsible section providing an overview of dashboard functionality.
 - **Footer**: Contains contributor names, GitHub repository link, and last updated date.
 
@@ -53,15 +54,19 @@ import dash_bootstrap_components as dbc
 import dash_vega_components as dvc
 from dash import Dash, dcc, html
 import pickle
+import os
 
-from .roof_chart import make_roof_chart
-from .damage_chart import make_damage_chart
-from .structure_chart import make_structure_chart
 from .summary_chart import make_summary_chart
-from .timeseries_chart import make_time_series_chart
 from .create_map import make_fire_damage_map
+from .distribution_panel import make_distribution_panel
 
-from .data import calfire_df, county_boundaries
+from .data import calfire_df, county_stats, county_geojson, timeseries_rollups, hex_density, dataset_version
+from .chart_specs import CHART_NAMES
+from .spec_cache import outputs_version
+
+# Client-side cache of chart outputs (see assets/chart_cache.js): "session" keeps it across reloads of the tab, "memory" does not
+CLIENT_CACHE_STORAGE = os.environ.get("CALFIRE_CLIENT_CACHE_STORAGE", "session")
+CLIENT_CACHE_KB = float(os.environ.get("CALFIRE_CLIENT_CACHE_KB", 2048))
 
 # Declare global variables
 theme_color = "#d1d6de"
@@ -187,6 +192,8 @@ global_widgets = dbc.Col(
                 md=3)
  
 # Dashboard charts
+# The Vega specs start empty and are filled in by the first chart request of the page,
+# so Altair and VegaFusion are not needed to build the layout when a worker starts
 # Wilfire map
 cali_map = dbc.Row(
                 dbc.Card(
@@ -196,8 +203,14 @@ cali_map = dbc.Row(
                                         "fontSize": main_font_size,
                                         'background-color': theme_color,
                                         'color':main_font_color}),
+                    # The density layer is only available once data_import.py has written hex_density.pkl
+                    dcc.Checklist(id='density_layer',
+                                  options=[{"label": "Structure density", "value": "density", "disabled": hex_density is None}],
+                                  value=[],
+                                  inline=True,
+                                  inputStyle={"margin-left": "10px", "margin-right": "4px"}),
                     dcc.Graph(id="fire_damage_map",
-                              figure=make_fire_damage_map(county_boundaries),
+                              figure=make_fire_damage_map(county_stats, county_geojson),
                               style={'width': '800px',
                                     "display": "flex",
                                     "justify-content": "center",
@@ -261,8 +274,7 @@ damage_level=dbc.Col([
                                                "background-color": theme_color,
                                                "fontSize": main_font_size,
                                                'color':main_font_color}),
-                        dbc.CardBody(dcc.Loading(id="loading-damage-chart", children=[dvc.Vega(id='damage_chart', 
-                      spec=make_damage_chart(calfire_df).to_dict(format="vega"))]),
+                        dbc.CardBody(dcc.Loading(id="loading-damage-chart", children=[dvc.Vega(id='damage_chart', spec={}, signalsToObserve=['damage_select'])]),
                                      style={"height": "280px"})],
                                      style={'border':'none'},
                         id="damage_card"
@@ -278,9 +290,17 @@ timeseries_chart = dbc.Col([
                                        "background-color": theme_color,
                                         "fontSize": main_font_size,
                                         'color':main_font_color}),
-                        dbc.CardBody(dcc.Loading(id="loading-timeseries-chart", children=[
-                            dvc.Vega(id='timeseries_chart', spec=make_time_series_chart(calfire_df).to_dict(format="vega"))
-                        ]),
+                        dbc.CardBody([
+                            dcc.RadioItems(id='granularity',
+                                           # Month and Week are only available once data_import.py has written their rollups
+                                           options=[{"label": granularity, "value": granularity, "disabled": granularity not in timeseries_rollups}
+                                                    for granularity in ["Year", "Month", "Week"]],
+                                           value="Year",
+                                           inline=True,
+                                           inputStyle={"margin-left": "10px", "margin-right": "4px"}),
+                            dcc.Loading(id="loading-timeseries-chart", children=[
+                            dvc.Vega(id='timeseries_chart', spec={})
+                        ])],
                              style={"height": "280px"})],
                              style={'border':'none'}
                 )],
@@ -297,8 +317,7 @@ structure_count=dbc.Col([
                                         "fontSize": main_font_size,
                                         'color':main_font_color}),
                         dbc.CardBody(dcc.Loading(id="loading-structure-chart", children=[
-                            dvc.Vega(id='structure_chart',
-                         spec=make_structure_chart(calfire_df).to_dict(format="vega"))
+                            dvc.Vega(id='structure_chart', spec={}, signalsToObserve=['structure_select'])
                          ]),
                                     style={"height": "280px"})
                         ],
@@ -307,6 +326,22 @@ structure_count=dbc.Col([
 
 
 
+# percentiles of the assessed value per structure, from the quantile sketches of data_import.py
+value_distribution = dbc.Col([
+                    dbc.Card(
+                        [dbc.CardHeader("Assessed Improved Value per Structure",
+                                        style={"textAlign": "center",
+                                               "fontWeight": "bold",
+                                               "background-color": theme_color,
+                                               "fontSize": main_font_size,
+                                               'color':main_font_color}),
+                        dbc.CardBody(make_distribution_panel(),
+                                     id="value_distribution")],
+                                     style={'border':'none'}
+                                     )],
+                    md=12)
+
+
 # house characteristic vs Damage level
 roof_chart = dbc.Col([
                     dbc.Card(
@@ -316,13 +351,27 @@ roof_chart = dbc.Col([
                                                "background-color": theme_color,
                                                "fontSize": main_font_size,
                                                'color':main_font_color}),
-                        dbc.CardBody(dcc.Loading(id="loading-roof-chart", children=[dvc.Vega(id='roof_chart', spec=make_roof_chart(calfire_df).to_dict(format="vega"))]),
+                        dbc.CardBody(dcc.Loading(id="loading-roof-chart", children=[dvc.Vega(id='roof_chart', spec={}, signalsToObserve=['roof_select'])]),
                                      style={"height": "280px"})],
                                      style={'border':'none'},
                                      id="roof_card"
                                      )],
                     md=6)
 
+# Stores of the client-side chart cache: the cache itself, its settings, and the cache misses sent to
+# the server with the answers of the filter step and of every chart
+chart_cache_stores = html.Div([
+    dcc.Store(id="chart_cache", storage_type=CLIENT_CACHE_STORAGE),
+    dcc.Store(id="chart_cache_config", data={"version": outputs_version(dataset_version),
+                                             "max_bytes": int(CLIENT_CACHE_KB * 1024),
+                                             "min_year": min_year,
+                                             "max_year": max_year,
+                                             "timings_url": "/metrics/client-timings"}),
+    dcc.Store(id="chart_request"),
+    dcc.Store(id="filter_response"),
+    *[dcc.Store(id=f"{name}_response") for name in CHART_NAMES],
+])
+
 # Bottom matters
 reference_info = dbc.Row(
     dbc.Col([
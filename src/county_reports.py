@@ -0,0 +1,239 @@
+"""
+Batch County Reports
+
+Renders a static wildfire impact report for every county and a year range, with the same
+charts and summary as the dashboard: the total economic loss, incident and structure counts,
+and the roof, damage, structure and time series charts as SVG.
+
+Reports are written as self-contained HTML files and/or one-page PDF files (the chart SVGs are
+laid out on one SVG page and converted with vl-convert), to `output/county_reports/` unless
+`--output` is given. Counties are processed in parallel on
+a process pool. The summary data is loaded once before the pool starts, and the workers are
+forked from that process, so they share it read-only instead of loading their own copy.
+
+Usage
+-----
+Run from the root of the repository:
+
+    ```bash
+    python -m src.county_reports                                   # every county, all years, HTML
+    python -m src.county_reports --years 2018 2020 --format html pdf --workers 8
+    python -m src.county_reports --county Butte --county Napa --output output/county_reports/northern
+    ```
+"""
+
+import argparse
+import html
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .chart_specs import CHART_NAMES, make_chart_specs
+from .chart_render import resize_spec
+from .data import calfire_df
+from .millions_billions import millions_billions
+from .summary_columns import split_summary_columns
+
+REPORT_FORMATS = ["html", "pdf"]
+REPORTS_DIR = os.path.join("output", "county_reports")
+CHART_TITLES = {
+    "roof_chart": "Damage by Roof Construction",
+    "damage_chart": "Damage Level of Inspected Structures",
+    "structure_chart": "Damaged Structures by Category",
+    "timeseries_chart": "Economic Loss Over Time",
+}
+CHART_WIDTH, CHART_HEIGHT = 640, 200
+
+
+def summarize(filtered_df):
+    """
+    Computes the headline numbers of a report.
+
+    Parameters
+    ----------
+    filtered_df : pd.DataFrame
+        The summary dataset filtered to the county and years of the report.
+
+    Returns
+    -------
+    dict
+        "Total Economic Loss" (formatted), "Incidents", "Inspected Structures" and
+        "Destroyed Structures".
+    """
+    roof_damage_columns, structure_columns = split_summary_columns(filtered_df.columns)
+    destroyed_columns = [column for column in roof_damage_columns if column[1].startswith("E. ")]
+    return {
+        "Total Economic Loss": f'{millions_billions(filtered_df["Total Economic Loss"].sum())} USD' if len(filtered_df) else "No Data Available",
+        "Incidents": int(filtered_df["Incident Name"].nunique()),
+        "Inspected Structures": int(filtered_df[structure_columns].to_numpy().sum()),
+        "Destroyed Structures": int(filtered_df[destroyed_columns].to_numpy().sum()),
+    }
+
+
+def _strip_xml_declaration(svg):
+    return re.sub(r"^<\?xml[^>]*>\s*", "", svg)
+
+
+def render_chart_svgs(county, year):
+    """Renders the charts of one county to SVG strings keyed by chart name (`None` without data)."""
+    import vl_convert as vlc
+
+    specs, filtered_df = make_chart_specs(calfire_df, county=[county], year=year)
+    svgs = {name: _strip_xml_declaration(vlc.vega_to_svg(resize_spec(spec, CHART_WIDTH, CHART_HEIGHT))) if spec else None
+            for name, spec in specs.items()}
+    return svgs, filtered_df
+
+
+def make_report_html(county, year, summary, svgs):
+    """Lays out a report as a self-contained HTML page."""
+    rows = "".join(f"<tr><th>{html.escape(label)}</th><td>{html.escape(str(value))}</td></tr>" for label, value in summary.items())
+    charts = "".join(f"<section><h2>{CHART_TITLES[name]}</h2>{svg}</section>" for name, svg in svgs.items() if svg)
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(county)} County Wildfire Impact Report, {year[0]}-{year[1]}</title>
+<style>
+body {{font-family: Helvetica, Arial, sans-serif; margin: 2em auto; max-width: 720px; color: black;}}
+h1 {{font-size: 24px;}} h2 {{font-size: 18px; background-color: #d1d6de; padding: 4px;}}
+table {{border-collapse: collapse;}} th, td {{text-align: left; padding: 4px 16px 4px 0;}}
+</style>
+</head>
+<body>
+<h1>{html.escape(county)} County Wildfire Impact Report, {year[0]}-{year[1]}</h1>
+<p>Source: CAL FIRE Damage Inspection (DINS) data.</p>
+<table>{rows}</table>
+{charts}
+</body>
+</html>
+"""
+
+
+def make_report_pdf(county, year, summary, svgs):
+    """Lays out a report on one SVG page and converts it to PDF."""
+    import vl_convert as vlc
+
+    page_width, margin, y = CHART_WIDTH + 120, 40, 60
+    parts = [f'<text x="{margin}" y="{y}" font-family="sans-serif" font-size="22" font-weight="bold">'
+             f'{html.escape(county)} County Wildfire Impact Report, {year[0]}-{year[1]}</text>']
+    for label, value in summary.items():
+        y += 22
+        parts.append(f'<text x="{margin}" y="{y}" font-family="sans-serif" font-size="14">'
+                     f'{html.escape(label)}: {html.escape(str(value))}</text>')
+    for name, svg in svgs.items():
+        if not svg:
+            continue
+        y += 40
+        parts.append(f'<text x="{margin}" y="{y}" font-family="sans-serif" font-size="16" font-weight="bold">{CHART_TITLES[name]}</text>')
+        height = int(float(re.search(r'height="([\d.]+)"', svg).group(1)))
+        parts.append(f'<g transform="translate({margin},{y + 10})">{svg}</g>')
+        y += height + 10
+    page = (f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            f'width="{page_width}" height="{y + margin}"><rect width="100%" height="100%" fill="white"/>{"".join(parts)}</svg>')
+    return vlc.svg_to_pdf(page)
+
+
+def report_file_name(county, year, report_format):
+    """Returns a file name safe for every county name."""
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", county).strip("_")
+    return f"{slug}_{year[0]}-{year[1]}.{report_format}"
+
+
+def render_county_report(county, year, formats, output_dir):
+    """
+    Renders and writes the reports of one county, this is the unit of work of the process pool.
+
+    Returns
+    -------
+    dict
+        The county, the seconds spent and the paths and size of the files written.
+    """
+    start = time.perf_counter()
+    svgs, filtered_df = render_chart_svgs(county, year)
+    summary = summarize(filtered_df)
+
+    paths = []
+    for report_format in formats:
+        path = os.path.join(output_dir, report_file_name(county, year, report_format))
+        if report_format == "html":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(make_report_html(county, year, summary, svgs))
+        else:
+            with open(path, "wb") as f:
+                f.write(make_report_pdf(county, year, summary, svgs))
+        paths.append(path)
+    return {"county": county, "seconds": time.perf_counter() - start, "paths": paths,
+            "bytes": sum(os.path.getsize(path) for path in paths)}
+
+
+def generate_reports(counties, year, formats=("html",), output_dir=REPORTS_DIR, workers=None):
+    """
+    Renders the reports of several counties in parallel.
+
+    Parameters
+    ----------
+    counties : list of str
+        The counties.
+    year : list of int
+        Inclusive [first, last] year range of every report.
+    formats : iterable of str, optional
+        Some of "html" and "pdf" (default is html only).
+    output_dir : str, optional
+        Where to write the reports (default is 'output/county_reports').
+    workers : int, optional
+        Number of worker processes (default is one per CPU, capped at the number of counties).
+
+    Returns
+    -------
+    tuple of (list of dict, float)
+        The result of `render_county_report` for every county, in order, and the wall time in seconds.
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(counties)))
+    jobs = [(county, list(year), list(formats), output_dir) for county in counties]
+
+    if workers == 1:
+        results = [render_county_report(*job) for job in jobs]
+    else:
+        # Forked workers inherit the data already loaded by this process
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            results = list(executor.map(render_county_report, *zip(*jobs)))
+    return results, time.perf_counter() - start
+
+
+def format_report(results, wall_time, workers):
+    """Formats the per-county cost and total wall time of a run."""
+    lines = [f"{'county':<24}{'seconds':>10}{'KB':>10}"]
+    for result in sorted(results, key=lambda result: result["seconds"], reverse=True):
+        lines.append(f"{result['county'][:23]:<24}{result['seconds']:>10.2f}{result['bytes'] / 1024:>10.1f}")
+    cpu_time = sum(result["seconds"] for result in results)
+    lines.append(f"{len(results)} counties in {wall_time:.2f} s wall time on {workers} workers "
+                 f"({cpu_time:.2f} s of work, {cpu_time / max(len(results), 1):.2f} s per county)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    all_counties = sorted(calfire_df["County"].unique())
+    parser = argparse.ArgumentParser(description="Render a wildfire impact report for every county.")
+    parser.add_argument("--county", action="append", choices=all_counties, metavar="COUNTY",
+                        help="county to report on, repeat for several (default every county in the data)")
+    parser.add_argument("--years", nargs=2, type=int, metavar=("FIRST", "LAST"),
+                        default=[int(calfire_df["Year"].min()), int(calfire_df["Year"].max())],
+                        help="inclusive year range (default all years)")
+    parser.add_argument("--format", nargs="+", choices=REPORT_FORMATS, default=["html"], help="report formats (default html)")
+    parser.add_argument("--output", default=REPORTS_DIR, help="output directory (default %(default)s)")
+    parser.add_argument("--workers", type=int, help="worker processes (default one per CPU)")
+    args = parser.parse_args(argv)
+
+    counties = args.county or all_counties
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(counties)))
+    results, wall_time = generate_reports(counties, args.years, args.format, args.output, workers)
+    print(format_report(results, wall_time, workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,137 @@
-import plotly.express as px
-import geopandas as gpd
-import pandas as pd
+import plotly.graph_objects as go
 
-def make_fire_damage_map(county_boundaries):
+def make_county_geojson(county_boundaries):
     """
-    Generates a choropleth map of California counties with wildfire damage data.
+    Serializes county geometries to a GeoJSON FeatureCollection keyed by county name.
+
+    Shapely geometries expose `__geo_interface__`, so this works on a GeoDataFrame
+    without importing geopandas.
 
     Parameters
     ----------
     county_boundaries : geopandas.GeoDataFrame
-        A GeoDataFrame containing county boundaries with precomputed columns "Fire Count" and "Economic Loss".
-    selectedData : dict, optional
-        Data from a previous selection event, used to highlight selected counties (default is None).
+        A GeoDataFrame with the columns "County" and "geometry".
+
+    Returns
+    -------
+    dict
+        A GeoJSON FeatureCollection where the id of every feature is the county name.
+
+    Examples
+    --------
+    >>> county_geojson = make_county_geojson(county_boundaries)
+    >>> county_geojson["features"][0]["id"]
+    'Alameda'
+    """
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature",
+             "id": county,
+             "properties": {"name": county},
+             "geometry": geometry.__geo_interface__ if geometry is not None else None}
+            for county, geometry in zip(county_boundaries["County"], county_boundaries["geometry"])
+        ],
+    }
+
+
+def make_fire_damage_map(county_stats, county_geojson=None):
+    """
+    Generates a choropleth map of California counties with wildfire damage data.
+
+    Parameters
+    ----------
+    county_stats : pd.DataFrame
+        A DataFrame with one row per county and the precomputed columns "County", "Fire Count",
+        "Assessed Improved Value" and "Economic Loss".
+    county_geojson : dict, optional
+        County boundaries as a GeoJSON FeatureCollection whose feature ids are county names
+        (see `data/processed/county_boundaries.geojson`). If `None`, the boundaries are read from
+        the "geometry" column of `county_stats`.
 
     Returns
     -------
     plotly.graph_objects.Figure
         A choropleth map displaying wildfire damage across California counties.
-        
+
     Examples
     --------
-    >>> create_fire_damage_map( county_boundaries)
+    >>> make_fire_damage_map(county_stats, county_geojson)
     """
+    if county_geojson is None:
+        county_geojson = make_county_geojson(county_stats)
 
-    fig = px.choropleth(
-        county_boundaries,
-        geojson=county_boundaries.geometry,
-        locations=county_boundaries.index,
-        color="Assessed Improved Value",
-        labels={"Assessed Improved Value": "Economic Loss (Billion $)"},
-        projection="mercator",
-        hover_name="County", 
-        color_continuous_scale="Reds",
-        hover_data={"County": False, "Economic Loss": True, "Fire Count": True},
-        custom_data=["Economic Loss", "Fire Count"],
-    )
-    
-    fig.update_layout(clickmode='event+select')
+    fig = go.Figure(go.Choropleth(
+        geojson=county_geojson,
+        locations=county_stats["County"],
+        z=county_stats["Assessed Improved Value"],
+        colorscale="Reds",
+        colorbar={"title": {"text": "Economic Loss (Billion $)"}},
+        hovertext=county_stats["County"],
+        customdata=county_stats[["Economic Loss", "Fire Count"]],
+        # Remove index from tooltip
+        hovertemplate="<b>%{hovertext}</b><br>Economic Loss: %{customdata[0]}<br>Number of Fires: %{customdata[1]}<extra></extra>",
+    ))
+
+    # Placeholder for the structure density layer, filled in by `update_density_layer`
+    fig.add_trace(make_density_trace(None, 0))
 
-    fig.update_geos(fitbounds="locations", visible=False)
+    # uirevision keeps the zoom when the density layer is redrawn
+    fig.update_layout(clickmode='event+select', margin={"t": 60}, uirevision="fire_damage_map")
 
-    # Remove index from tooltip
-    fig.update_traces(hovertemplate="<b>%{hovertext}</b><br>Economic Loss: %{customdata[0]}<br>Number of Fires: %{customdata[1]}<extra></extra>")
+    fig.update_geos(projection_type="mercator", fitbounds="locations", visible=False)
 
-    return fig
\ No newline at end of file
+    return fig
+
+
+def make_density_trace(cells, resolution):
+    """
+    Draws the hexagonal cells of the structure density layer.
+
+    Only the given cells are serialized, so zooming in to a finer resolution never ships the
+    cells outside the view.
+
+    Parameters
+    ----------
+    cells : pd.DataFrame or None
+        The output of `hex_grid.hexes_in_view`. `None` gives a hidden, empty layer.
+    resolution : int
+        The resolution of the cells.
+
+    Returns
+    -------
+    plotly.graph_objects.Choropleth
+        One polygon per cell, colored by its number of inspected structures.
+
+    Examples
+    --------
+    >>> make_density_trace(hexes_in_view(hex_density[2], 2, bounds), 2)
+    """
+    if cells is None or cells.empty:
+        return go.Choropleth(geojson={"type": "FeatureCollection", "features": []}, locations=[], z=[],
+                             name="Structure density", visible=False, showscale=False)
+
+    from .hex_grid import DAMAGE_COLUMNS, hex_polygon
+
+    ids = [f"{q}:{r}" for q, r in zip(cells["q"], cells["r"])]
+    geojson = {
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "id": cell_id,
+                      "geometry": {"type": "Polygon", "coordinates": [hex_polygon(q, r, resolution)]}}
+                     for cell_id, q, r in zip(ids, cells["q"], cells["r"])],
+    }
+    destroyed_share = (cells["Destroyed (>50%)"] / cells["Count"] * 100).round(1)
+
+    return go.Choropleth(
+        geojson=geojson,
+        locations=ids,
+        z=cells["Count"],
+        colorscale="YlOrBr",
+        marker={"opacity": 0.8, "line": {"width": 0}},
+        colorbar={"title": {"text": "Structures"}, "x": -0.05},
+        name="Structure density",
+        customdata=cells[DAMAGE_COLUMNS].assign(**{"Destroyed %": destroyed_share}),
+        hovertemplate="<b>%{z} structures</b><br>" +
+                      "".join(f"{damage}: %{{customdata[{i}]}}<br>" for i, damage in enumerate(DAMAGE_COLUMNS)) +
+                      "Destroyed share: %{customdata[5]}%<extra></extra>",
+    )
@@ -0,0 +1,283 @@
+"""
+Cross-filtering Between the Charts
+
+Clicking a roof construction on the roof chart, a damage category on the damage chart or a
+structure category on the structure chart selects it (shift-click adds more, clicking the
+background clears the selection). Every selection is a filter dimension of its own, on top of
+the county, year and incident filters: each chart is filtered by the selections of the other
+charts, so the values of its own selection stay in context, and the summary card and the time
+series by all of them.
+
+The summary dataset counts the roof x damage combinations and the structure categories in
+separate columns, it cannot tell how many asphalt roofs were single residences. `data_import.py`
+writes a cube instead: the number of structures and their economic loss per incident, year,
+county, month, week, roof construction, damage category and structure category. A cross-filter
+state never goes through the full pipeline:
+
+1. The county, year and incident filters of a state reduce the cube once to partial aggregates
+   per County x Year (x period) x roof x damage x structure, with the categories coded as
+   small integers. The partial aggregates of the last `CALFIRE_CROSSFILTER_CACHE_SIZE` filter
+   states are kept, so every click on a chart starts from them.
+2. A selection is a mask over the codes of the partial aggregates, and the data of each chart
+   is a `np.bincount` of the matching rows into the columns of the summary dataset (sums per
+   County x Year, as the SQL query backend returns them), so the chart builders are unchanged.
+
+The cube is a sum, the cubes of several raw files are merged by adding them. Cross-filtering
+is off (the charts have no click selection) until `data_import.py` has written the cube.
+
+Configuration
+-------------
+CALFIRE_CROSSFILTER_CACHE_SIZE : int
+    Number of filter states whose partial aggregates are kept (default 16).
+
+Examples
+--------
+>>> crossfilter = CrossfilterCube(crossfilter_cube, calfire_df)
+>>> frames = crossfilter.chart_frames(county=["Butte"], year=[2017, 2020],
+...                                   selection={"roof": ["Wood"], "damage": [], "structure": []})
+>>> frames["damage_chart"]  # The damage of the wood roofs of Butte, per County x Year
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+CROSSFILTER_CACHE_SIZE = int(os.environ.get("CALFIRE_CROSSFILTER_CACHE_SIZE", 16))
+CUBE_INDEX = ["Incident Name", "Year", "County", "Month", "Week", "Roof Construction", "Damage_Category", "Structure_Category"]
+VALUE_COLUMN = "Assessed Improved Value"
+# Selection dimensions, with the field of the chart they are selected on and their column in the cube
+SELECTION_FIELDS = {"roof": "Roof Construction", "damage": "Damage Category", "structure": "Structure Category"}
+SELECTION_COLUMNS = {"roof": "Roof Construction", "damage": "Damage_Category", "structure": "Structure_Category"}
+SELECTION_CHARTS = {"roof": "roof_chart", "damage": "damage_chart", "structure": "structure_chart"}
+GRANULARITIES = ("Month", "Week")
+
+_crossfilter = None
+_crossfilter_lock = threading.Lock()
+
+
+def make_crossfilter_cube(calfire_df):
+    """
+    Counts the structures and sums their economic loss per incident, period and category.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame
+        Structure-level records of `data_import.clean_calfire_df`, with the values cast to int32.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per non-empty combination of `CUBE_INDEX`, with the "Count" of structures and
+        their "Total Economic Loss". Categories missing from a record are kept as missing.
+    """
+    return (calfire_df.groupby(CUBE_INDEX, dropna=False, observed=True)[VALUE_COLUMN]
+            .agg(["size", "sum"])
+            .rename(columns={"size": "Count", "sum": "Total Economic Loss"})
+            .reset_index())
+
+
+def merge_crossfilter_cubes(cubes):
+    """
+    Merges the cubes of several sets of structures, e.g. the partial aggregates of several raw files.
+
+    Parameters
+    ----------
+    cubes : list of pd.DataFrame
+        Outputs of `make_crossfilter_cube`.
+
+    Returns
+    -------
+    pd.DataFrame
+        The cube of all the structures, as if built from a single set.
+    """
+    return (pd.concat(cubes, ignore_index=True)
+            .groupby(CUBE_INDEX, dropna=False, observed=True)[["Count", "Total Economic Loss"]].sum()
+            .reset_index())
+
+
+def selection_of(filters):
+    """Returns the chart selections of a normalized filter state, empty lists for the dimensions without one."""
+    return {dimension: list(filters.get(dimension) or []) for dimension in SELECTION_FIELDS}
+
+
+class CrossfilterCube:
+    """
+    Answers the cross-filter states of the dashboard from the cube of `data_import.py`.
+
+    Parameters
+    ----------
+    cube : pd.DataFrame
+        The output of `make_crossfilter_cube`.
+    calfire_df : pd.DataFrame
+        The summary dataset, whose columns and dtypes the chart data is returned in.
+    cache_size : int, optional
+        Number of filter states whose partial aggregates are kept (default is
+        `CALFIRE_CROSSFILTER_CACHE_SIZE`, or 16).
+    """
+
+    def __init__(self, cube, calfire_df, cache_size=CROSSFILTER_CACHE_SIZE):
+        self.columns = calfire_df.columns
+        self.dtypes = calfire_df.dtypes
+        # The counted columns come first: roof x damage tuples, then the structure categories
+        self.n_counted = list(self.columns).index("Incident Name")
+        positions = {column: i for i, column in enumerate(self.columns[:self.n_counted])}
+        self.cache_size = cache_size
+        self.hits = self.misses = 0
+        self._partials = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._rows = {column: cube[column].to_numpy() for column in ["Incident Name", "Year", "County", *GRANULARITIES]}
+        self._codes, self._values = {}, {}
+        for dimension, column in SELECTION_COLUMNS.items():
+            codes, values = pd.factorize(cube[column])
+            self._codes[dimension] = codes.astype(np.int16)
+            self._values[dimension] = {value: code for code, value in enumerate(values)}
+        # The summary column every structure is counted in, -1 when it has none (e.g. a missing category)
+        roof_damage = zip(cube["Roof Construction"], cube["Damage_Category"])
+        self._codes["damage_column"] = np.array([positions.get(key, -1) for key in roof_damage], dtype=np.int16)
+        self._codes["structure_column"] = np.array([positions.get(key, -1) for key in cube["Structure_Category"]],
+                                                   dtype=np.int16)
+        self._count = cube["Count"].to_numpy(dtype=np.int64)
+        self._loss = cube["Total Economic Loss"].to_numpy(dtype=np.int64)
+
+    def _reduce(self, county, year, incident_name, granularity):
+        mask = np.ones(len(self._count), dtype=bool)
+        if year:
+            mask &= (self._rows["Year"] >= year[0]) & (self._rows["Year"] <= year[1])
+        if county:
+            mask &= np.isin(self._rows["County"], list(county))
+        if incident_name:
+            mask &= np.isin(self._rows["Incident Name"], list(incident_name))
+
+        keys = ["County", "Year"] + ([granularity] if granularity != "Year" else [])
+        dimensions = list(SELECTION_COLUMNS) + ["damage_column", "structure_column"]
+        rows = pd.DataFrame({**{key: self._rows[key][mask] for key in keys},
+                             **{dimension: self._codes[dimension][mask] for dimension in dimensions},
+                             "Count": self._count[mask], "Loss": self._loss[mask]})
+        # Incidents (and periods of the yearly charts) are summed away, the selections only need the codes
+        partial = rows.groupby(keys + dimensions, sort=True, observed=True)[["Count", "Loss"]].sum().reset_index()
+        county_year = partial.groupby(["County", "Year"], sort=True)
+        result = {"county_year": county_year.ngroup().to_numpy(),
+                  "county_year_labels": county_year.size().index.to_frame(index=False),
+                  "count": partial["Count"].to_numpy(), "loss": partial["Loss"].to_numpy(),
+                  **{dimension: partial[dimension].to_numpy() for dimension in dimensions}}
+        if granularity != "Year":
+            periods = partial.groupby(["County", granularity, "Year"], sort=True)
+            result["period"] = periods.ngroup().to_numpy()
+            result["period_labels"] = periods.size().index.to_frame(index=False)
+        return result
+
+    def partial_aggregates(self, county=None, year=None, incident_name=None, granularity="Year"):
+        """
+        Returns the partial aggregates of a filter state, reducing the cube on the first call.
+
+        Returns
+        -------
+        dict
+            Arrays over the non-empty County x Year (x period) x category combinations: the
+            codes of every selection dimension, the summary columns the structures are
+            counted in, the "count" of structures, the "loss", and the "county_year" (and
+            "period") group of every combination with its labels.
+        """
+        key = json.dumps([county, year, incident_name, granularity], sort_keys=True)
+        with self._lock:
+            if key in self._partials:
+                self._partials.move_to_end(key)
+                self.hits += 1
+                return self._partials[key]
+        partial = self._reduce(county, year, incident_name, granularity)
+        with self._lock:
+            self._partials[key] = partial
+            self.misses += 1
+            while len(self._partials) > self.cache_size:
+                self._partials.popitem(last=False)
+        return partial
+
+    def _mask(self, partial, selection, skip=None):
+        mask = np.ones(len(partial["count"]), dtype=bool)
+        for dimension, values in selection.items():
+            if values and dimension != skip:
+                codes = [self._values[dimension][value] for value in values if value in self._values[dimension]]
+                mask &= np.isin(partial[dimension], codes)
+        return mask
+
+    def _summary_frame(self, partial, mask):
+        groups = len(partial["county_year_labels"])
+        count = np.where(mask, partial["count"], 0)
+        matrix = np.zeros(groups * self.n_counted, dtype=np.int64)
+        for column in ("damage_column", "structure_column"):
+            counted = partial[column] >= 0
+            matrix += np.bincount(partial["county_year"][counted] * self.n_counted + partial[column][counted],
+                                  weights=count[counted], minlength=groups * self.n_counted).astype(np.int64)
+        matrix = matrix.reshape(groups, self.n_counted)
+        # As in the summary dataset, a County x Year without any matching structure has no row
+        keep = np.bincount(partial["county_year"], weights=count, minlength=groups) > 0
+        loss = np.bincount(partial["county_year"], weights=np.where(mask, partial["loss"], 0), minlength=groups)
+
+        df = pd.DataFrame(matrix[keep], columns=pd.Index(self.columns[:self.n_counted], tupleize_cols=False))
+        labels = partial["county_year_labels"][keep]
+        df["Incident Name"] = None
+        df["Year"] = labels["Year"].to_numpy()
+        df["County"] = labels["County"].to_numpy()
+        df["Total Economic Loss"] = loss[keep].round().astype(np.int64)
+        df.columns = self.columns
+        return df.astype(self.dtypes[self.dtypes != df.dtypes].to_dict())
+
+    def _timeseries_frame(self, partial, mask, granularity):
+        groups = len(partial["period_labels"])
+        keep = np.bincount(partial["period"], weights=np.where(mask, partial["count"], 0), minlength=groups) > 0
+        loss = np.bincount(partial["period"], weights=np.where(mask, partial["loss"], 0), minlength=groups)
+        df = partial["period_labels"][keep].reset_index(drop=True)
+        df["Year"] = df["Year"].astype(self.dtypes["Year"])
+        df["Total Economic Loss"] = loss[keep].round().astype(np.int64)
+        return df
+
+    def chart_frames(self, county=None, year=None, incident_name=None, granularity="Year", selection=None):
+        """
+        Returns the data of every chart of a cross-filter state.
+
+        Parameters
+        ----------
+        county, year, incident_name, granularity
+            See `chart_specs.make_chart_specs`, `granularity` falls back to "Year" if unknown.
+        selection : dict, optional
+            The selected values of the "roof", "damage" and "structure" dimensions (see
+            `SELECTION_FIELDS`), none if `None`.
+
+        Returns
+        -------
+        dict
+            The sums per County x Year of the "summary" card and of the "roof_chart",
+            "damage_chart" and "structure_chart" in the columns of the summary dataset, the
+            "timeseries" data (the summary itself, or the economic loss per County x period)
+            and its "granularity".
+        """
+        granularity = granularity if granularity in GRANULARITIES else "Year"
+        selection = selection or {}
+        partial = self.partial_aggregates(county, year, incident_name, granularity)
+
+        summary = self._summary_frame(partial, self._mask(partial, selection))
+        frames = {"summary": summary, "granularity": granularity}
+        for dimension, chart in SELECTION_CHARTS.items():
+            # A chart is not filtered by its own selection, the other values stay on it
+            frames[chart] = self._summary_frame(partial, self._mask(partial, selection, skip=dimension)) \
+                if selection.get(dimension) else summary
+        frames["timeseries"] = summary if granularity == "Year" else \
+            self._timeseries_frame(partial, self._mask(partial, selection), granularity)
+        return frames
+
+
+def get_crossfilter():
+    """Returns the cross-filter of the default region, `None` until `data_import.py` has written the cube."""
+    global _crossfilter
+    with _crossfilter_lock:
+        if _crossfilter is None:
+            from .data import calfire_df, crossfilter_cube
+            if crossfilter_cube is None:
+                return None
+            _crossfilter = CrossfilterCube(crossfilter_cube, calfire_df)
+        return _crossfilter
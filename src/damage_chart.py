@@ -1,7 +1,9 @@
 import pandas as pd
 import altair as alt
 
-def make_damage_chart(calfire_df):
+from .summary_columns import split_summary_columns
+
+def make_damage_chart(calfire_df, selected=None):
     """
     Generates a donut chart displaying the distribution of damage categories in the given dataset.
 
@@ -67,6 +69,9 @@ def make_damage_chart(calfire_df):
         - "Year": Year of the wildfire occurance.
         - "County": The county where the wildfire occurred.
         - "Total Economic Loss": Total economic loss caused by the wildfire.
+    selected : list of str, optional
+        The damage categories selected on the chart, highlighted. Clicking a slice selects its
+        category (see `crossfilter.py`). If `None`, the chart has no click selection.
     Returns
     -------
     alt.Chart
@@ -77,14 +82,20 @@ def make_damage_chart(calfire_df):
     """
     alt.data_transformers.enable("vegafusion")
 
-    damage_table = pd.DataFrame(calfire_df.columns[:47].to_list(), columns=[ "Roof Construction", "Damage Category"])
+    roof_damage_columns, _ = split_summary_columns(calfire_df.columns)
+
+    damage_table = pd.DataFrame(roof_damage_columns, columns=[ "Roof Construction", "Damage Category"])
 
-    damage_count = pd.DataFrame(calfire_df.iloc[:, :47].sum(axis=0).values, columns=["Count"])
+    damage_count = pd.DataFrame(calfire_df[roof_damage_columns].sum(axis=0).values, columns=["Count"])
 
     calfire_damage = (pd.concat([damage_table, damage_count], axis=1)
                       .groupby(['Damage Category'])['Count']
                       .sum().reset_index(name="Count"))
 
+    selection = alt.selection_point(fields=["Damage Category"], name="damage_select",
+                                    value=[{"Damage Category": damage} for damage in selected] or alt.Undefined) \
+        if selected is not None else None
+
     damage_chart = alt.Chart(calfire_damage).mark_arc(innerRadius=50).encode(
     theta="Count",
     color=alt.Color("Damage Category:N",
@@ -99,9 +110,12 @@ def make_damage_chart(calfire_df):
                                     "'E. Destroyed (>50%)': 'Destroyed (>50%)'}[datum.label]"
                                     )
                                     ),
+    opacity=alt.OpacityValue(0.3, condition={"param": selection.name, "value": 1}) if selection is not None else alt.Undefined,
     tooltip=["Damage Category:O", "Count:Q"]).properties(
         width='container',
         height=200
     )
+    if selection is not None:
+        damage_chart = damage_chart.add_params(selection)
 
     return damage_chart
\ No newline at end of file
@@ -1,13 +1,35 @@
-import pandas as pd
-import geopandas as gpd
-import pickle
+from .memory_profiler import track_memory
+from .regions import DEFAULT_DATA_DIR, RegionData
 
-# Load wildfire data
-with open('data/processed/processed_cal_fire.pkl', 'rb') as f:
-    calfire_df = pickle.load(f)
+# Only lightweight artifacts are loaded here: geopandas is only needed by data_import.py
+with track_memory("data_loading"):
+    # Load the partition of the default region (California), other regions are loaded on demand by regions.py
+    default_region = RegionData.load(DEFAULT_DATA_DIR)
+
+# Wildfire data
+calfire_df = default_region.calfire_df
 
 # calfire_df["Incident Start Date"] = pd.to_datetime(calfire_df["Incident Start Date"], format="ISO8601") # Not needed for now
 
-# Load geospatial and county data
-with open('data/processed/county_boundaries.pkl', 'rb') as f:
-    county_boundaries = pickle.load(f)
\ No newline at end of file
+# Short hash and modification time of the summary dataset, reported by /metrics and used to key caches
+dataset_version = default_region.version
+dataset_modified = default_region.modified
+
+# Per-year county totals for the top-K counties of the structure and time series charts
+county_leaderboard = default_region.county_leaderboard
+
+# County statistics and the pre-serialized county boundaries
+county_stats = default_region.county_stats
+county_geojson = default_region.county_geojson
+
+# The monthly and weekly time series rollups, the yearly one is calfire_df itself
+timeseries_rollups = default_region.timeseries_rollups
+
+# The structure counts of the map density layer (see hex_grid.py), None until data_import.py has written them
+hex_density = default_region.hex_density
+
+# Quantile sketches of the assessed values of the distribution panel (see value_sketches.py), None until data_import.py has written them
+value_sketches = default_region.value_sketches
+
+# Structure counts per incident, period and category of the cross-filtering charts (see crossfilter.py), None until data_import.py has written them
+crossfilter_cube = default_region.crossfilter_cube
@@ -1,51 +1,163 @@
 import pandas as pd
 import pickle
+import json
+import os
+import glob
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
 import geopandas as gpd
 from millions_billions import millions_billions
+from create_map import make_county_geojson
+from structure_store import StructureStore, CATEGORICAL_COLUMNS, VALUE_COLUMN
+from stage_cache import StageCache, DEFAULT_CACHE_DIR
+from hex_grid import aggregate_hex_density, merge_hex_density
+from value_sketches import make_value_sketches, merge_value_sketches
+from crossfilter import make_crossfilter_cube, merge_crossfilter_cubes
+
+def make_timeseries_rollups(calfire_df, granularities=("Month", "Week")):
+    """
+    Aggregates the economic loss of every incident and county to finer time periods.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame
+        Cleaned structure-level DataFrame with "Incident Name", "County", "Year",
+        "Assessed Improved Value" and one column per requested granularity holding
+        the start timestamp of the period.
+    granularities : tuple of str, optional
+        The period columns to roll up (default is ("Month", "Week")).
+
+    Returns
+    -------
+    dict of pd.DataFrame
+        One table per granularity with the columns "Incident Name", "Year", "County",
+        the period column and "Total Economic Loss".
 
-def load_calfire_df():
+    Examples
+    --------
+    >>> rollups = make_timeseries_rollups(calfire_df)
+    >>> rollups["Month"].head()
     """
-    Loads the CAL FIRE Damage Inspection (DINS) Data from a CSV file, performs data cleaning, 
-    and saves the cleaned dataset as a new CSV file.
+    rollups = {}
+    for granularity in granularities:
+        rollup = calfire_df.groupby(['Incident Name', 'Year', 'County', granularity], as_index=False)['Assessed Improved Value'].sum()
+        rollups[granularity] = rollup.rename(columns={"Assessed Improved Value": "Total Economic Loss"})
+
+    return rollups
 
-    The function selects relevant columns, renames them for consistency, 
-    and applies minor data cleaning such as handling missing values and reclassifying 
-    "Inaccessible" damage as "Unknown".
 
-    The cleaned dataset is saved to 'data/processed/cleaned_cal_fire.csv'.
+def save_county_boundaries(county_boundaries, stats_path='data/processed/county_stats.pkl',
+                           geojson_path='data/processed/county_boundaries.geojson'):
+    """
+    Saves the county statistics as a plain DataFrame and the county boundaries as GeoJSON.
 
     Parameters
     ----------
-    None
+    county_boundaries : geopandas.GeoDataFrame
+        County boundaries merged with the "Fire Count", "Assessed Improved Value" and
+        "Economic Loss" statistics.
+    stats_path : str, optional
+        Where to pickle the statistics (default is 'data/processed/county_stats.pkl').
+    geojson_path : str, optional
+        Where to write the boundaries (default is 'data/processed/county_boundaries.geojson').
 
     Returns
     -------
     None
 
-    Notes
-    -----
-    - Reads the raw dataset from 'data/raw/California_wildfire_2013-2025.csv'.
-    - Handles missing values in the "Assessed Improved Value", "County", and "Roof Construction" columns.
-    - Renames some columns for better readability.
-    - Saves the cleaned DataFrame as a CSV file.
-    
     Examples
     --------
-    >>> from data_import import load_calfire_df
-    >>> load_calfire_df()
-    (This will load, clean, and save the data without returning anything.)
+    >>> with open('data/processed/county_boundaries.pkl', 'rb') as f:
+    ...     save_county_boundaries(pickle.load(f))
+    """
+    county_stats = pd.DataFrame(county_boundaries.drop(columns="geometry"))
+    with open(stats_path, 'wb') as f:
+        pickle.dump(county_stats, f)
+
+    with open(geojson_path, 'w') as f:
+        json.dump(make_county_geojson(county_boundaries), f)
+
+
+RAW_DATA_PATH = 'data/raw/California_wildfire_2013-2025.csv'
+GEOJSON_PATH = 'data/raw/california-counties.geojson'
+# Partitions of the regions other than California, loaded on demand by regions.py
+REGIONS_DIR = 'data/processed/regions'
+SUMMARY_INDEX = ['Incident Name', 'Year', 'County']
+
+
+def resolve_raw_files(raw_paths):
+    """
+    Expands the raw data locations to a sorted list of CSV files.
+
+    Parameters
+    ----------
+    raw_paths : str or list of str
+        CSV files, directories (all CSV files inside are used) or glob patterns.
+
+    Returns
+    -------
+    list of str
+        The CSV files, in a deterministic order.
+
+    Examples
+    --------
+    >>> resolve_raw_files(["data/raw/dins_2013-2019.csv", "data/raw/extracts/"])
+    """
+    if isinstance(raw_paths, str):
+        raw_paths = [raw_paths]
+
+    csv_files = []
+    for raw_path in raw_paths:
+        if os.path.isdir(raw_path):
+            csv_files.extend(sorted(glob.glob(os.path.join(raw_path, '*.csv'))))
+        elif glob.has_magic(raw_path):
+            csv_files.extend(sorted(glob.glob(raw_path)))
+        else:
+            csv_files.append(raw_path)
+
+    if not csv_files:
+        raise FileNotFoundError(f"No raw CSV files found in {raw_paths}")
+    return csv_files
+
+
+def clean_calfire_df(csv_file_path):
+    """
+    Reads one raw CAL FIRE Damage Inspection (DINS) CSV file and cleans it.
+
+    The function selects relevant columns, renames them for consistency, drops records with
+    missing values or "Inaccessible" damage, and adds the sortable damage and structure
+    categories as well as the year, month and week of every incident.
+
+    Parameters
+    ----------
+    csv_file_path : str
+        Path of the raw CSV file.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per inspected structure.
+
+    Examples
+    --------
+    >>> calfire_df = clean_calfire_df('data/raw/California_wildfire_2013-2025.csv')
     """
 
     relevant_columns = ["* Damage", "County", "* Incident Name", "Incident Start Date", "Structure Category", "* Roof Construction", "Assessed Improved Value (parcel)"]
     renamed_columns = ["Damage", "County", "Incident Name", "Incident Start Date", "Structure Category", "Roof Construction", "Assessed Improved Value"]
+    # Coordinates are only used by the density layer of the map, older extracts may not have them
+    coordinate_columns = ["Latitude", "Longitude"]
 
-    csv_file_path = 'data/raw/California_wildfire_2013-2025.csv'
-    calfire_df = pd.read_csv(csv_file_path, usecols=relevant_columns)
-    calfire_df["Incident Start Date"] = pd.to_datetime(calfire_df["Incident Start Date"], format="%m/%d/%Y %I:%M:%S %p")
     # Reading file, selecting and renaming relevant columns
+    calfire_df = pd.read_csv(csv_file_path, usecols=lambda column: column in relevant_columns + coordinate_columns)
+    for column in coordinate_columns:
+        if column not in calfire_df:
+            calfire_df[column] = float("nan")
 
     # Rename columns
-    calfire_df.columns = renamed_columns
+    calfire_df = calfire_df.rename(columns=dict(zip(relevant_columns, renamed_columns)))[renamed_columns + coordinate_columns]
+    calfire_df["Incident Start Date"] = pd.to_datetime(calfire_df["Incident Start Date"], format="%m/%d/%Y %I:%M:%S %p")
 
 
     # Data cleaning
@@ -54,7 +166,7 @@ def load_calfire_df():
     calfire_df.loc[calfire_df["Damage"] == "Inaccessible", "Damage"] = None
     calfire_df.loc[calfire_df["Roof Construction"] == " ", "Roof Construction"] =  None
 
-    calfire_df = calfire_df.dropna()
+    calfire_df = calfire_df.dropna(subset=renamed_columns)
 
     ## For correct sorting of damage types. This is a workaround to an existing altair bug https://github.com/vega/vega-lite/issues/5366
     damage_rename = {
@@ -80,75 +192,354 @@ def load_calfire_df():
 
     calfire_df["Structure_Category"] = calfire_df["Structure Category"].map(structure_rename)
 
-    # Read geojson file
-    geojson_file_path = "data/raw/california-counties.geojson"
-    county_boundaries = gpd.read_file(geojson_file_path)[["name", "geometry"]]
-    # county_boundaries["name"] = county_boundaries["name"] # .str.strip() # don't think it's needed
+    # "Incident Start Date" is already parsed above, so the periods are taken straight from it
+    calfire_df["Year"] = calfire_df["Incident Start Date"].dt.year
+    calfire_df["Month"] = calfire_df["Incident Start Date"].dt.to_period("M").dt.start_time
+    calfire_df["Week"] = calfire_df["Incident Start Date"].dt.to_period("W").dt.start_time
+
+    return calfire_df
+
 
-    # Pre-compute county statistics and merge with county boundaries
+def aggregate_calfire_df(calfire_df):
+    """
+    Computes the partial aggregates of a cleaned DataFrame.
+
+    Every aggregate is a sum or a set union, so the partial aggregates of several raw files
+    can be merged with `merge_partial_aggregates` into exactly what a single file holding
+    all the records would give.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame
+        The output of `clean_calfire_df`.
+
+    Returns
+    -------
+    dict
+        The damage and structure pivot tables, the economic loss per incident, the county
+        statistics, the time series rollups, the per-structure records, the quantile sketches
+        of the assessed values, the cross-filter cube, and the date range, counties and
+        incidents found.
+    """
+    # Pre-compute county statistics (on the full precision values)
     county_stats = calfire_df.groupby("County").agg(
         Fire_Count=("Incident Name", "count"),
-        Economic_Loss=("Assessed Improved Value", "sum")        
-    ).reset_index()
+        Economic_Loss=("Assessed Improved Value", "sum")
+    )
+
+    calfire_df = calfire_df.copy()
+    calfire_df["Assessed Improved Value"] = calfire_df["Assessed Improved Value"].astype('int32') # Changed from float64 as we don't need that level of precision for each property
+
+    return {
+        # Aggregate damage summary
+        "damage": calfire_df.pivot_table(index=SUMMARY_INDEX, columns=['Roof Construction', 'Damage_Category'], aggfunc='size', fill_value=0),
+        # Aggregate structure summary
+        "structure": calfire_df.pivot_table(index=SUMMARY_INDEX, columns=['Structure_Category'], aggfunc='size', fill_value=0),
+        # Aggregate financial summary
+        "value": calfire_df.groupby(SUMMARY_INDEX)['Assessed Improved Value'].sum(),
+        "county_stats": county_stats,
+        # Monthly and weekly rollups for the time series chart (the yearly one is the summary dataset)
+        "timeseries_rollups": make_timeseries_rollups(calfire_df),
+        # Per-structure records for drill-down queries (see structure_store.py)
+        "structures": calfire_df[CATEGORICAL_COLUMNS + [VALUE_COLUMN]],
+        # Structure counts and damage mix on the hexagonal grids of the map density layer (see hex_grid.py)
+        "hex_density": aggregate_hex_density(calfire_df),
+        # Mergeable quantile sketches of the assessed values per County x Year and per incident (see value_sketches.py)
+        "value_sketches": make_value_sketches(calfire_df),
+        # Structure counts and economic loss per incident, period and category of the cross-filtering charts (see crossfilter.py)
+        "crossfilter_cube": make_crossfilter_cube(calfire_df),
+        "min_date": calfire_df['Incident Start Date'].min(),
+        "max_date": calfire_df['Incident Start Date'].max(),
+        "counties": set(calfire_df["County"].dropna().unique()),
+        "incidents": set(calfire_df["Incident Name"].dropna().unique()),
+    }
+
+
+def ingest_raw_file(csv_file_path):
+    """Cleans and aggregates one raw CSV file, this is the unit of work of the process pool."""
+    start = time.perf_counter()
+    partial = aggregate_calfire_df(clean_calfire_df(csv_file_path))
+    return partial, time.perf_counter() - start
+
+
+# Code the output of an ingest stage depends on, the stage cache hashes the whole module of
+# every function, so helpers of the same module need not be listed
+INGEST_CODE = [clean_calfire_df, aggregate_calfire_df, make_timeseries_rollups, aggregate_hex_density, make_value_sketches,
+               make_crossfilter_cube, StructureStore]
+
+
+def _sum_by_index(tables, pivot=False):
+    if len(tables) == 1:
+        return tables[0]
+    combined = pd.concat(tables)
+    if pivot:
+        # Files can hold different roof/damage combinations, missing ones are zero counts
+        combined = combined.fillna(0).astype('int64')
+    summed = combined.groupby(level=list(range(combined.index.nlevels))).sum()
+    return summed.sort_index(axis=1) if pivot else summed
 
-    county_boundaries = county_boundaries.merge(county_stats, left_on="name", right_on="County", how="left").drop(columns=["County"])
+
+def merge_partial_aggregates(partials):
+    """
+    Merges the partial aggregates of several raw files.
+
+    Parameters
+    ----------
+    partials : list of dict
+        Outputs of `aggregate_calfire_df`, in file order.
+
+    Returns
+    -------
+    dict
+        The merged aggregates, with the same keys.
+    """
+    rollups = {granularity: pd.concat([partial["timeseries_rollups"][granularity] for partial in partials])
+                                .groupby(['Incident Name', 'Year', 'County', granularity], as_index=False)['Total Economic Loss'].sum()
+               for granularity in partials[0]["timeseries_rollups"]} if len(partials) > 1 else partials[0]["timeseries_rollups"]
+
+    return {
+        "damage": _sum_by_index([partial["damage"] for partial in partials], pivot=True),
+        "structure": _sum_by_index([partial["structure"] for partial in partials], pivot=True),
+        "value": _sum_by_index([partial["value"] for partial in partials]),
+        "county_stats": _sum_by_index([partial["county_stats"] for partial in partials]),
+        "timeseries_rollups": rollups,
+        "structures": pd.concat([partial["structures"] for partial in partials], ignore_index=True),
+        "hex_density": merge_hex_density([partial["hex_density"] for partial in partials]) if len(partials) > 1 else partials[0]["hex_density"],
+        "value_sketches": merge_value_sketches([partial["value_sketches"] for partial in partials]) if len(partials) > 1 else partials[0]["value_sketches"],
+        "crossfilter_cube": merge_crossfilter_cubes([partial["crossfilter_cube"] for partial in partials]) if len(partials) > 1 else partials[0]["crossfilter_cube"],
+        "min_date": min(partial["min_date"] for partial in partials),
+        "max_date": max(partial["max_date"] for partial in partials),
+        "counties": set().union(*(partial["counties"] for partial in partials)),
+        "incidents": set().union(*(partial["incidents"] for partial in partials)),
+    }
+
+
+def make_county_boundaries(county_stats, geojson_file_path="data/raw/california-counties.geojson"):
+    """
+    Reads the county boundaries and merges them with the county statistics.
+
+    Parameters
+    ----------
+    county_stats : pd.DataFrame
+        "Fire_Count" and "Economic_Loss" indexed by county, as merged by `merge_partial_aggregates`.
+    geojson_file_path : str, optional
+        The county boundaries (default is 'data/raw/california-counties.geojson').
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+        One row per county with its geometry, "Fire Count", "Assessed Improved Value" and "Economic Loss".
+    """
+    # Read geojson file
+    county_boundaries = gpd.read_file(geojson_file_path)[["name", "geometry"]]
+    # county_boundaries["name"] = county_boundaries["name"] # .str.strip() # don't think it's needed
+
+    # Merge the county statistics with county boundaries
+    county_boundaries = county_boundaries.merge(county_stats.reset_index(), left_on="name", right_on="County", how="left").drop(columns=["County"])
     county_boundaries.columns = ['County', 'geometry', 'Fire Count', 'Assessed Improved Value'] # renaming to remove underscores
 
     county_boundaries["Fire Count"] = county_boundaries["Fire Count"].fillna(0)
     county_boundaries["Assessed Improved Value"] = county_boundaries["Assessed Improved Value"].fillna(0)
     county_boundaries["Economic Loss"] = county_boundaries["Assessed Improved Value"].apply(millions_billions)
 
+    return county_boundaries
 
 
-    # Save county_boundaries to serialized pickle file for faster reading
-    with open('data/processed/county_boundaries.pkl', 'wb') as f:
-        pickle.dump(county_boundaries, f)
+def make_summary_df(aggregates):
+    """
+    Builds the summary dataset used by the charts: one row per incident, year and county with
+    the roof x damage counts, the structure category counts and the total economic loss.
 
-    # Global variables are created here (Should be updated whenever dataset is updated)
-    counties = sorted(calfire_df["County"].dropna().unique())
-    min_year = calfire_df['Incident Start Date'].min().year
-    max_year = calfire_df['Incident Start Date'].max().year
-    incidents = sorted(calfire_df["Incident Name"].dropna().unique())
+    Parameters
+    ----------
+    aggregates : dict
+        The output of `merge_partial_aggregates`.
 
-    # Saving the global variables:
-    with open('data/processed/global_vars.pkl', 'wb') as f:
-        pickle.dump([counties, min_year, max_year, incidents], f)
+    Returns
+    -------
+    pd.DataFrame
+        The summary dataset.
+    """
+    ### Further dataframe to only contain required summary counts
+    damage_df = aggregates["damage"].reset_index().iloc[:, 3:]
+    structure_df = aggregates["structure"].reset_index().iloc[:, 3:]
+    value_df = aggregates["value"].reset_index()
 
-    # Save processed dataframe into data folder
-    # calfire_df.to_csv('data/processed/processed_cal_fire.csv', index=False)
+    value_df.rename(columns={"Assessed Improved Value": "Total Economic Loss"}, inplace=True)
 
-    calfire_df["Assessed Improved Value"] = calfire_df["Assessed Improved Value"].astype('int32') # Changed from float64 as we don't need that level of precision for each property
+    # Summary dataset
+    return pd.concat([damage_df, structure_df, value_df], axis=1)
 
-    # calfire_df = calfire_df.iloc[:int(calfire_df.shape[0]/25)] # reduce to 5k rows
 
-    ### Further dataframe to only contain required summary counts
-    calfire_df["Year"] = pd.to_datetime(calfire_df["Incident Start Date"], format = 'mixed').dt.year
+def load_calfire_df(raw_paths=RAW_DATA_PATH, workers=None, output_dir='data/processed',
+                    geojson_file_path="data/raw/california-counties.geojson", cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Loads the CAL FIRE Damage Inspection (DINS) Data from one or more CSV files, performs data
+    cleaning, and saves the summary datasets used by the dashboard.
 
-    # Aggregate damage summary
-    damage_df = calfire_df.pivot_table(index=['Incident Name', 'Year', 'County'], columns=['Roof Construction', 'Damage_Category'], aggfunc= 'size', fill_value=0).reset_index().iloc[:, 3:]
+    Every raw file is parsed, cleaned and partially aggregated on a process pool, then the
+    partial aggregates are merged. The results are identical to a run on a single file
+    holding all the records.
 
-    # Aggregate structure summary
-    structure_df = calfire_df.pivot_table(index=['Incident Name', 'Year', 'County'], columns=['Structure_Category'], aggfunc= 'size', fill_value=0).reset_index().iloc[:, 3:]
+    The work is split into stages whose outputs are cached on disk (see `stage_cache.py`):
+    one "ingest" stage per raw file, "merge", "county_boundaries" and "summary". A stage is
+    skipped when its input files, upstream stages and code are unchanged. A per-stage timing
+    and cache-hit report is printed at the end.
 
-    # Aggregate financial summary
-    value_df = calfire_df.groupby(['Incident Name', 'Year', 'County'], as_index=False)['Assessed Improved Value'].sum()
+    Parameters
+    ----------
+    raw_paths : str or list of str, optional
+        Raw CSV files, directories or glob patterns (default is
+        'data/raw/California_wildfire_2013-2025.csv').
+    workers : int, optional
+        Number of worker processes (default is one per CPU, capped at the number of files).
+    output_dir : str, optional
+        Where to save the processed data (default is 'data/processed').
+    geojson_file_path : str, optional
+        The county boundaries (default is 'data/raw/california-counties.geojson').
+    cache_dir : str or None, optional
+        Where to cache the stage outputs (default is 'data/cache'), `None` disables the cache.
 
-    value_df.rename(columns={"Assessed Improved Value": "Total Economic Loss"}, inplace=True)
+    Returns
+    -------
+    StageCache
+        The cache, holding the timing and cache-hit report of the run.
 
-    # Summary dataset
-    summary_df = pd.concat([damage_df, structure_df, value_df], axis=1)
+    Notes
+    -----
+    - Handles missing values in the "Assessed Improved Value", "County", and "Roof Construction" columns.
+    - Renames some columns for better readability.
+    - Saves the summary dataset to 'processed_cal_fire.csv' and 'processed_cal_fire.pkl'.
+    - Saves the county statistics to 'county_stats.pkl' and the county boundaries
+      to 'county_boundaries.geojson'.
+    - Saves the per-structure records with their indexes to 'structures.npz'.
+    - Saves monthly and weekly economic loss rollups to 'timeseries_rollups.pkl'.
+    - Saves the structure counts per hexagonal cell, county and year to 'hex_density.pkl'.
+    - Saves the quantile sketches of the assessed values to 'value_sketches.pkl'.
+    - Saves the cross-filter cube of the charts to 'crossfilter_cube.pkl'.
+    - Saves the counties, year range and incidents to 'global_vars.pkl'.
+    
+    Examples
+    --------
+    >>> from data_import import load_calfire_df
+    >>> load_calfire_df()
+    (This will load, clean, and save the data and print the stage report.)
+    >>> load_calfire_df("data/raw/extracts/", workers=8)
+    """
+    cache = StageCache(cache_dir)
+    csv_files = resolve_raw_files(raw_paths)
+
+    # Ingest stages: only the raw files that changed are parsed again
+    ingest_keys = [cache.key(f"ingest:{os.path.basename(csv_file)}", code=INGEST_CODE, files=[csv_file])
+                   for csv_file in csv_files]
+    partials = [cache.get(f"ingest:{os.path.basename(csv_file)}", key) for csv_file, key in zip(csv_files, ingest_keys)]
+    missing = [i for i, (hit, _) in enumerate(partials) if not hit]
+    for i, (hit, _) in enumerate(partials):
+        if hit:
+            cache.record(f"ingest:{os.path.basename(csv_files[i])}", True, 0.0)
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(missing)))
+    if workers == 1:
+        results = [ingest_raw_file(csv_files[i]) for i in missing]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(ingest_raw_file, [csv_files[i] for i in missing]))
+
+    for i, (partial, seconds) in zip(missing, results):
+        stage = f"ingest:{os.path.basename(csv_files[i])}"
+        cache.put(stage, ingest_keys[i], partial)
+        cache.record(stage, False, seconds)
+        partials[i] = (False, partial)
+
+    aggregates, merge_key = cache.run("merge", merge_partial_aggregates, [partial for _, partial in partials],
+                                      code=[merge_partial_aggregates, _sum_by_index, merge_hex_density, merge_value_sketches,
+                                            merge_crossfilter_cubes], upstream=ingest_keys)
+    county_boundaries, _ = cache.run("county_boundaries", make_county_boundaries, aggregates["county_stats"], geojson_file_path,
+                                     code=[make_county_boundaries, millions_billions], files=[geojson_file_path],
+                                     upstream=[merge_key])
+    summary_df, _ = cache.run("summary", make_summary_df, aggregates, upstream=[merge_key])
+
+    start = time.perf_counter()
+    save_processed_data(aggregates, county_boundaries, summary_df, output_dir)
+    cache.record("save", False, time.perf_counter() - start)
+
+    print(cache.format_report())
+    return cache
+
+
+def save_processed_data(aggregates, county_boundaries, summary_df, output_dir='data/processed'):
+    """
+    Saves the processed datasets of the dashboard.
+
+    Parameters
+    ----------
+    aggregates : dict
+        The output of `merge_partial_aggregates`.
+    county_boundaries : geopandas.GeoDataFrame
+        The output of `make_county_boundaries`.
+    summary_df : pd.DataFrame
+        The output of `make_summary_df`.
+    output_dir : str, optional
+        Where to save the processed data (default is 'data/processed').
+
+    Returns
+    -------
+    None
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Save county statistics and boundaries separately so the app can load them without geopandas
+    save_county_boundaries(county_boundaries,
+                           os.path.join(output_dir, 'county_stats.pkl'),
+                           os.path.join(output_dir, 'county_boundaries.geojson'))
+
+    # Global variables are created here (Should be updated whenever dataset is updated)
+    counties = sorted(aggregates["counties"])
+    min_year = aggregates["min_date"].year
+    max_year = aggregates["max_date"].year
+    incidents = sorted(aggregates["incidents"])
+
+    # Saving the global variables:
+    with open(os.path.join(output_dir, 'global_vars.pkl'), 'wb') as f:
+        pickle.dump([counties, min_year, max_year, incidents], f)
+
+    with open(os.path.join(output_dir, 'timeseries_rollups.pkl'), 'wb') as f:
+        pickle.dump(aggregates["timeseries_rollups"], f)
+
+    with open(os.path.join(output_dir, 'hex_density.pkl'), 'wb') as f:
+        pickle.dump(aggregates["hex_density"], f)
+
+    with open(os.path.join(output_dir, 'value_sketches.pkl'), 'wb') as f:
+        pickle.dump(aggregates["value_sketches"], f)
+
+    with open(os.path.join(output_dir, 'crossfilter_cube.pkl'), 'wb') as f:
+        pickle.dump(aggregates["crossfilter_cube"], f)
+
+    # Keep the cleaned per-structure records for drill-down queries (see structure_store.py)
+    StructureStore.from_frame(aggregates["structures"]).save(os.path.join(output_dir, 'structures.npz'))
 
     #Save pandas dataframe as csv
-    summary_df.to_csv('data/processed/processed_cal_fire.csv', index=False)
+    summary_df.to_csv(os.path.join(output_dir, 'processed_cal_fire.csv'), index=False)
     
     # Saving df to serialized pickle file for faster reading
-    with open('data/processed/processed_cal_fire.pkl', 'wb') as f:
+    with open(os.path.join(output_dir, 'processed_cal_fire.pkl'), 'wb') as f:
         pickle.dump(summary_df, f)
 
 
-
 if __name__ == '__main__':
-    load_calfire_df()
+    parser = argparse.ArgumentParser(description="Clean and aggregate the raw DINS data for the dashboard.")
+    parser.add_argument("raw_paths", nargs="*", default=[RAW_DATA_PATH],
+                        help="raw CSV files, directories or glob patterns (default %(default)s)")
+    parser.add_argument("--workers", type=int, help="worker processes (default one per CPU)")
+    parser.add_argument("--region", help="write the partition of another region than California to %s/REGION" % REGIONS_DIR)
+    parser.add_argument("--geojson", default=GEOJSON_PATH, help="county boundaries of the region (default %(default)s)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="stage cache directory (default %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help="recompute every stage")
+    args = parser.parse_args()
+
+    output_dir = os.path.join(REGIONS_DIR, args.region) if args.region and args.region != "california" else 'data/processed'
+    load_calfire_df(args.raw_paths, workers=args.workers, output_dir=output_dir, geojson_file_path=args.geojson,
+                    cache_dir=None if args.no_cache else args.cache_dir)
 
 # columns = ['* Damage', '* City', 'County', '* Incident Name', 'Incident Number (e.g. CAAEU 123456)', 'Incident Start Date', '* Structure Type',
 #    'Structure Category', '* Roof Construction', '* Eaves', '* Vent Screen', '* Exterior Siding', '* Window Pane',
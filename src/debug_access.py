@@ -0,0 +1,64 @@
+"""
+Access Control of the Debug Endpoints
+
+The debug endpoints of the app server (`/debug/memory`, `/debug/slow-requests` and
+`/debug/profiles`) expose request bodies, allocation sites and profiles of the worker, so they
+are only served to requests carrying the token of the `CALFIRE_DEBUG_TOKEN` environment
+variable, and do not exist at all when it is not set.
+
+Configuration
+-------------
+CALFIRE_DEBUG_TOKEN : str
+    Token expected in the `X-Debug-Token` header or the `token` query parameter.
+"""
+
+import functools
+import hmac
+import os
+
+from flask import abort, request
+
+
+def has_debug_token():
+    """Returns whether the request carries the token of `CALFIRE_DEBUG_TOKEN` (always `False` when it is not set)."""
+    expected = os.environ.get("CALFIRE_DEBUG_TOKEN")
+    if not expected:
+        return False
+    given = request.headers.get("X-Debug-Token") or request.args.get("token") or ""
+    return hmac.compare_digest(given.encode(), expected.encode())
+
+
+def debug_token_required(view):
+    """
+    Protects a debug endpoint with the token in the `CALFIRE_DEBUG_TOKEN` environment variable.
+
+    The token can be sent in the `X-Debug-Token` header or the `token` query parameter.
+    When no token is configured the endpoint behaves as if it did not exist (404), so debug
+    endpoints are never exposed by accident.
+
+    Parameters
+    ----------
+    view : callable
+        The Flask view function to protect.
+
+    Returns
+    -------
+    callable
+        The protected view function.
+
+    Examples
+    --------
+    >>> @server.route("/debug/example")
+    ... @debug_token_required
+    ... def example():
+    ...     return {}
+    """
+    @functools.wraps(view)
+    def protected_view(*args, **kwargs):
+        if not os.environ.get("CALFIRE_DEBUG_TOKEN"):
+            abort(404)
+        if not has_debug_token():
+            abort(403)
+        return view(*args, **kwargs)
+
+    return protected_view
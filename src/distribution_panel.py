@@ -0,0 +1,60 @@
+"""
+Distribution Panel of Assessed Values
+
+Shows percentiles of the assessed improved value per structure for the dashboard filters. They
+are estimated by merging the quantile sketches written by `data_import.py` (see
+`value_sketches.py`), so the panel is as fast for the whole state as for one incident, and every
+estimate is within the relative accuracy of the sketches (1%) of the exact percentile.
+
+Examples
+--------
+>>> make_distribution_panel(county=["Butte"], year=[2017, 2020])
+"""
+
+from dash import html
+import dash_bootstrap_components as dbc
+
+from .data import value_sketches
+from .value_sketches import PERCENTILES, ValueDistribution
+
+PERCENTILE_LABELS = {0.1: "P10", 0.25: "P25", 0.5: "Median", 0.75: "P75", 0.9: "P90", 0.99: "P99"}
+
+# None until data_import.py has written value_sketches.pkl
+value_distribution = ValueDistribution(value_sketches) if value_sketches is not None else None
+
+
+def make_distribution_panel(county=None, year=None, incident_name=None, distribution=None):
+    """
+    Builds the content of the distribution panel for a filter state.
+
+    Parameters
+    ----------
+    county, year, incident_name
+        The filters, see `ValueDistribution.quantiles`.
+    distribution : ValueDistribution, optional
+        The sketches to query (default is the ones of the loaded dataset).
+
+    Returns
+    -------
+    list or str
+        The table of percentiles and a note on their accuracy, or a message when no structure
+        matches the filters or the sketches have not been built.
+    """
+    distribution = distribution or value_distribution
+    if distribution is None:
+        return "Percentiles are not available for this dataset"
+
+    result = distribution.quantiles(county, year, incident_name, PERCENTILES)
+    if not result["count"]:
+        return "No Data Available"
+
+    return [
+        dbc.Table([
+            html.Thead(html.Tr([html.Th(PERCENTILE_LABELS[q], style={"textAlign": "center"}) for q in PERCENTILES])),
+            html.Tbody(html.Tr([html.Td(f'${result["quantiles"][q]:,.0f}', style={"textAlign": "center"})
+                                for q in PERCENTILES]))],
+            bordered=False, size="sm", style={"marginBottom": "5px"}),
+        html.P(f'{result["count"]:,} structures. Percentiles are estimated within '
+               f'±{distribution.alpha:.0%} of the exact values.',
+               style={"textAlign": "center", "fontSize": "12px", "marginBottom": 0}),
+    ]
@@ -0,0 +1,224 @@
+"""
+Slow Request Flight Recorder
+
+Every worker keeps the last `CALFIRE_SLOW_BUFFER_SIZE` (default 100) calls of the chart callbacks
+(`update_filters`, `update_roof_chart`, ...) that took longer than `CALFIRE_SLOW_THRESHOLD_MS` (default 1000) in a ring buffer. Each entry has:
+
+- the time, duration and pid of the worker,
+- the normalized filter state (see `chart_render.normalize_filters`) and the triggering input,
+- the time spent in every stage of the call (filtering the data or waiting for another callback
+  to filter it, the chart, the summary),
+- the size in bytes of every output,
+- the JSON body of the Dash request, to replay it exactly.
+
+Stage timings are taken on every call (two `perf_counter` calls per stage), everything else is
+only computed for the calls kept. `/debug/slow-requests` (protected by the debug token, see
+`debug_access`) dumps the buffer of the worker that answers, and
+`benchmarks/replay_slow_requests.py` replays the recorded requests against a local server.
+
+Configuration
+-------------
+CALFIRE_SLOW_THRESHOLD_MS : float
+    Calls slower than this are recorded (default 1000).
+CALFIRE_SLOW_BUFFER_SIZE : int
+    Number of calls kept per worker (default 100).
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .debug_access import debug_token_required
+
+SLOW_THRESHOLD_MS = float(os.environ.get("CALFIRE_SLOW_THRESHOLD_MS", 1000))
+SLOW_BUFFER_SIZE = int(os.environ.get("CALFIRE_SLOW_BUFFER_SIZE", 100))
+
+_stage_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+class FlightRecorder:
+    """
+    Thread-safe ring buffer of slow calls.
+
+    Parameters
+    ----------
+    threshold_ms : float, optional
+        Calls slower than this are recorded (default is `CALFIRE_SLOW_THRESHOLD_MS`, or 1000).
+    size : int, optional
+        Number of calls kept (default is `CALFIRE_SLOW_BUFFER_SIZE`, or 100).
+    """
+
+    def __init__(self, threshold_ms=SLOW_THRESHOLD_MS, size=SLOW_BUFFER_SIZE):
+        self.threshold_ms = threshold_ms
+        self.recorded = 0
+        self.errors = 0
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        """Appends an entry, dropping the oldest one when the buffer is full."""
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+
+    def entries(self):
+        """Returns the entries, oldest first."""
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        """Empties the buffer."""
+        with self._lock:
+            self._entries.clear()
+
+    def dump(self):
+        """Returns the buffer and its settings as a JSON-serializable dict."""
+        with self._lock:
+            return {"pid": os.getpid(), "threshold_ms": self.threshold_ms, "size": self._entries.maxlen,
+                    "recorded": self.recorded,
+                    "errors": self.errors, "entries": list(self._entries)}
+
+
+flight_recorder = FlightRecorder()
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a stage of the call being recorded, does nothing outside of a recorded call.
+
+    Examples
+    --------
+    >>> with stage("summary"):
+    ...     total_cost = make_summary_chart(calfire_df)
+    """
+    timings = _stage_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def _payload_sizes(outputs, names):
+    from plotly.utils import PlotlyJSONEncoder
+
+    if isinstance(outputs, dict):
+        # The callbacks answering chart requests return their outputs by name
+        outputs = outputs.get("outputs", {})
+        return {name: len(json.dumps(outputs[name], cls=PlotlyJSONEncoder)) for name in names if name in outputs}
+    return {name: len(json.dumps(output, cls=PlotlyJSONEncoder)) for name, output in zip(names, outputs)}
+
+
+def _triggered_id():
+    from dash import ctx
+
+    try:
+        return ctx.triggered_id
+    except Exception:
+        # Called outside of a Dash callback
+        return None
+
+
+def _request_body():
+    from flask import has_request_context, request
+
+    return request.get_json(silent=True) if has_request_context() else None
+
+
+def _slow_call_entry(func, args, kwargs, outputs, output_names, filter_state, duration_ms, timings):
+    try:
+        filters = filter_state(*args, **kwargs)
+    except Exception:
+        # The request body is still kept
+        filters = None
+    return {
+        "time": time.time(),
+        "pid": os.getpid(),
+        "callback": func.__name__,
+        "duration_ms": round(duration_ms, 2),
+        "filters": filters,
+        # Callbacks run from another callback are given their trigger explicitly
+        "trigger": kwargs.get("trigger") or _triggered_id(),
+        "stages_ms": timings,
+        "payload_bytes": _payload_sizes(outputs, output_names),
+        "request": _request_body(),
+    }
+
+
+def record_slow_calls(output_names, filter_state, recorder=None):
+    """
+    Decorator recording the calls of a Dash callback slower than the recorder's threshold.
+
+    Parameters
+    ----------
+    output_names : list of str
+        Names of the outputs returned by the callback, used for the payload sizes.
+    filter_state : callable
+        Takes the arguments of the callback and returns its normalized filter state.
+    recorder : FlightRecorder, optional
+        Where to record the calls (default is the recorder of this worker).
+
+    Examples
+    --------
+    >>> @record_slow_calls(["summary_card", ...], lambda chart_request: normalize_filters(...))
+    ... def update_filters(chart_request):
+    ...     ...
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = {}
+            token = _stage_timings.set(timings)
+            start = time.perf_counter()
+            try:
+                outputs = func(*args, **kwargs)
+            finally:
+                _stage_timings.reset(token)
+            duration_ms = (time.perf_counter() - start) * 1000
+
+            target = recorder or flight_recorder
+            if duration_ms >= target.threshold_ms:
+                # Recording must never fail the call, the outputs are returned whatever happens here
+                try:
+                    target.add(_slow_call_entry(func, args, kwargs, outputs, output_names, filter_state,
+                                                duration_ms, timings))
+                except Exception as error:
+                    target.errors += 1
+                    print(f"[{os.getpid()}] Slow call of {func.__name__} not recorded: {error!r}", flush=True)
+            return outputs
+
+        return wrapper
+
+    return decorator
+
+
+def register_flight_recorder_routes(server):
+    """
+    Adds the `/debug/slow-requests` endpoint to the Flask server.
+
+    It returns the slow calls recorded by the worker that answers. `?clear=1` empties the buffer
+    after reading it.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    """
+    from flask import request
+
+    @server.route("/debug/slow-requests")
+    @debug_token_required
+    def slow_requests():
+        dump = flight_recorder.dump()
+        if request.args.get("clear") == "1":
+            flight_recorder.clear()
+        return dump
@@ -0,0 +1,247 @@
+"""
+Multi-Resolution Hexagonal Grid for Structure Density
+
+Structures are binned on pointy-top hexagonal grids in Web Mercator meters at several
+resolutions, each with half the cell size of the previous one. `data_import.py` precomputes the
+structure counts and damage mix of every (cell, county, year) at every resolution, all
+vectorized with NumPy, so the map only has to filter and sum the cells in view.
+
+Resolutions
+-----------
+Resolution 0 cells have a circumradius of 64 km, resolution 5 cells of 2 km. The map picks one
+with `choose_resolution` from the extent in view, coarse for the whole state and finer as it
+zooms in or narrows to a few counties.
+
+Examples
+--------
+>>> hex_density = aggregate_hex_density(calfire_df)
+>>> resolution = choose_resolution((-124.4, 32.5, -114.1, 42.0))
+>>> cells = hexes_in_view(hex_density[resolution], resolution, (-124.4, 32.5, -114.1, 42.0))
+"""
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6378137.0
+RESOLUTION_SIZES_M = [64000, 32000, 16000, 8000, 4000, 2000]
+DAMAGE_COLUMNS = ["No Damage", "Affected (1-9%)", "Minor (10-25%)", "Major (26-50%)", "Destroyed (>50%)"]
+SQRT3 = np.sqrt(3)
+
+
+def lonlat_to_mercator(lon, lat):
+    """Projects longitudes and latitudes in degrees to Web Mercator meters."""
+    lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+    x = EARTH_RADIUS_M * np.radians(lon)
+    y = EARTH_RADIUS_M * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    return x, y
+
+
+def mercator_to_lonlat(x, y):
+    """Converts Web Mercator meters back to longitudes and latitudes in degrees."""
+    lon = np.degrees(np.asarray(x, dtype=float) / EARTH_RADIUS_M)
+    lat = np.degrees(2 * np.arctan(np.exp(np.asarray(y, dtype=float) / EARTH_RADIUS_M)) - np.pi / 2)
+    return lon, lat
+
+
+def hex_cells(lon, lat, resolution):
+    """
+    Returns the axial coordinates of the cells containing the given points.
+
+    Parameters
+    ----------
+    lon, lat : array-like
+        Coordinates in degrees.
+    resolution : int
+        Index in `RESOLUTION_SIZES_M`.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        The q and r axial coordinates of every point.
+    """
+    size = RESOLUTION_SIZES_M[resolution]
+    x, y = lonlat_to_mercator(lon, lat)
+    q = (SQRT3 / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+
+    # Cube rounding: round all three cube coordinates and fix the one with the largest error
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def hex_centers(q, r, resolution):
+    """Returns the longitude and latitude of the centers of the given cells."""
+    size = RESOLUTION_SIZES_M[resolution]
+    q, r = np.asarray(q, dtype=float), np.asarray(r, dtype=float)
+    return mercator_to_lonlat(size * SQRT3 * (q + r / 2), size * 1.5 * r)
+
+
+def hex_polygon(q, r, resolution):
+    """Returns the closed ring of (lon, lat) vertices of one cell."""
+    size = RESOLUTION_SIZES_M[resolution]
+    center_x, center_y = size * SQRT3 * (q + r / 2), size * 1.5 * r
+    angles = np.radians(60 * np.arange(7) - 30)
+    lon, lat = mercator_to_lonlat(center_x + size * np.cos(angles), center_y + size * np.sin(angles))
+    return [[round(float(x), 5), round(float(y), 5)] for x, y in zip(lon, lat)]
+
+
+def aggregate_hex_density(calfire_df, resolutions=range(len(RESOLUTION_SIZES_M))):
+    """
+    Counts structures and their damage mix per cell, county and year at every resolution.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame
+        Structure-level records with "Longitude", "Latitude", "County", "Year" and "Damage".
+        Records without coordinates are skipped.
+    resolutions : iterable of int, optional
+        Resolutions to compute (default is all of them).
+
+    Returns
+    -------
+    dict of pd.DataFrame
+        For every resolution, the columns "q", "r", "County", "Year", "Count" and one count
+        column per damage level in `DAMAGE_COLUMNS`.
+    """
+    located = calfire_df.dropna(subset=["Longitude", "Latitude"])
+    located = located[located["Longitude"].between(-180, 180) & located["Latitude"].between(-85, 85)]
+
+    damage_codes = pd.Categorical(located["Damage"], categories=DAMAGE_COLUMNS).codes
+    county_codes, counties = pd.factorize(located["County"], sort=True)
+    years = located["Year"].to_numpy(dtype=np.int64)
+
+    hex_density = {}
+    for resolution in resolutions:
+        q, r = hex_cells(located["Longitude"].to_numpy(), located["Latitude"].to_numpy(), resolution)
+        keys = np.stack([q, r, county_codes, years], axis=1)
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+
+        cells = pd.DataFrame({"q": unique_keys[:, 0], "r": unique_keys[:, 1],
+                              "County": np.asarray(counties, dtype=object)[unique_keys[:, 2]] if len(counties) else [],
+                              "Year": unique_keys[:, 3]})
+        cells["Count"] = np.bincount(inverse, minlength=len(unique_keys))
+        for code, damage in enumerate(DAMAGE_COLUMNS):
+            cells[damage] = np.bincount(inverse, weights=damage_codes == code, minlength=len(unique_keys)).astype(np.int64)
+        hex_density[resolution] = cells
+    return hex_density
+
+
+def merge_hex_density(partials):
+    """Sums the cell counts of several `aggregate_hex_density` outputs."""
+    return {resolution: pd.concat([partial[resolution] for partial in partials])
+                          .groupby(["q", "r", "County", "Year"], as_index=False).sum()
+            for resolution in partials[0]}
+
+
+def choose_resolution(bounds, max_cells=1500):
+    """
+    Picks the finest resolution that keeps the number of cells in view under a budget.
+
+    Parameters
+    ----------
+    bounds : tuple of float
+        The view as (min_lon, min_lat, max_lon, max_lat).
+    max_cells : int, optional
+        The largest number of cells that would tile the view (default is 1500).
+
+    Returns
+    -------
+    int
+        The resolution.
+    """
+    min_x, min_y = lonlat_to_mercator(bounds[0], bounds[1])
+    max_x, max_y = lonlat_to_mercator(bounds[2], bounds[3])
+    view_area = abs(float(max_x - min_x) * float(max_y - min_y))
+    for resolution in reversed(range(len(RESOLUTION_SIZES_M))):
+        cell_area = 1.5 * SQRT3 * RESOLUTION_SIZES_M[resolution] ** 2
+        if view_area / cell_area <= max_cells:
+            return resolution
+    return 0
+
+
+def hexes_in_view(cells, resolution, bounds, counties=None, years=None):
+    """
+    Sums the cells of one resolution whose centers are in view, over counties and years.
+
+    Parameters
+    ----------
+    cells : pd.DataFrame
+        One resolution of `aggregate_hex_density`.
+    resolution : int
+        The resolution of `cells`.
+    bounds : tuple of float
+        The view as (min_lon, min_lat, max_lon, max_lat).
+    counties : list of str, optional
+        Only count structures in these counties.
+    years : list of int, optional
+        Only count structures in this inclusive [first, last] year range.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per cell with "q", "r", "lon", "lat", "Count" and the damage columns.
+    """
+    if counties:
+        cells = cells[cells["County"].isin(counties)]
+    if years:
+        cells = cells[cells["Year"].between(years[0], years[1])]
+
+    cells = cells.groupby(["q", "r"], as_index=False)[["Count"] + DAMAGE_COLUMNS].sum()
+    cells["lon"], cells["lat"] = hex_centers(cells["q"], cells["r"], resolution)
+    in_view = (cells["lon"].between(bounds[0], bounds[2]) & cells["lat"].between(bounds[1], bounds[3]))
+    return cells[in_view & (cells["Count"] > 0)].reset_index(drop=True)
+
+
+def zoomed_bounds(bounds, scale=None, center_lon=None, center_lat=None):
+    """
+    Returns the part of `bounds` in view after zooming in by `scale` around a center.
+
+    Parameters
+    ----------
+    bounds : tuple of float
+        The unzoomed view as (min_lon, min_lat, max_lon, max_lat).
+    scale : float, optional
+        The zoom factor, e.g. the "geo.projection.scale" of the map's relayoutData.
+    center_lon, center_lat : float, optional
+        The center of the view (default is the center of `bounds`).
+
+    Returns
+    -------
+    tuple of float
+        The view as (min_lon, min_lat, max_lon, max_lat).
+    """
+    if center_lon is None:
+        center_lon = (bounds[0] + bounds[2]) / 2
+    if center_lat is None:
+        center_lat = (bounds[1] + bounds[3]) / 2
+    scale = max(scale or 1, 1)
+    half_width = (bounds[2] - bounds[0]) / 2 / scale
+    half_height = (bounds[3] - bounds[1]) / 2 / scale
+    return (center_lon - half_width, center_lat - half_height, center_lon + half_width, center_lat + half_height)
+
+
+def geojson_bounds(features):
+    """Returns the (min_lon, min_lat, max_lon, max_lat) of GeoJSON features, or `None` if they have no coordinates."""
+    coordinates = []
+
+    def collect(value):
+        if isinstance(value, (list, tuple)) and value and isinstance(value[0], (int, float)):
+            coordinates.append(value[:2])
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                collect(item)
+
+    for feature in features:
+        if feature.get("geometry"):
+            collect(feature["geometry"]["coordinates"])
+    if not coordinates:
+        return None
+    points = np.asarray(coordinates, dtype=float)
+    return (float(points[:, 0].min()), float(points[:, 1].min()), float(points[:, 0].max()), float(points[:, 1].max()))
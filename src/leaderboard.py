@@ -0,0 +1,148 @@
+"""
+Precomputed County Leaderboards
+
+The structure and time series charts show the K counties with the most damaged structures or
+the highest economic loss over the selected years. Instead of regrouping the filtered data on
+every request, `CountyLeaderboard` keeps, for every measure:
+
+- the total of every county in every year, with cumulative sums over the years so the total
+  of a county over any year range is one subtraction,
+- for every year, the counties sorted by their total in that year.
+
+The top K counties over years [a, b] are found with a bounded merge of the sorted lists of
+years a to b (the threshold algorithm): the lists are read in lockstep, and the merge stops as
+soon as the K-th best county seen so far beats the sum of the current list heads, which bounds
+the total of every county not seen yet. For K much smaller than the number of counties only
+the first few entries of every list are read, and a different K costs nothing extra.
+
+Examples
+--------
+>>> leaderboard = CountyLeaderboard.from_summary(calfire_df)
+>>> leaderboard.top("Structures", 2015, 2020, k=10)
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .summary_columns import split_summary_columns
+
+MEASURES = ["Structures", "Total Economic Loss"]
+TOP_COUNTIES = int(os.environ.get("CALFIRE_TOP_COUNTIES", 10))
+
+
+class CountyLeaderboard:
+    """
+    Per-year, per-county totals sorted for top-K queries over year ranges.
+
+    Parameters
+    ----------
+    counties : list of str
+        The counties, sorted by name.
+    years : list of int
+        Consecutive years.
+    totals : dict of np.ndarray
+        For every measure, the total of every county (rows) in every year (columns).
+    rows : np.ndarray
+        The number of summary rows of every county in every year, a county only ranks over
+        a year range where it has rows.
+    """
+
+    def __init__(self, counties, years, totals, rows):
+        self.counties = list(counties)
+        self.years = list(years)
+        self.totals = totals
+        self.cumulative = {measure: np.concatenate([np.zeros((len(self.counties), 1)), np.cumsum(values, axis=1)], axis=1)
+                           for measure, values in totals.items()}
+        self.row_cumulative = np.concatenate([np.zeros((len(self.counties), 1), dtype=np.int64), np.cumsum(rows, axis=1)], axis=1)
+        # Counties sorted by decreasing total in every year, ties by name as the counties are sorted
+        self.sorted_counties = {measure: np.argsort(-values, axis=0, kind="stable") for measure, values in totals.items()}
+
+    @classmethod
+    def from_summary(cls, calfire_df):
+        """
+        Builds the leaderboards from the summary dataset of `data_import.py`.
+
+        Parameters
+        ----------
+        calfire_df : pd.DataFrame
+            One row per incident, year and county with the structure counts (see
+            `summary_columns.py`), "Year", "County" and "Total Economic Loss".
+
+        Returns
+        -------
+        CountyLeaderboard
+        """
+        _, structure_columns = split_summary_columns(calfire_df.columns)
+        counties = sorted(calfire_df["County"].unique())
+        years = list(range(int(calfire_df["Year"].min()), int(calfire_df["Year"].max()) + 1)) if len(calfire_df) else []
+        by_county_year = pd.DataFrame({
+            "County": calfire_df["County"],
+            "Year": calfire_df["Year"],
+            # Same structure columns as the structure chart
+            "Structures": calfire_df[structure_columns].sum(axis=1),
+            "Total Economic Loss": calfire_df["Total Economic Loss"],
+            "Rows": 1,
+        }).groupby(["County", "Year"]).sum()
+
+        full_index = pd.MultiIndex.from_product([counties, years], names=["County", "Year"])
+        by_county_year = by_county_year.reindex(full_index, fill_value=0)
+        shape = (len(counties), len(years))
+        totals = {measure: by_county_year[measure].to_numpy(dtype=np.float64).reshape(shape) for measure in MEASURES}
+        return cls(counties, years, totals, by_county_year["Rows"].to_numpy(dtype=np.int64).reshape(shape))
+
+    def _year_slice(self, first, last):
+        start = max(first - self.years[0], 0) if self.years else 0
+        stop = min(last - self.years[0] + 1, len(self.years)) if self.years else 0
+        return start, stop
+
+    def range_totals(self, measure, first, last):
+        """Returns the total of every county over the years [first, last]."""
+        start, stop = self._year_slice(first, last)
+        if start >= stop:
+            return np.zeros(len(self.counties))
+        return self.cumulative[measure][:, stop] - self.cumulative[measure][:, start]
+
+    def top(self, measure, first, last, k=TOP_COUNTIES):
+        """
+        Returns the K counties with the highest total over a year range.
+
+        Parameters
+        ----------
+        measure : str
+            One of "Structures" or "Total Economic Loss".
+        first, last : int
+            The inclusive year range.
+        k : int, optional
+            Number of counties (default is the `CALFIRE_TOP_COUNTIES` environment variable, or 10).
+
+        Returns
+        -------
+        list of str
+            The counties, highest total first, ties by name. Counties without any incident in
+            the year range are left out, so fewer than K counties can be returned.
+        """
+        start, stop = self._year_slice(first, last)
+        if start >= stop or k <= 0:
+            return []
+
+        totals = self.totals[measure][:, start:stop]
+        sorted_counties = self.sorted_counties[measure][:, start:stop]
+        range_totals = self.cumulative[measure][:, stop] - self.cumulative[measure][:, start]
+        present = (self.row_cumulative[:, stop] - self.row_cumulative[:, start]) > 0
+        year_columns = np.arange(stop - start)
+
+        seen = set()
+        for depth in range(len(self.counties)):
+            heads = sorted_counties[depth]
+            seen.update(int(county) for county in heads if present[county])
+            if len(seen) >= k:
+                # No county below the current heads can total more than the sum of the heads
+                threshold = totals[heads, year_columns].sum()
+                kth_best = sorted(range_totals[list(seen)], reverse=True)[k - 1]
+                if kth_best > threshold:
+                    break
+
+        ranked = sorted(seen, key=lambda county: (-range_totals[county], self.counties[county]))
+        return [self.counties[county] for county in ranked[:k]]
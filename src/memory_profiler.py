@@ -0,0 +1,277 @@
+"""
+Opt-in Memory Instrumentation
+
+This module tracks Python memory allocations with `tracemalloc` around data loading, chart
+construction and the dashboard callbacks, to find out what keeps the worker RSS growing
+(retained filtered frames, Altair objects or VegaFusion runtime state).
+
+Everything is disabled unless the `CALFIRE_MEMORY_PROFILE` environment variable is set to "1";
+otherwise `track_memory` and `profile_memory` are no-ops and cost nothing.
+
+Configuration
+-------------
+CALFIRE_MEMORY_PROFILE : str
+    Set to "1" to start `tracemalloc` when this module is imported.
+CALFIRE_MEMORY_FRAMES : int
+    Number of frames stored per allocation traceback (default 10).
+CALFIRE_MEMORY_SNAPSHOT_DIR : str
+    If set, a snapshot is dumped to this directory periodically for offline diffing with
+    `tracemalloc.Snapshot.load(...).compare_to(...)`.
+CALFIRE_MEMORY_SNAPSHOT_INTERVAL : float
+    Seconds between periodic snapshots (default 300).
+CALFIRE_DEBUG_TOKEN : str
+    Token protecting the `/debug/memory` endpoint (see `debug_access`).
+
+Notes
+-----
+`tracemalloc` peaks are process wide, so with several threads per worker the peak of a
+tracked block also includes whatever the other threads allocated at the same time.
+"""
+
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from .debug_access import debug_token_required
+
+_lock = threading.Lock()
+_stack = []
+memory_stats = {}
+snapshot_writer = None
+
+
+def is_enabled():
+    """Returns whether memory instrumentation is running."""
+    return tracemalloc.is_tracing()
+
+
+def enable(frames=10):
+    """
+    Starts tracing allocations.
+
+    Parameters
+    ----------
+    frames : int, optional
+        Number of frames stored per allocation traceback (default is 10).
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def disable():
+    """Stops tracing allocations and clears the collected statistics."""
+    tracemalloc.stop()
+    with _lock:
+        _stack.clear()
+        memory_stats.clear()
+
+
+def _update_peaks(peak):
+    for frame in _stack:
+        frame["peak"] = max(frame["peak"], peak)
+
+
+@contextmanager
+def track_memory(label):
+    """
+    Records the net and peak memory allocated by a block of code.
+
+    Blocks can be nested: the peak of an outer block includes the peaks of its inner blocks.
+
+    Parameters
+    ----------
+    label : str
+        Name under which the statistics are recorded, e.g. "chart:roof_chart".
+
+    Examples
+    --------
+    >>> with track_memory("data_loading"):
+    ...     calfire_df = pickle.load(f)
+    """
+    if not tracemalloc.is_tracing():
+        yield
+        return
+
+    with _lock:
+        current, peak = tracemalloc.get_traced_memory()
+        _update_peaks(peak)
+        tracemalloc.reset_peak()
+        frame = {"start": current, "peak": current}
+        _stack.append(frame)
+    try:
+        yield
+    finally:
+        with _lock:
+            current, peak = tracemalloc.get_traced_memory()
+            if frame in _stack:
+                _update_peaks(peak)
+                _stack.remove(frame)
+            stats = memory_stats.setdefault(label, {"calls": 0, "max_peak_kb": 0.0, "last_peak_kb": 0.0,
+                                                    "last_net_kb": 0.0, "total_net_kb": 0.0})
+            peak_kb = (frame["peak"] - frame["start"]) / 1024
+            net_kb = (current - frame["start"]) / 1024
+            stats["calls"] += 1
+            stats["last_peak_kb"] = round(peak_kb, 1)
+            stats["max_peak_kb"] = round(max(stats["max_peak_kb"], peak_kb), 1)
+            stats["last_net_kb"] = round(net_kb, 1)
+            stats["total_net_kb"] = round(stats["total_net_kb"] + net_kb, 1)
+
+
+def profile_memory(label):
+    """
+    Decorator version of `track_memory`.
+
+    The function is returned unchanged when instrumentation is disabled, so decorated
+    callbacks have no overhead in normal operation.
+
+    Parameters
+    ----------
+    label : str
+        Name under which the statistics are recorded.
+
+    Examples
+    --------
+    >>> @profile_memory("callback:update_filters")
+    ... def update_filters(chart_request):
+    ...     ...
+    """
+    def decorator(func):
+        if not tracemalloc.is_tracing():
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_memory(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def top_allocations(limit=20, group_by="lineno"):
+    """
+    Returns the source lines (or files) holding the most traced memory.
+
+    Parameters
+    ----------
+    limit : int, optional
+        Number of allocation sites to return (default is 20).
+    group_by : str, optional
+        "lineno", "filename" or "traceback" (default is "lineno").
+
+    Returns
+    -------
+    list of dict
+        The size in KB, allocation count and location of every site, largest first.
+    """
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    return [{"size_kb": round(stat.size / 1024, 1),
+             "count": stat.count,
+             "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]}
+            for stat in snapshot.statistics(group_by)[:limit]]
+
+
+def memory_report(limit=20):
+    """
+    Collects the current memory statistics.
+
+    Parameters
+    ----------
+    limit : int, optional
+        Number of top allocation sites to include (default is 20).
+
+    Returns
+    -------
+    dict
+        Whether tracing is enabled, the traced current and peak memory, the per-label
+        statistics and the top allocation sites.
+    """
+    if not tracemalloc.is_tracing():
+        return {"enabled": False}
+    current, peak = tracemalloc.get_traced_memory()
+    with _lock:
+        stats = {label: dict(values) for label, values in memory_stats.items()}
+    return {"enabled": True,
+            "pid": os.getpid(),
+            "traced_current_kb": round(current / 1024, 1),
+            "traced_peak_kb": round(peak / 1024, 1),
+            "tracked": stats,
+            "top_allocations": top_allocations(limit)}
+
+
+class SnapshotWriter(threading.Thread):
+    """
+    Background thread that periodically dumps `tracemalloc` snapshots to disk.
+
+    Files are named `<pid>-<unix time>.tracemalloc` and can be diffed offline, e.g.
+    `tracemalloc.Snapshot.load(new).compare_to(tracemalloc.Snapshot.load(old), "lineno")`.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to write the snapshots to, created if needed.
+    interval : float, optional
+        Seconds between snapshots (default is 300).
+    """
+
+    def __init__(self, directory, interval=300):
+        super().__init__(daemon=True, name="memory-snapshot-writer")
+        self.directory = directory
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        """Dumps one snapshot and returns its path."""
+        path = os.path.join(self.directory, f"{os.getpid()}-{int(time.time())}.tracemalloc")
+        tracemalloc.take_snapshot().dump(path)
+        return path
+
+    def stop(self):
+        self.stopped.set()
+
+
+def register_memory_routes(server):
+    """
+    Adds the `/debug/memory` endpoint to the Flask server.
+
+    The endpoint returns `memory_report` as JSON. The `limit` query parameter sets the
+    number of top allocation sites.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    """
+    from flask import request
+
+    @server.route("/debug/memory")
+    @debug_token_required
+    def debug_memory():
+        return memory_report(limit=request.args.get("limit", 20, type=int))
+
+
+def start_snapshot_writer():
+    """Starts the periodic snapshot writer if `CALFIRE_MEMORY_SNAPSHOT_DIR` is set."""
+    global snapshot_writer
+    directory = os.environ.get("CALFIRE_MEMORY_SNAPSHOT_DIR")
+    if directory and tracemalloc.is_tracing() and snapshot_writer is None:
+        snapshot_writer = SnapshotWriter(directory, float(os.environ.get("CALFIRE_MEMORY_SNAPSHOT_INTERVAL", 300)))
+        snapshot_writer.start()
+
+
+if os.environ.get("CALFIRE_MEMORY_PROFILE") == "1":
+    enable(int(os.environ.get("CALFIRE_MEMORY_FRAMES", 10)))
@@ -0,0 +1,258 @@
+"""
+Prometheus Metrics
+
+`/metrics` publishes the health of the dashboard in the Prometheus text format:
+
+- `calfire_callback_duration_seconds` (histogram, with `_count`) and
+  `calfire_callback_errors_total` for `update_filters`, the callback of every chart
+  (`update_roof_chart`, ...), `update_density_layer`, `update_value_distribution` and
+  `toggle_button`, and
+  `calfire_callbacks_in_progress`,
+- `calfire_chart_build_duration_seconds`, the time spent building the spec of every chart,
+- `calfire_response_size_bytes` and `calfire_requests_in_progress` per route (Dash callback
+  requests are labelled with their first output component),
+- `calfire_worker_rss_bytes`, the resident memory of every worker,
+- `calfire_time_to_first_chart_seconds` and `calfire_time_to_all_charts_seconds`, measured in
+  the browser from a filter change to the first and the last chart drawn, and reported to
+  `/metrics/client-timings` (labelled "cache" when served by the client-side cache),
+- `calfire_spec_cache_lookups_total`, the hits and misses of the persistent chart spec cache
+  (see `spec_cache.py`),
+- `calfire_dataset_info` (the hash of the summary dataset as the `version` label),
+  `calfire_dataset_modified_timestamp_seconds` and `calfire_dataset_age_seconds`.
+
+Gunicorn runs several worker processes, each with its own counters. When
+`CALFIRE_METRICS_DIR` (or `PROMETHEUS_MULTIPROC_DIR`) is set, the workers write their metrics
+to memory-mapped files in that directory and `/metrics` aggregates all of them, whichever
+worker answers the scrape. `gunicorn.conf.py` empties the directory when the server starts and
+cleans up after exited workers. Recording a sample only updates a memory-mapped value, and the
+worker RSS is read at most once per second.
+
+Configuration
+-------------
+CALFIRE_METRICS_DIR : str
+    Directory shared by the workers of one server, required for correct totals with several
+    gunicorn workers.
+"""
+
+import functools
+import os
+import time
+
+if os.environ.get("CALFIRE_METRICS_DIR") and not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    # prometheus_client picks the multiprocess mode when its metrics are created
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.environ["CALFIRE_METRICS_DIR"]
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000)
+RSS_INTERVAL = 1.0
+
+callback_duration = Histogram("calfire_callback_duration_seconds", "Time spent in a Dash callback.",
+                              ["callback"], buckets=LATENCY_BUCKETS)
+callback_errors = Counter("calfire_callback_errors_total", "Dash callbacks that raised an exception.", ["callback"])
+callbacks_in_progress = Gauge("calfire_callbacks_in_progress", "Dash callbacks running.", ["callback"],
+                              multiprocess_mode="livesum")
+chart_build_duration = Histogram("calfire_chart_build_duration_seconds", "Time spent building the spec of a chart.",
+                                 ["chart"], buckets=LATENCY_BUCKETS)
+response_size = Histogram("calfire_response_size_bytes", "Size of the response bodies.", ["route"], buckets=SIZE_BUCKETS)
+requests_in_progress = Gauge("calfire_requests_in_progress", "Requests being answered.", ["route"],
+                             multiprocess_mode="livesum")
+worker_rss = Gauge("calfire_worker_rss_bytes", "Resident memory of the worker process.", multiprocess_mode="liveall")
+client_timings = {
+    "first_chart": Histogram("calfire_time_to_first_chart_seconds",
+                             "Time from a filter change to the first chart drawn in the browser.", ["source"],
+                             buckets=LATENCY_BUCKETS),
+    "all_charts": Histogram("calfire_time_to_all_charts_seconds",
+                            "Time from a filter change to the last chart drawn in the browser.", ["source"],
+                            buckets=LATENCY_BUCKETS),
+}
+spec_cache_lookups = Counter("calfire_spec_cache_lookups_total", "Lookups in the persistent chart spec cache.", ["result"])
+CLIENT_SOURCES = ("server", "cache")
+MAX_CLIENT_SECONDS = 600
+
+_last_rss_update = 0.0
+
+
+def is_multiprocess():
+    """Returns whether the metrics are shared by the workers through `PROMETHEUS_MULTIPROC_DIR`."""
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def observe_callback(name):
+    """
+    Decorator recording the duration, errors and concurrency of a Dash callback.
+
+    Parameters
+    ----------
+    name : str
+        The `callback` label, e.g. "update_filters".
+
+    Examples
+    --------
+    >>> @observe_callback("update_filters")
+    ... def update_filters(chart_request):
+    ...     ...
+    """
+    def decorator(func):
+        duration = callback_duration.labels(name)
+        errors = callback_errors.labels(name)
+        in_progress = callbacks_in_progress.labels(name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            in_progress.inc()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                duration.observe(time.perf_counter() - start)
+                in_progress.dec()
+
+        return wrapper
+
+    return decorator
+
+
+def read_rss():
+    """Returns the resident memory of this process in bytes, or `None` where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def update_worker_rss(now=None):
+    """Updates `calfire_worker_rss_bytes` if it is older than `RSS_INTERVAL`."""
+    global _last_rss_update
+    now = time.monotonic() if now is None else now
+    if now - _last_rss_update < RSS_INTERVAL:
+        return
+    _last_rss_update = now
+    rss = read_rss()
+    if rss is not None:
+        worker_rss.set(rss)
+
+
+class DatasetCollector:
+    """Reports the version and age of the loaded dataset when the metrics are scraped."""
+
+    def collect(self):
+        from .data import dataset_version, dataset_modified
+
+        info = GaugeMetricFamily("calfire_dataset_info", "The loaded summary dataset.", labels=["version"])
+        info.add_metric([dataset_version], 1)
+        yield info
+        yield GaugeMetricFamily("calfire_dataset_modified_timestamp_seconds",
+                                "Modification time of the loaded summary dataset.", value=dataset_modified)
+        yield GaugeMetricFamily("calfire_dataset_age_seconds", "Age of the loaded summary dataset.",
+                                value=time.time() - dataset_modified)
+
+
+class _DefaultRegistry:
+    # Exposes the metrics of this process (and the default process and GC metrics) to a per-scrape registry
+    def collect(self):
+        return REGISTRY.collect()
+
+
+def collect_metrics():
+    """
+    Returns the metrics of this worker, or of every worker in multiprocess mode.
+
+    Returns
+    -------
+    bytes
+        The metrics in the Prometheus text format.
+    """
+    update_worker_rss()
+    registry = CollectorRegistry()
+    if is_multiprocess():
+        from prometheus_client import multiprocess
+
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(_DefaultRegistry())
+    registry.register(DatasetCollector())
+    return generate_latest(registry)
+
+
+def observe_client_timing(timing):
+    """
+    Records a latency measured in the browser.
+
+    Parameters
+    ----------
+    timing : dict
+        The "metric" (a key of `client_timings`), the "seconds" and the "source" ("server" or "cache").
+
+    Returns
+    -------
+    bool
+        Whether the timing was valid and recorded.
+    """
+    if not isinstance(timing, dict):
+        return False
+    histogram = client_timings.get(timing.get("metric"))
+    seconds = timing.get("seconds")
+    if histogram is None or timing.get("source") not in CLIENT_SOURCES or isinstance(seconds, bool) \
+            or not isinstance(seconds, (int, float)) or not 0 <= seconds <= MAX_CLIENT_SECONDS:
+        return False
+    histogram.labels(timing["source"]).observe(seconds)
+    return True
+
+
+def route_label(request):
+    """Returns the route of a request, or "callback:<first output component>" for Dash callbacks."""
+    if request.url_rule is None:
+        return "unmatched"
+    if request.url_rule.rule.endswith("/_dash-update-component"):
+        # "..roof_chart.spec...damage_chart.spec.." or "info.is_open"
+        output = (request.get_json(silent=True) or {}).get("output", "")
+        return "callback:" + output.lstrip(".").split(".", 1)[0]
+    return request.url_rule.rule
+
+
+def register_metrics_routes(server):
+    """
+    Adds the `/metrics` and `/metrics/client-timings` endpoints and the per-request metrics to the Flask server.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    """
+    from flask import Response, g, request
+
+    @server.before_request
+    def start_request():
+        g.metrics_route = route_label(request)
+        requests_in_progress.labels(g.metrics_route).inc()
+
+    @server.after_request
+    def record_response(response):
+        if not response.direct_passthrough and "metrics_route" in g:
+            response_size.labels(g.metrics_route).observe(response.calculate_content_length() or 0)
+        update_worker_rss()
+        return response
+
+    @server.teardown_request
+    def end_request(exception=None):
+        if "metrics_route" in g:
+            requests_in_progress.labels(g.pop("metrics_route")).dec()
+
+    @server.route("/metrics")
+    def metrics():
+        return Response(collect_metrics(), mimetype=CONTENT_TYPE_LATEST)
+
+    @server.route("/metrics/client-timings", methods=["POST"])
+    def record_client_timing():
+        # Sent with navigator.sendBeacon, which posts text/plain
+        if not observe_client_timing(request.get_json(force=True, silent=True)):
+            return {"error": "Expected a metric, a source and a number of seconds"}, 400
+        return "", 204
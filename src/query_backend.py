@@ -0,0 +1,346 @@
+"""
+Query Backends of the Dashboard Charts
+
+The charts of a filter state are built from the filtered data of `ChartDataCache`, which asks
+a query backend for it:
+
+- `PandasBackend` (the default) filters the summary dataset in memory with pandas, see
+  `chart_specs.prepare_chart_data`.
+- `DuckDBBackend` loads the summary dataset and the time series rollups into DuckDB, an
+  embedded analytical SQL engine running in the worker process, and returns the aggregates of
+  a filter state (the sums per County x Year, and per County x period for the time series)
+  from parameterized SQL queries. The sums come from a long copy of the summary dataset with
+  one row per value, a single SUM is several times faster in DuckDB than one per column. The
+  chart builders work on these aggregates unchanged, so both backends draw the same charts
+  (see `tests/test_query_backend.py`).
+
+The DuckDB database is in memory by default. With `CALFIRE_QUERY_DATABASE` set to a file, the
+first worker writes the tables to it, and every worker opens it read-only. The file is
+rewritten when the dataset version changes. The tables can also be queried directly:
+
+Examples
+--------
+>>> backend = DuckDBBackend(default_region)
+>>> backend.query('SELECT "County", SUM("Total Economic Loss") AS loss FROM summary '
+...               'WHERE "Year" >= ? GROUP BY 1 ORDER BY loss DESC LIMIT 5', [2018])
+
+Tables
+------
+summary
+    The summary dataset, with the roof x damage columns named "Roof: Damage", e.g.
+    "Asphalt: A. No Damage".
+summary_values
+    The same data with one row per "Incident Name", "Year", "County" and "Column" (the
+    position of the column among the summed ones) and its "Value", sorted by year and county.
+    Zero values are left out, except for the economic loss.
+timeseries_month, timeseries_week
+    The time series rollups written by `data_import.py`.
+dataset
+    The version of the loaded dataset.
+
+Configuration
+-------------
+CALFIRE_QUERY_BACKEND : str
+    "pandas" (default) or "duckdb".
+CALFIRE_QUERY_DATABASE : str
+    The DuckDB database, ":memory:" (default) or the path of a file.
+"""
+
+import fcntl
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype
+
+from .chart_specs import ChartData, leaderboard_top_counties, prepare_chart_data
+
+QUERY_BACKEND = os.environ.get("CALFIRE_QUERY_BACKEND", "pandas")
+QUERY_DATABASE = os.environ.get("CALFIRE_QUERY_DATABASE", ":memory:")
+SUMMARY_TABLE = "summary"
+VALUES_TABLE = "summary_values"
+TIMESERIES_TABLES = {"Month": "timeseries_month", "Week": "timeseries_week"}
+GROUP_COLUMNS = ["Incident Name", "Year", "County"]
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def sql_name(column):
+    """Returns the SQL column name of a summary column, "Roof: Damage" for the roof x damage columns."""
+    return ": ".join(column) if isinstance(column, tuple) else column
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class PandasBackend:
+    """
+    Filters the summary dataset of a region with pandas.
+
+    Parameters
+    ----------
+    region_data : RegionData
+        The datasets of the region.
+    """
+
+    name = "pandas"
+
+    def __init__(self, region_data):
+        self.region_data = region_data
+
+    def chart_data(self, county=None, year=None, incident_name=None, granularity="Year"):
+        """
+        Returns the filtered data of a filter state.
+
+        Parameters
+        ----------
+        county, year, incident_name, granularity
+            See `chart_specs.make_chart_specs`.
+
+        Returns
+        -------
+        ChartData
+        """
+        return prepare_chart_data(self.region_data.calfire_df, county, year, incident_name, granularity,
+                                  self.region_data)
+
+
+class DuckDBBackend:
+    """
+    Aggregates the summary dataset of a region with SQL queries in an embedded DuckDB database.
+
+    Connections are not shared by threads, every query runs on its own cursor.
+
+    Parameters
+    ----------
+    region_data : RegionData
+        The datasets of the region.
+    database : str, optional
+        ":memory:" or the path of a database file (default is `CALFIRE_QUERY_DATABASE`).
+
+    Raises
+    ------
+    ImportError
+        If DuckDB is not installed.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, region_data, database=None):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("CALFIRE_QUERY_BACKEND=duckdb needs the duckdb package (pip install duckdb)") from e
+        self.region_data = region_data
+        self.database = database or QUERY_DATABASE
+        calfire_df = region_data.calfire_df
+        self.columns = list(calfire_df.columns)
+        # Everything but the filter columns is summed
+        self.value_columns = [column for column in self.columns if column not in GROUP_COLUMNS]
+        self.integer_columns = {column for column in self.value_columns if is_integer_dtype(calfire_df[column])}
+        self.value_dtype = np.int64 if len(self.integer_columns) == len(self.value_columns) else np.float64
+        self.granularities = [granularity for granularity in region_data.timeseries_rollups
+                              if granularity in TIMESERIES_TABLES]
+        self._connection = self._connect(duckdb)
+
+    def _tables(self):
+        calfire_df = self.region_data.calfire_df
+        values = (calfire_df.rename(columns={column: i for i, column in enumerate(self.value_columns)})
+                  .melt(id_vars=GROUP_COLUMNS, var_name="Column", value_name="Value")
+                  .astype({"Column": np.int16, "Value": self.value_dtype}))
+        # Zeros add nothing to the sums, the economic loss is kept so that every County x Year has a row
+        loss = self.value_columns.index("Total Economic Loss")
+        values = values[(values["Value"] != 0) | (values["Column"] == loss)].sort_values(["Year", "County"], kind="stable")
+        tables = {SUMMARY_TABLE: calfire_df.rename(columns=sql_name), VALUES_TABLE: values}
+        for granularity in self.granularities:
+            tables[TIMESERIES_TABLES[granularity]] = self.region_data.timeseries_rollups[granularity]
+        return tables
+
+    def _load(self, connection):
+        for table, df in self._tables().items():
+            connection.register("frame", df)
+            connection.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM frame")
+            connection.unregister("frame")
+        connection.execute("CREATE OR REPLACE TABLE dataset AS SELECT ? AS version", [self.region_data.version])
+
+    def _stored_version(self, duckdb):
+        if not os.path.exists(self.database):
+            return None
+        try:
+            with duckdb.connect(self.database, read_only=True) as connection:
+                return connection.execute("SELECT version FROM dataset").fetchone()[0]
+        except duckdb.Error:
+            return None
+
+    def _connect(self, duckdb):
+        if self.database == ":memory:":
+            connection = duckdb.connect()
+            self._load(connection)
+            return connection
+
+        # The workers share the file, the first one to start after a data change rewrites it
+        with open(self.database + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self._stored_version(duckdb) != self.region_data.version:
+                partial = self.database + ".partial"
+                for path in (partial, partial + ".wal"):
+                    if os.path.exists(path):
+                        os.remove(path)
+                with duckdb.connect(partial) as connection:
+                    self._load(connection)
+                # Workers still reading the previous file keep it open until they restart
+                os.replace(partial, self.database)
+        return duckdb.connect(self.database, read_only=True)
+
+    def query(self, sql, params=None):
+        """
+        Runs a SQL query on the tables of the backend.
+
+        Parameters
+        ----------
+        sql : str
+            The query, with `?` placeholders.
+        params : list, optional
+            The values of the placeholders.
+
+        Returns
+        -------
+        pd.DataFrame
+        """
+        cursor = self._connection.cursor()
+        try:
+            return cursor.execute(sql, params or []).df()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _where(county=None, year=None, incident_name=None):
+        clauses, params = [], []
+        if year:
+            clauses.append('"Year" BETWEEN ? AND ?')
+            params += [int(year[0]), int(year[1])]
+        if county:
+            clauses.append(f'"County" IN ({", ".join("?" * len(county))})')
+            params += list(county)
+        if incident_name:
+            clauses.append(f'"Incident Name" IN ({", ".join("?" * len(incident_name))})')
+            params += list(incident_name)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _sum(self, column):
+        total = f"SUM({_quote(sql_name(column))})"
+        # SUM of BIGINT is a HUGEINT, which pandas would receive as float
+        return f"{total}::BIGINT" if column in self.integer_columns else total
+
+    def aggregate(self, county=None, year=None, incident_name=None):
+        """
+        Returns the sums of the summary columns per County x Year for a filter state.
+
+        Returns
+        -------
+        pd.DataFrame
+            The columns of the summary dataset in the same order, "Incident Name" is empty.
+        """
+        where, params = self._where(county, year, incident_name)
+        total = 'SUM("Value")::BIGINT' if self.value_dtype == np.int64 else 'SUM("Value")'
+        cursor = self._connection.cursor()
+        try:
+            sums = cursor.execute(f'SELECT "County", "Year", "Column", {total} AS "Value" FROM {VALUES_TABLE}{where} '
+                                  'GROUP BY ALL ORDER BY "County", "Year"', params).fetchnumpy()
+        finally:
+            cursor.close()
+
+        # Pivots the (County, Year, Column) sums back to the columns of the summary dataset
+        calfire_df = self.region_data.calfire_df
+        counties, years = np.asarray(sums["County"], dtype=object), np.asarray(sums["Year"])
+        # The rows are sorted, a County x Year starts wherever the county or the year changes
+        first = np.ones(len(counties), dtype=bool)
+        first[1:] = (counties[1:] != counties[:-1]) | (years[1:] != years[:-1])
+        matrix = np.zeros((first.sum(), len(self.value_columns)), dtype=self.value_dtype)
+        matrix[np.cumsum(first) - 1, np.asarray(sums["Column"])] = np.asarray(sums["Value"])
+        df = pd.DataFrame(matrix, columns=pd.Index(self.value_columns, tupleize_cols=False))
+        df["County"] = counties[first]
+        df["Year"] = years[first].astype(calfire_df["Year"].dtype)
+        df["Incident Name"] = None
+        dtypes = {column: dtype for column, dtype in calfire_df.dtypes[self.value_columns].items() if dtype != self.value_dtype}
+        return df[self.columns].astype(dtypes) if dtypes else df[self.columns]
+
+    def aggregate_timeseries(self, granularity, county=None, year=None, incident_name=None):
+        """
+        Returns the economic loss per County x period for a filter state.
+
+        Returns
+        -------
+        pd.DataFrame
+            "County", the `granularity` column, "Year" and "Total Economic Loss".
+        """
+        table = TIMESERIES_TABLES.get(granularity, SUMMARY_TABLE)
+        period = "" if granularity == "Year" else f', {_quote(granularity)}'
+        where, params = self._where(county, year, incident_name)
+        loss = self._sum("Total Economic Loss") if granularity == "Year" else 'SUM("Total Economic Loss")'
+        df = self.query(f'SELECT "County"{period}, "Year", {loss} AS "Total Economic Loss" FROM {table}{where} '
+                        f'GROUP BY ALL ORDER BY ALL', params)
+        df["Year"] = df["Year"].astype(self.region_data.calfire_df["Year"].dtype)
+        return df
+
+    def chart_data(self, county=None, year=None, incident_name=None, granularity="Year"):
+        """
+        Returns the aggregates of a filter state.
+
+        Parameters
+        ----------
+        county, year, incident_name, granularity
+            See `chart_specs.make_chart_specs`.
+
+        Returns
+        -------
+        ChartData
+        """
+        granularity = granularity if granularity in self.granularities else "Year"
+        calfire_df = self.aggregate(county, year, incident_name)
+        if granularity == "Year":
+            timeseries_df = calfire_df[["County", "Year", "Total Economic Loss"]]
+        else:
+            timeseries_df = self.aggregate_timeseries(granularity, county, year, incident_name)
+        top_structure_counties, top_loss_counties = leaderboard_top_counties(
+            self.region_data.county_leaderboard, county, year, incident_name)
+        return ChartData(calfire_df, timeseries_df, granularity, top_structure_counties, top_loss_counties)
+
+
+BACKENDS = {"pandas": PandasBackend, "duckdb": DuckDBBackend}
+
+
+def make_query_backend(name, region_data, **kwargs):
+    """
+    Creates a query backend.
+
+    Parameters
+    ----------
+    name : str
+        A key of `BACKENDS`.
+    region_data : RegionData
+        The datasets of the region.
+    **kwargs
+        Passed to the backend, e.g. the `database` of `DuckDBBackend`.
+
+    Raises
+    ------
+    ValueError
+        If the backend is unknown.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown query backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](region_data, **kwargs)
+
+
+def get_query_backend():
+    """Returns the backend of the default region selected by `CALFIRE_QUERY_BACKEND`, created on the first call."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            from .data import default_region
+            _backend = make_query_backend(QUERY_BACKEND, default_region)
+        return _backend
@@ -0,0 +1,180 @@
+"""
+Filter State Query Log and Cache Warm-up
+
+The chart callbacks append the normalized filter state of every chart request to a local log
+file, one JSON line per request, with its time. The log is rotated when it grows above
+`CALFIRE_QUERY_LOG_MB`, keeping `CALFIRE_QUERY_LOG_BACKUPS` older files (`<path>.1` is the most
+recent one). Lines are appended with a single write, so the gunicorn workers can share the
+file, and rotation is serialized with a lock file.
+
+When a worker starts (`post_worker_init` in `gunicorn.conf.py`, or before `python -m src.app`
+serves), `warm_up` counts the filter states of the log and precomputes the most frequent ones
+into the chart caches, most frequent first, until `CALFIRE_WARMUP_STATES` states are done or
+`CALFIRE_WARMUP_SECONDS` have passed. A state already being computed when the budget runs out
+is finished. The number of states warmed and the time taken are printed.
+
+Configuration
+-------------
+CALFIRE_QUERY_LOG_PATH : str
+    The log file, e.g. 'data/cache/query_log.jsonl'. Filter states are neither logged nor
+    warmed up when unset.
+CALFIRE_QUERY_LOG_MB : float
+    Size above which the log is rotated (default 10).
+CALFIRE_QUERY_LOG_BACKUPS : int
+    Number of rotated files kept (default 3).
+CALFIRE_WARMUP_STATES : int
+    Number of filter states warmed up at worker start (default 20).
+CALFIRE_WARMUP_SECONDS : float
+    Time budget of the warm-up (default 30).
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+QUERY_LOG_PATH = os.environ.get("CALFIRE_QUERY_LOG_PATH", "")
+QUERY_LOG_MB = float(os.environ.get("CALFIRE_QUERY_LOG_MB", 10))
+QUERY_LOG_BACKUPS = int(os.environ.get("CALFIRE_QUERY_LOG_BACKUPS", 3))
+WARMUP_STATES = int(os.environ.get("CALFIRE_WARMUP_STATES", 20))
+WARMUP_SECONDS = float(os.environ.get("CALFIRE_WARMUP_SECONDS", 30))
+
+_query_log = None
+_query_log_lock = threading.Lock()
+
+
+class QueryLog:
+    """
+    Rotating log of filter states, shared by the processes of a server.
+
+    Parameters
+    ----------
+    path : str
+        The log file, created with its directory if needed.
+    max_mb : float, optional
+        Size above which the log is rotated (default is `CALFIRE_QUERY_LOG_MB`, or 10).
+    backups : int, optional
+        Number of rotated files kept (default is `CALFIRE_QUERY_LOG_BACKUPS`, or 3).
+    """
+
+    def __init__(self, path, max_mb=QUERY_LOG_MB, backups=QUERY_LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.backups = backups
+        self.errors = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def paths(self):
+        """Returns the files of the log, oldest first."""
+        rotated = [f"{self.path}.{i}" for i in range(self.backups, 0, -1)]
+        return [path for path in rotated + [self.path] if os.path.exists(path)]
+
+    def _rotate(self):
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have rotated the log while this one waited
+            if not os.path.exists(self.path) or os.path.getsize(self.path) < self.max_bytes:
+                return
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{i}"):
+                    os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+            if self.backups > 0:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+
+    def record(self, filters):
+        """
+        Appends a filter state, rotating the log first if it is full. Never raises.
+
+        Parameters
+        ----------
+        filters : dict
+            A normalized filter state, see `chart_render.normalize_filters`.
+        """
+        line = json.dumps({"time": round(time.time(), 3), "filters": filters}, sort_keys=True) + "\n"
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self._rotate()
+            with open(self.path, "a") as f:
+                f.write(line)
+        except OSError:
+            self.errors += 1
+
+    def states(self):
+        """Yields the logged filter states, oldest first, skipping unreadable lines."""
+        for path in self.paths():
+            try:
+                with open(path) as f:
+                    for line in f:
+                        try:
+                            filters = json.loads(line)["filters"]
+                        except (ValueError, KeyError, TypeError):
+                            # A line cut by a full disk or a crash
+                            continue
+                        if isinstance(filters, dict):
+                            yield filters
+            except OSError:
+                continue
+
+    def top_states(self, n):
+        """Returns the `n` most frequent filter states of the log with their counts, most frequent first."""
+        counts = Counter(json.dumps(filters, sort_keys=True) for filters in self.states())
+        return [(json.loads(key), count) for key, count in counts.most_common(n)]
+
+
+def get_query_log():
+    """Returns the log of this server, `None` when `CALFIRE_QUERY_LOG_PATH` is not set."""
+    global _query_log
+    if not QUERY_LOG_PATH:
+        return None
+    with _query_log_lock:
+        if _query_log is None:
+            _query_log = QueryLog(QUERY_LOG_PATH)
+        return _query_log
+
+
+def warm_up(compute, query_log=None, n_states=WARMUP_STATES, budget_seconds=WARMUP_SECONDS):
+    """
+    Precomputes the most frequent filter states of the log.
+
+    Parameters
+    ----------
+    compute : callable
+        Takes a filter state and computes its outputs into the caches, e.g. `callbacks.precompute`.
+    query_log : QueryLog, optional
+        The log (default is `get_query_log()`).
+    n_states : int, optional
+        Number of states to warm up (default is `CALFIRE_WARMUP_STATES`, or 20).
+    budget_seconds : float, optional
+        No state is started after this time (default is `CALFIRE_WARMUP_SECONDS`, or 30).
+
+    Returns
+    -------
+    dict
+        The number of states "warmed", "failed" and "logged" (the candidates, at most
+        `n_states`), and the "seconds" taken, also printed.
+    """
+    query_log = query_log or get_query_log()
+    report = {"warmed": 0, "failed": 0, "logged": 0, "seconds": 0.0}
+    if query_log is None:
+        return report
+
+    start = time.perf_counter()
+    states = query_log.top_states(n_states)
+    report["logged"] = len(states)
+    for filters, count in states:
+        if time.perf_counter() - start >= budget_seconds:
+            break
+        try:
+            compute(filters)
+            report["warmed"] += 1
+        except Exception:
+            # A state of an older dataset (e.g. a county that is gone) must not stop the worker
+            report["failed"] += 1
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    print(f"[{os.getpid()}] Cache warm-up: {report['warmed']} of the {report['logged']} most frequent filter states "
+          f"in {report['seconds']:.2f} s ({report['failed']} failed, budget {budget_seconds:g} s)", flush=True)
+    return report
@@ -0,0 +1,278 @@
+"""
+Per-region Data Partitions
+
+The dashboard data of a region (a state with DINS-style inspections) is a directory written by
+`data_import.py --region <name>`: the summary dataset, the county statistics and boundaries,
+the global variables, the time series rollups, the hex density cells and the quantile
+sketches of the assessed values. California, the region of the dashboard layout, lives in
+`data/processed` and the other regions in `data/processed/regions/<name>`.
+
+A `RegionStore` loads the partition of a region the first time it is requested and keeps the
+recently used ones in memory under a budget (`CALFIRE_REGION_BUDGET_MB`, default 512 MB),
+evicting the least recently used regions first. The default region is the data already loaded
+by `data.py`, it is shared rather than loaded twice and is never evicted.
+
+Examples
+--------
+>>> store = get_region_store()
+>>> store.get("oregon").calfire_df["County"].unique()
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+
+from .leaderboard import CountyLeaderboard
+
+DEFAULT_REGION = "california"
+DEFAULT_DATA_DIR = 'data/processed'
+# Written by data_import.py --region
+REGIONS_DIR = 'data/processed/regions'
+REGION_BUDGET_MB = float(os.environ.get("CALFIRE_REGION_BUDGET_MB", 512))
+
+
+class UnknownRegion(KeyError):
+    """Raised when no partition exists for a region."""
+
+
+def region_dir(region, regions_dir=REGIONS_DIR):
+    """
+    Returns the partition directory of a region.
+
+    Raises
+    ------
+    UnknownRegion
+        If the name is not a lowercase identifier such as "oregon" or "new_mexico".
+    """
+    if region == DEFAULT_REGION:
+        return DEFAULT_DATA_DIR
+    if not re.fullmatch(r"[a-z0-9_-]+", region or ""):
+        raise UnknownRegion(region)
+    return os.path.join(regions_dir, region)
+
+
+def available_regions(regions_dir=REGIONS_DIR):
+    """Returns the default region and every region with a partition, sorted by name."""
+    regions = {DEFAULT_REGION}
+    if os.path.isdir(regions_dir):
+        regions.update(name for name in os.listdir(regions_dir)
+                       if os.path.exists(os.path.join(regions_dir, name, 'processed_cal_fire.pkl')))
+    return sorted(regions)
+
+
+class RegionData:
+    """
+    The datasets the dashboard serves for one region.
+
+    Attributes
+    ----------
+    calfire_df : pd.DataFrame
+        The summary dataset.
+    county_stats : pd.DataFrame
+        Per-county statistics of the map.
+    county_geojson : dict
+        The county boundaries.
+    timeseries_rollups : dict
+        Time series rollups keyed by granularity, "Year" is `calfire_df` itself.
+    hex_density : dict or None
+        Structure counts on hexagonal grids keyed by resolution (see `hex_grid.py`).
+    value_sketches : dict or None
+        Quantile sketches of the assessed values (see `value_sketches.py`).
+    crossfilter_cube : pd.DataFrame or None
+        Structure counts and economic loss per incident, period and category of the
+        cross-filtering charts (see `crossfilter.py`).
+    global_vars : list
+        Counties, first year, last year and incidents.
+    county_leaderboard : CountyLeaderboard
+        Per-year county totals of the top-K charts.
+    nbytes : int
+        Approximate memory held by the datasets.
+    version : str
+        Short hash of the summary dataset file, changes whenever `data_import.py` writes new data.
+    modified : float
+        Modification time of the summary dataset file (Unix time).
+    """
+
+    def __init__(self, calfire_df, county_stats, county_geojson, timeseries_rollups, hex_density, global_vars,
+                 county_leaderboard=None, nbytes=0, version="", modified=0.0, value_sketches=None, crossfilter_cube=None):
+        self.calfire_df = calfire_df
+        self.county_stats = county_stats
+        self.county_geojson = county_geojson
+        self.timeseries_rollups = timeseries_rollups
+        self.hex_density = hex_density
+        self.value_sketches = value_sketches
+        self.crossfilter_cube = crossfilter_cube
+        self.global_vars = global_vars
+        self.county_leaderboard = county_leaderboard or CountyLeaderboard.from_summary(calfire_df)
+        self.nbytes = nbytes
+        self.version = version
+        self.modified = modified
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Loads a partition written by `data_import.py`.
+
+        Parameters
+        ----------
+        directory : str
+            The partition directory.
+
+        Returns
+        -------
+        RegionData
+        """
+        def read_pickle(name, default=None):
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                return default
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+
+        summary_path = os.path.join(directory, 'processed_cal_fire.pkl')
+        if not os.path.exists(summary_path):
+            raise UnknownRegion(directory)
+        with open(summary_path, 'rb') as f:
+            content = f.read()
+        calfire_df = pickle.loads(content)
+        county_stats = read_pickle('county_stats.pkl')
+        with open(os.path.join(directory, 'county_boundaries.geojson')) as f:
+            county_geojson = json.load(f)
+        timeseries_rollups = {"Year": calfire_df, **read_pickle('timeseries_rollups.pkl', {})}
+        hex_density = read_pickle('hex_density.pkl')
+        global_vars = read_pickle('global_vars.pkl')
+        value_sketches = read_pickle('value_sketches.pkl')
+        crossfilter_cube = read_pickle('crossfilter_cube.pkl')
+
+        # DataFrames report their own size, the boundaries are counted by their file size
+        frames = [calfire_df, county_stats] + [df for name, df in timeseries_rollups.items() if name != "Year"]
+        frames += list((hex_density or {}).values())
+        frames += [value_sketches[name] for name in ("county_year", "incident")] if value_sketches else []
+        frames += [crossfilter_cube] if crossfilter_cube is not None else []
+        nbytes = sum(int(df.memory_usage(deep=True).sum()) for df in frames)
+        nbytes += os.path.getsize(os.path.join(directory, 'county_boundaries.geojson'))
+        return cls(calfire_df, county_stats, county_geojson, timeseries_rollups, hex_density, global_vars, nbytes=nbytes,
+                   version=hashlib.sha256(content).hexdigest()[:12], modified=os.path.getmtime(summary_path),
+                   value_sketches=value_sketches, crossfilter_cube=crossfilter_cube)
+
+
+class RegionStore:
+    """
+    Thread-safe LRU cache of region partitions bounded by their memory.
+
+    Parameters
+    ----------
+    budget_mb : float, optional
+        Memory above which the least recently used regions are evicted (default is
+        `CALFIRE_REGION_BUDGET_MB`, or 512). A region larger than the budget is still served,
+        it is evicted as soon as another region is loaded.
+    default : RegionData, optional
+        The data of `DEFAULT_REGION`, kept outside of the budget (default is the data loaded
+        by `data.py`, imported on first use).
+    regions_dir : str, optional
+        Where the partitions of the other regions are (default is 'data/processed/regions').
+    """
+
+    def __init__(self, budget_mb=REGION_BUDGET_MB, default=None, regions_dir=REGIONS_DIR):
+        self.max_bytes = int(budget_mb * 1024 * 1024)
+        self.regions_dir = regions_dir
+        self.nbytes = 0
+        self.loads = self.evictions = 0
+        self._default = default
+        self._regions = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def get(self, region=None):
+        """
+        Returns the data of a region, loading its partition on first use.
+
+        Parameters
+        ----------
+        region : str, optional
+            The region name (default is `DEFAULT_REGION`).
+
+        Returns
+        -------
+        RegionData
+
+        Raises
+        ------
+        UnknownRegion
+            If the region has no partition.
+        """
+        region = region or DEFAULT_REGION
+        if region == DEFAULT_REGION:
+            if self._default is None:
+                from .data import default_region
+                self._default = default_region
+            return self._default
+
+        directory = region_dir(region, self.regions_dir)
+        with self._lock:
+            if region in self._regions:
+                self._regions.move_to_end(region)
+                return self._regions[region]
+            # Concurrent requests for a cold region wait for a single load
+            loading = self._loading.setdefault(region, threading.Lock())
+
+        with loading:
+            with self._lock:
+                if region in self._regions:
+                    self._regions.move_to_end(region)
+                    return self._regions[region]
+            if not os.path.exists(os.path.join(directory, 'processed_cal_fire.pkl')):
+                raise UnknownRegion(region)
+            data = RegionData.load(directory)
+
+            with self._lock:
+                self._regions[region] = data
+                self.nbytes += data.nbytes
+                self.loads += 1
+                while self.nbytes > self.max_bytes and len(self._regions) > 1:
+                    _, evicted = self._regions.popitem(last=False)
+                    self.nbytes -= evicted.nbytes
+                    self.evictions += 1
+                self._loading.pop(region, None)
+        return data
+
+    def loaded(self):
+        """Returns the regions in memory, from the least to the most recently used, with their size in bytes."""
+        with self._lock:
+            return {region: data.nbytes for region, data in self._regions.items()}
+
+
+_region_store = None
+_region_store_lock = threading.Lock()
+
+
+def get_region_store():
+    """Returns the region store of the server, created on first use."""
+    global _region_store
+    with _region_store_lock:
+        if _region_store is None:
+            _region_store = RegionStore()
+    return _region_store
+
+
+def register_region_routes(server):
+    """
+    Adds the `/api/regions` endpoint to the Flask server.
+
+    It lists the regions with a partition, the regions in memory with their size, and the
+    number of loads and evictions of this worker.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    """
+    @server.route("/api/regions")
+    def regions():
+        store = get_region_store()
+        return {"regions": available_regions(store.regions_dir), "loaded": store.loaded(),
+                "budget_bytes": store.max_bytes, "loads": store.loads, "evictions": store.evictions}
@@ -0,0 +1,192 @@
+"""
+On-demand Request Profiling
+
+A single slow request, such as a chart of a large multi-county selection, can be
+profiled on the live server: send the `X-Calfire-Profile: 1` header (or the `profile=1` query
+parameter) together with the debug token (see `debug_access`). The request then runs under
+`cProfile` and its profile is saved to `CALFIRE_PROFILE_DIR` (default 'profiles'), with the
+route, the filter state of Dash callbacks and the total time.
+
+`/debug/profiles` lists the recent profiles. Each one can be read as a `pstats` table or
+downloaded as a `.prof` file for `snakeviz` or `python -m pstats`. Requests without the flag
+only pay for one header lookup, and the flag is ignored without a valid token.
+
+Examples
+--------
+    ```bash
+    curl -H "X-Calfire-Profile: 1" -H "X-Debug-Token: $CALFIRE_DEBUG_TOKEN" \\
+         -H "Content-Type: application/json" -d @roof_chart_request.json http://localhost:8050/_dash-update-component
+    ```
+
+Configuration
+-------------
+CALFIRE_PROFILE_DIR : str
+    Where profiles are saved (default 'profiles').
+CALFIRE_PROFILE_KEEP : int
+    Number of profiles kept, older ones are deleted (default 100).
+CALFIRE_DEBUG_TOKEN : str
+    Token required to trigger a profile and to read `/debug/profiles`.
+"""
+
+import cProfile
+import html
+import io
+import itertools
+import json
+import os
+import pstats
+import time
+
+from .debug_access import debug_token_required, has_debug_token
+from .metrics import route_label
+
+PROFILE_DIR = os.environ.get("CALFIRE_PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.environ.get("CALFIRE_PROFILE_KEEP", 100))
+PROFILE_HEADER = "X-Calfire-Profile"
+SORT_KEYS = ["cumulative", "tottime", "ncalls"]
+
+_counter = itertools.count()
+
+
+def profile_requested(request):
+    """Returns whether a request asks to be profiled and carries the debug token."""
+    flag = request.headers.get(PROFILE_HEADER) or request.args.get("profile")
+    return flag in ("1", "true") and has_debug_token()
+
+
+def request_label(request):
+    """
+    Describes what a request computes.
+
+    Returns
+    -------
+    tuple of (str, dict)
+        The route (the first output component for Dash callbacks) and, for Dash callbacks, the
+        triggering input and the value of every input and state keyed by "id.property".
+    """
+    route = route_label(request)
+    if not route.startswith("callback:"):
+        return route, dict(request.args)
+    body = request.get_json(silent=True) or {}
+    filters = {f"{dependency['id']}.{dependency['property']}": dependency.get("value")
+               for dependency in body.get("inputs", []) + body.get("state", []) if isinstance(dependency.get("id"), str)}
+    filters["trigger"] = body.get("changedPropIds")
+    return route, filters
+
+
+def save_profile(profiler, route, filters, seconds, profile_dir=None, keep=None):
+    """
+    Saves a profile and its description, deleting the oldest profiles beyond `keep`.
+
+    Returns
+    -------
+    str
+        The id of the profile.
+    """
+    profile_dir = profile_dir or PROFILE_DIR
+    keep = keep or PROFILE_KEEP
+    os.makedirs(profile_dir, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(_counter)}"
+    profiler.dump_stats(os.path.join(profile_dir, f"{profile_id}.prof"))
+    with open(os.path.join(profile_dir, f"{profile_id}.json"), "w") as f:
+        json.dump({"id": profile_id, "time": time.time(), "route": route, "filters": filters,
+                   "seconds": round(seconds, 4)}, f, default=str)
+
+    for old in list_profiles(profile_dir)[keep:]:
+        for extension in ("prof", "json"):
+            try:
+                os.remove(os.path.join(profile_dir, f"{old['id']}.{extension}"))
+            except FileNotFoundError:
+                pass
+    return profile_id
+
+
+def list_profiles(profile_dir=None):
+    """Returns the description of every saved profile, most recent first."""
+    profile_dir = profile_dir or PROFILE_DIR
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = []
+    for name in os.listdir(profile_dir):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(profile_dir, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return sorted(profiles, key=lambda profile: profile["time"], reverse=True)
+
+
+def format_profile(path, sort="cumulative", limit=50):
+    """Returns the `pstats` table of a saved profile."""
+    stream = io.StringIO()
+    pstats.Stats(path, stream=stream).sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+def _index_html(profiles, token):
+    query = f"?token={html.escape(token)}" if token else ""
+    rows = "".join(
+        f"<tr><td>{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(profile['time']))}</td>"
+        f"<td>{html.escape(profile['route'])}</td><td>{profile['seconds']:.3f}</td>"
+        f"<td><code>{html.escape(json.dumps(profile['filters'], default=str))}</code></td>"
+        f"<td><a href=\"/debug/profiles/{profile['id']}{query}\">stats</a> "
+        f"<a href=\"/debug/profiles/{profile['id']}.prof{query}\">.prof</a></td></tr>"
+        for profile in profiles)
+    return ("<!DOCTYPE html><html><head><title>Request profiles</title></head><body>"
+            "<h1>Request profiles</h1><table><tr><th>Time</th><th>Route</th><th>Seconds</th><th>Filters</th><th></th></tr>"
+            f"{rows}</table></body></html>")
+
+
+def register_profiler_routes(server):
+    """
+    Adds on-demand profiling of flagged requests and the `/debug/profiles` pages to the Flask server.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    """
+    from flask import Response, abort, g, request, send_file
+
+    @server.before_request
+    def start_profile():
+        if not profile_requested(request):
+            return
+        g.request_profiler = cProfile.Profile()
+        g.request_profile_start = time.perf_counter()
+        g.request_profiler.enable()
+
+    @server.after_request
+    def stop_profile(response):
+        profiler = g.pop("request_profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            route, filters = request_label(request)
+            profile_id = save_profile(profiler, route, filters, time.perf_counter() - g.pop("request_profile_start"))
+            response.headers["X-Calfire-Profile-Id"] = profile_id
+        return response
+
+    @server.route("/debug/profiles")
+    @debug_token_required
+    def profiles_index():
+        profiles = list_profiles()
+        if request.args.get("format") == "json":
+            return {"profiles": profiles}
+        return _index_html(profiles, request.args.get("token"))
+
+    @server.route("/debug/profiles/<profile_id>")
+    @debug_token_required
+    def profile_stats(profile_id):
+        if profile_id.endswith(".prof"):
+            path = os.path.join(PROFILE_DIR, os.path.basename(profile_id))
+            if not os.path.exists(path):
+                abort(404)
+            return send_file(os.path.abspath(path), mimetype="application/octet-stream", as_attachment=True)
+        path = os.path.join(PROFILE_DIR, f"{os.path.basename(profile_id)}.prof")
+        if not os.path.exists(path):
+            abort(404)
+        sort = request.args.get("sort", "cumulative")
+        if sort not in SORT_KEYS:
+            return {"error": f"Unknown sort key, expected one of {SORT_KEYS}"}, 400
+        return Response(format_profile(path, sort, request.args.get("limit", 50, type=int)), mimetype="text/plain")
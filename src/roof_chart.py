@@ -1,7 +1,9 @@
 import pandas as pd
 import altair as alt
 
-def make_roof_chart(calfire_df):
+from .summary_columns import split_summary_columns
+
+def make_roof_chart(calfire_df, selected=None):
     """
     Creates a bar chart showing the number of houses by roof construction type,
     categorized by wildfire damage severity.
@@ -10,6 +12,9 @@ def make_roof_chart(calfire_df):
     ----------
     calfire_df : pd.DataFrame
         A DataFrame containing wildfire damage data
+    selected : list of str, optional
+        The roof constructions selected on the chart, highlighted. Clicking a bar selects its
+        roof construction (see `crossfilter.py`). If `None`, the chart has no click selection.
 
     Returns
     -------
@@ -28,7 +33,8 @@ def make_roof_chart(calfire_df):
 
     Notes
     -----
-    The function uses the first 47 columns of the input DataFrame to create a damage table and count table.
+    The function uses the roof x damage columns of the input DataFrame (see `summary_columns.py`) to create
+    a damage table and count table.
     It then concatenates these tables to form the final data used for the chart.
     """
 
@@ -37,9 +43,11 @@ def make_roof_chart(calfire_df):
 
     alt.data_transformers.enable("vegafusion")
 
-    damage_table = pd.DataFrame(calfire_df.columns[:47].to_list(), columns=[ "Roof Construction", "Damage Category"])
+    roof_damage_columns, _ = split_summary_columns(calfire_df.columns)
+
+    damage_table = pd.DataFrame(roof_damage_columns, columns=[ "Roof Construction", "Damage Category"])
 
-    damage_count = pd.DataFrame(calfire_df.iloc[:, :47].sum(axis=0).values, columns=["Count"])
+    damage_count = pd.DataFrame(calfire_df[roof_damage_columns].sum(axis=0).values, columns=["Count"])
 
     roof_damage = pd.concat([damage_table, damage_count], axis=1)
 
@@ -49,6 +57,10 @@ def make_roof_chart(calfire_df):
         .sum().sort_values(ascending=False).index.tolist()
     )
 
+    selection = alt.selection_point(fields=["Roof Construction"], name="roof_select",
+                                    value=[{"Roof Construction": roof} for roof in selected] or alt.Undefined) \
+        if selected is not None else None
+
     roof_chart = alt.Chart(roof_damage).mark_bar().encode(
         y=alt.Y("Roof Construction:N", 
                 title=None, 
@@ -67,10 +79,13 @@ def make_roof_chart(calfire_df):
                                     "'E. Destroyed (>50%)': 'Destroyed (>50%)'}[datum.label]"  
                         )  # Show original labels in legend
                     ),  
+        opacity=alt.OpacityValue(0.3, condition={"param": selection.name, "value": 1}) if selection is not None else alt.Undefined,
         tooltip=["Roof Construction:N", "count():Q", "Damage Category:O"]
     ).properties(
         width='container',
         height=200
     )
+    if selection is not None:
+        roof_chart = roof_chart.add_params(selection)
 
     return roof_chart
\ No newline at end of file
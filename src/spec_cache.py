@@ -0,0 +1,225 @@
+"""
+Persistent Chart Spec Cache
+
+The outputs of the chart callbacks (the Vega spec of every chart and the total economic loss of
+the summary card) are kept in a single SQLite file on local disk, shared by every gunicorn
+worker and kept across restarts and deploys. A worker that has just started serves the views
+already computed by any worker at cache-hit latency.
+
+- Entries are keyed by the normalized filter state (see `chart_render.normalize_filters`), the
+  output name and the version of the outputs: the version of the dataset and a fingerprint of
+  the configuration that changes the charts (see `outputs_version`). Opening the cache deletes
+  the entries of other versions, and lookups only match the current one, so new processed data
+  or a new configuration is never served stale charts.
+- Values are stored as zlib-compressed JSON. When the values grow above `CALFIRE_SPEC_CACHE_MB`
+  the least recently used entries are deleted. The last use of an entry is updated at most
+  once per `TOUCH_INTERVAL` seconds, so hits rarely write.
+- The file is in WAL mode: readers never block each other or the writer, and writers wait for
+  each other (`busy_timeout`). Every thread has its own connection.
+- A failing lookup or write (e.g. a full disk) counts as a miss and never fails a callback.
+
+Configuration
+-------------
+CALFIRE_SPEC_CACHE_PATH : str
+    The SQLite file, e.g. 'data/cache/chart_specs.sqlite'. The cache is disabled when unset.
+CALFIRE_SPEC_CACHE_MB : float
+    Size of the compressed values above which entries are evicted (default 256).
+
+Examples
+--------
+>>> cache = SpecCache('data/cache/chart_specs.sqlite', outputs_version(dataset_version))
+>>> spec = cache.get(filters, "roof_chart")
+>>> if spec is None:
+...     spec = build_chart_spec("roof_chart", chart_data)
+...     cache.put(filters, "roof_chart", spec)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from .metrics import spec_cache_lookups
+
+SPEC_CACHE_PATH = os.environ.get("CALFIRE_SPEC_CACHE_PATH", "")
+SPEC_CACHE_MB = float(os.environ.get("CALFIRE_SPEC_CACHE_MB", 256))
+TOUCH_INTERVAL = 60
+BUSY_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS specs (
+    filters TEXT NOT NULL,
+    output TEXT NOT NULL,
+    version TEXT NOT NULL,
+    value BLOB NOT NULL,
+    bytes INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (filters, output, version)
+);
+CREATE INDEX IF NOT EXISTS specs_accessed ON specs (accessed);
+"""
+
+_spec_cache = None
+_spec_cache_lock = threading.Lock()
+
+
+def outputs_version(dataset_version):
+    """
+    Returns the version of the chart outputs of a dataset under the current configuration.
+
+    The top county count (`CALFIRE_TOP_COUNTIES`), the query backend (`CALFIRE_QUERY_BACKEND`)
+    and whether the cross-filter cube was written change the outputs without changing the
+    dataset, so they are part of the version.
+
+    Parameters
+    ----------
+    dataset_version : str
+        The version of the loaded dataset.
+
+    Returns
+    -------
+    str
+        The dataset version followed by a hash of the configuration.
+    """
+    from .data import crossfilter_cube
+    from .leaderboard import TOP_COUNTIES
+    from .query_backend import QUERY_BACKEND
+
+    config = {"top_counties": TOP_COUNTIES, "query_backend": QUERY_BACKEND, "crossfilter": crossfilter_cube is not None}
+    return f"{dataset_version}-{hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]}"
+
+
+def filters_key(filters):
+    """Returns the key of a normalized filter state."""
+    return json.dumps(filters, sort_keys=True)
+
+
+class SpecCache:
+    """
+    Size-bounded cache of chart outputs in a SQLite file, safe to use from several processes and threads.
+
+    Parameters
+    ----------
+    path : str
+        The SQLite file, created with its directory if needed.
+    version : str
+        The version of the outputs, see `outputs_version`. Entries of other versions are deleted.
+    max_mb : float, optional
+        Size of the compressed values above which the least recently used entries are
+        evicted (default is `CALFIRE_SPEC_CACHE_MB`, or 256).
+    """
+
+    def __init__(self, path, version, max_mb=SPEC_CACHE_MB):
+        self.path = path
+        self.version = version
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = self.misses = self.errors = 0
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        with connection:
+            connection.executescript(SCHEMA)
+        with connection:
+            connection.execute("DELETE FROM specs WHERE version != ?", (version,))
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, filters, output):
+        """
+        Returns a cached output, or `None` on a miss.
+
+        Parameters
+        ----------
+        filters : dict
+            A normalized filter state.
+        output : str
+            The output name, e.g. "roof_chart".
+        """
+        key = filters_key(filters)
+        try:
+            connection = self._connection()
+            row = connection.execute("SELECT value, accessed FROM specs WHERE filters = ? AND output = ? AND version = ?",
+                                     (key, output, self.version)).fetchone()
+            if row is not None and time.time() - row[1] > TOUCH_INTERVAL:
+                with connection:
+                    connection.execute("UPDATE specs SET accessed = ? WHERE filters = ? AND output = ? AND version = ?",
+                                       (time.time(), key, output, self.version))
+        except sqlite3.Error:
+            self.errors += 1
+            row = None
+        if row is None:
+            self.misses += 1
+            spec_cache_lookups.labels("miss").inc()
+            return None
+        self.hits += 1
+        spec_cache_lookups.labels("hit").inc()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, filters, output, value):
+        """
+        Stores an output, evicting the least recently used entries beyond the size limit.
+
+        Returns
+        -------
+        bool
+            Whether the output was stored.
+        """
+        blob = zlib.compress(json.dumps(value).encode())
+        if len(blob) > self.max_bytes:
+            return False
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO specs VALUES (?, ?, ?, ?, ?, ?)",
+                                   (filters_key(filters), output, self.version, blob, len(blob), time.time()))
+                excess = connection.execute("SELECT COALESCE(SUM(bytes), 0) FROM specs").fetchone()[0] - self.max_bytes
+                if excess > 0:
+                    self._evict(connection, excess)
+        except sqlite3.Error:
+            self.errors += 1
+            return False
+        return True
+
+    @staticmethod
+    def _evict(connection, excess):
+        rows = connection.execute("SELECT rowid, bytes FROM specs ORDER BY accessed").fetchall()
+        evicted = []
+        for rowid, size in rows:
+            if excess <= 0:
+                break
+            evicted.append((rowid,))
+            excess -= size
+        connection.executemany("DELETE FROM specs WHERE rowid = ?", evicted)
+
+    def stats(self):
+        """Returns the number of entries and bytes stored, and the hits, misses and errors of this process."""
+        entries, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM specs").fetchone()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+    def clear(self):
+        """Deletes every entry."""
+        with self._connection() as connection:
+            connection.execute("DELETE FROM specs")
+
+
+def get_spec_cache():
+    """Returns the cache of this worker for the loaded dataset and configuration, `None` when `CALFIRE_SPEC_CACHE_PATH` is not set."""
+    global _spec_cache
+    if not SPEC_CACHE_PATH:
+        return None
+    with _spec_cache_lock:
+        if _spec_cache is None:
+            from .data import dataset_version
+            _spec_cache = SpecCache(SPEC_CACHE_PATH, outputs_version(dataset_version))
+        return _spec_cache
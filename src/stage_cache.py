@@ -0,0 +1,218 @@
+"""
+Content-addressed Stage Cache for the Data Pipeline
+
+`data_import.py` is split into named stages (ingesting a raw file, merging, loading the county
+boundaries, building the summary). The output of every stage is pickled to a local cache
+directory under a key hashed from:
+
+- the stage name,
+- the source code of the modules of the functions the stage runs, so that editing a helper
+  they call also invalidates it,
+- the content of its input files,
+- its parameters and the keys of the upstream stages it depends on.
+
+A rerun skips every stage whose inputs and code are unchanged, and prints a per-stage timing
+and cache-hit report.
+
+Examples
+--------
+>>> cache = StageCache('data/cache')
+>>> merged, merge_key = cache.run("merge", merge_partial_aggregates, partials,
+...                               code=[merge_partial_aggregates], upstream=partial_keys)
+>>> print(cache.format_report())
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import time
+
+DEFAULT_CACHE_DIR = 'data/cache'
+
+
+def hash_code(code):
+    """
+    Hashes the source code of the modules of the given functions.
+
+    Parameters
+    ----------
+    code : iterable of callable or module
+        Functions (or classes) whose whole module is hashed, or modules.
+
+    Returns
+    -------
+    str
+        The hexadecimal hash.
+    """
+    modules = {}
+    for item in code:
+        module = item if inspect.ismodule(item) else inspect.getmodule(item)
+        modules.setdefault(module.__name__, module)
+    digest = hashlib.sha256()
+    for name in sorted(modules):
+        digest.update(name.encode())
+        digest.update(inspect.getsource(modules[name]).encode())
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+    Pickles stage outputs on local disk under content-hashed keys.
+
+    Parameters
+    ----------
+    cache_dir : str or None, optional
+        Where to store the outputs (default is 'data/cache'). `None` disables caching while
+        still timing the stages.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.timings = []
+        self._file_hashes = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._file_hashes = self._read_file_hashes()
+
+    def _read_file_hashes(self):
+        try:
+            with open(os.path.join(self.cache_dir, "file_hashes.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_file_hashes(self):
+        path = os.path.join(self.cache_dir, "file_hashes.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self._file_hashes, f)
+        os.replace(path + ".tmp", path)
+
+    def hash_file(self, path):
+        """
+        Returns the SHA-256 of a file's content.
+
+        Hashes are remembered by path, size and modification time, so unchanged files are
+        not read again on the next run.
+        """
+        stat = os.stat(path)
+        signature = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        if signature not in self._file_hashes:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            self._file_hashes[signature] = digest.hexdigest()
+            if self.cache_dir:
+                self._write_file_hashes()
+        return self._file_hashes[signature]
+
+    def key(self, stage, code=(), files=(), params=None, upstream=()):
+        """
+        Computes the cache key of a stage.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        code : iterable of callable or module, optional
+            Functions whose source code the output depends on, with the helpers of their
+            modules, see `hash_code`. Helpers of other modules are listed too.
+        files : iterable of str, optional
+            Input files whose content the output depends on.
+        params : object, optional
+            JSON-serializable parameters of the stage.
+        upstream : iterable of str, optional
+            Keys of the stages whose outputs are inputs of this one.
+
+        Returns
+        -------
+        str
+            The hexadecimal key.
+        """
+        digest = hashlib.sha256()
+        digest.update(stage.encode())
+        digest.update(hash_code(code).encode())
+        for path in files:
+            digest.update(self.hash_file(path).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        for upstream_key in upstream:
+            digest.update(upstream_key.encode())
+        return digest.hexdigest()
+
+    def _path(self, stage, key):
+        safe_stage = "".join(char if char.isalnum() or char in "-_." else "_" for char in stage)
+        return os.path.join(self.cache_dir, f"{safe_stage}-{key[:32]}.pkl")
+
+    def get(self, stage, key):
+        """
+        Looks up the output of a stage.
+
+        Returns
+        -------
+        tuple of (bool, object)
+            Whether the output was cached, and the output itself.
+        """
+        if not self.cache_dir:
+            return False, None
+        try:
+            with open(self._path(stage, key), "rb") as f:
+                return True, pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False, None
+
+    def put(self, stage, key, value):
+        """Stores the output of a stage, atomically so concurrent runs never read partial files."""
+        if not self.cache_dir:
+            return
+        path = self._path(stage, key)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def record(self, stage, hit, seconds):
+        """Adds a line to the timing and cache-hit report."""
+        self.timings.append({"stage": stage, "hit": hit, "seconds": seconds})
+
+    def run(self, stage, function, *args, code=None, files=(), params=None, upstream=()):
+        """
+        Runs a stage unless its output is cached.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        function : callable
+            Computes the output from `args`.
+        *args
+            Arguments of `function`.
+        code : iterable of callable or module, optional
+            Functions whose source code the output depends on (default is `[function]`),
+            see `key`.
+        files, params, upstream
+            See `key`.
+
+        Returns
+        -------
+        tuple of (object, str)
+            The output and its key, to pass as `upstream` to the following stages.
+        """
+        start = time.perf_counter()
+        key = self.key(stage, code if code is not None else [function], files, params, upstream)
+        hit, value = self.get(stage, key)
+        if not hit:
+            value = function(*args)
+            self.put(stage, key, value)
+        self.record(stage, hit, time.perf_counter() - start)
+        return value, key
+
+    def format_report(self):
+        """Formats the per-stage timing and cache-hit report."""
+        lines = [f"{'stage':<48}{'cache':>8}{'seconds':>10}"]
+        for timing in self.timings:
+            lines.append(f"{timing['stage'][:47]:<48}{'hit' if timing['hit'] else 'miss':>8}{timing['seconds']:>10.2f}")
+        hits = sum(timing["hit"] for timing in self.timings)
+        total = sum(timing["seconds"] for timing in self.timings)
+        lines.append(f"{hits}/{len(self.timings)} stages from cache, {total:.2f} s in total")
+        return "\n".join(lines)
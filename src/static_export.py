@@ -0,0 +1,269 @@
+"""
+Static Pre-rendered Export
+
+For high-traffic events the dashboard can be served from a plain file server or a CDN instead
+of running Python on every request. This module precomputes what the chart callbacks return for
+every single-county selection (and for all counties) over every default year range: the full
+range of the data and each single year.
+
+The export directory holds:
+
+- `data/<sha256>.json`: the chart specs and the total economic loss of one filter state, named
+  after the hash of their content, so identical outputs are stored once and can be cached
+  forever,
+- `manifest.json`: the file of every precomputed filter state,
+- `index.html`: a static page that looks the selected filters up in the manifest, fetches the
+  file and draws the charts with vega-embed. Filter states that were not precomputed (other
+  year ranges, finer time series) are fetched from the `/api/charts` endpoint of the live server.
+
+Usage
+-----
+Run from the root of the repository:
+
+    ```bash
+    python -m src.static_export --output export --live-url https://dsci-532-2025-27-ca-wildfire-dashboard.onrender.com
+    python -m src.static_export --workers 8 --county Butte --county "Los Angeles"
+    ```
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .chart_render import normalize_filters
+from .chart_specs import make_chart_specs
+from .data import calfire_df
+from .regions import DEFAULT_REGION, UnknownRegion, get_region_store
+from .summary_chart import make_summary_chart
+
+ALL_COUNTIES = ""
+
+
+def make_payload(county=None, year=None, incident_name=None, granularity="Year", region=None):
+    """
+    Computes the outputs of the chart callbacks for a filter state.
+
+    The data of `region` (default is California, see `regions.py`) is loaded on first use.
+
+    Returns
+    -------
+    dict
+        The Vega specs keyed by chart name under "specs", and the formatted "total_cost".
+    """
+    region_data = get_region_store().get(region)
+    specs, filtered_df = make_chart_specs(region_data.calfire_df, county, year, incident_name, granularity, region_data=region_data)
+    total_cost = make_summary_chart(filtered_df)
+    total_cost = f'{total_cost} USD' if total_cost else "No Data Available"
+    return {"specs": specs, "total_cost": total_cost}
+
+
+def filter_key(county, year):
+    """Returns the manifest key of a county ("" for all counties) and a year range."""
+    return f"{county or ALL_COUNTIES}|{year[0]}|{year[1]}"
+
+
+def default_year_ranges():
+    """Returns the full year range of the data and every single year."""
+    first, last = int(calfire_df["Year"].min()), int(calfire_df["Year"].max())
+    return [[first, last]] + [[year, year] for year in range(first, last + 1)]
+
+
+def export_payload(county, year):
+    """Serializes the payload of one filter state, this is the unit of work of the process pool."""
+    payload = make_payload([county] if county else None, year)
+    content = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+    return filter_key(county, year), hashlib.sha256(content).hexdigest(), content
+
+
+def make_shell_html(counties, year_ranges, live_url):
+    """Builds the static page that reads the manifest and draws the charts."""
+    first, last = min(year[0] for year in year_ranges), max(year[1] for year in year_ranges)
+    county_options = '<option value="">All counties</option>' + "".join(
+        f'<option value="{html.escape(county)}">{html.escape(county)}</option>' for county in counties)
+    year_options = "".join(f'<option value="{year}">{year}</option>' for year in range(first, last + 1))
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>California Wildfire Dashboard</title>
+<script src="https://cdn.jsdelivr.net/npm/vega@5"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-embed@6"></script>
+<style>
+body {{font-family: Helvetica, Arial, sans-serif; margin: 1em;}}
+.charts {{display: grid; grid-template-columns: 1fr 1fr; gap: 20px;}}
+.chart {{width: 100%;}} h2 {{font-size: 18px; text-align: center; background-color: #d1d6de; padding: 4px;}}
+#summary {{text-align: center; font-size: 21px;}}
+</style>
+</head>
+<body>
+<h1>California Wildfire Dashboard</h1>
+<label>County <select id="county">{county_options}</select></label>
+<label>From <select id="year_start">{year_options}</select></label>
+<label>To <select id="year_end">{year_options}</select></label>
+<label>Time series by <select id="granularity"><option>Year</option><option>Month</option><option>Week</option></select></label>
+<h2>Total Economic Loss</h2><div id="summary"></div>
+<div class="charts">
+<div><h2>Roof Construction</h2><div id="roof_chart" class="chart"></div></div>
+<div><h2>Damage Level</h2><div id="damage_chart" class="chart"></div></div>
+<div><h2>Structures Damaged by County</h2><div id="structure_chart" class="chart"></div></div>
+<div><h2>Economic Loss Over Time</h2><div id="timeseries_chart" class="chart"></div></div>
+</div>
+<script>
+const LIVE_URL = {json.dumps(live_url.rstrip("/"))};
+const manifestRequest = fetch("manifest.json").then(response => response.json());
+document.getElementById("year_start").value = "{first}";
+document.getElementById("year_end").value = "{last}";
+
+async function fetchPayload(county, start, end, granularity) {{
+  const manifest = await manifestRequest;
+  const file = manifest.files[[county, start, end].join("|")];
+  if (file && granularity === "Year") {{
+    return (await fetch("data/" + file)).json();
+  }}
+  // Not precomputed: ask the live server
+  const query = new URLSearchParams({{year_start: start, year_end: end, granularity: granularity}});
+  if (county) query.append("county", county);
+  return (await fetch(LIVE_URL + "/api/charts?" + query)).json();
+}}
+
+async function update() {{
+  const value = id => document.getElementById(id).value;
+  const payload = await fetchPayload(value("county"), value("year_start"), value("year_end"), value("granularity"));
+  document.getElementById("summary").textContent = payload.total_cost;
+  for (const [name, spec] of Object.entries(payload.specs)) {{
+    const element = document.getElementById(name);
+    element.textContent = Object.keys(spec).length ? "" : "No Data Available";
+    if (Object.keys(spec).length) vegaEmbed(element, spec, {{actions: false}});
+  }}
+}}
+for (const id of ["county", "year_start", "year_end", "granularity"]) {{
+  document.getElementById(id).addEventListener("change", update);
+}}
+update();
+</script>
+</body>
+</html>
+"""
+
+
+def export_static(output_dir="export", counties=None, year_ranges=None, workers=None, live_url=""):
+    """
+    Precomputes the chart outputs of every single-county selection and default year range.
+
+    Parameters
+    ----------
+    output_dir : str, optional
+        Where to write the export (default is 'export').
+    counties : list of str, optional
+        Counties to export (default is every county). All counties together are always exported.
+    year_ranges : list of list of int, optional
+        Year ranges to export (default is `default_year_ranges()`).
+    workers : int, optional
+        Number of worker processes (default is one per CPU).
+    live_url : str, optional
+        Base URL of the live server, used by the page for filter states that were not
+        precomputed (default is the server the page is served from).
+
+    Returns
+    -------
+    dict
+        The number of filter states and files, the total size of the export in bytes and the
+        wall time in seconds.
+    """
+    start = time.perf_counter()
+    counties = counties if counties is not None else sorted(calfire_df["County"].unique())
+    year_ranges = year_ranges or default_year_ranges()
+    jobs = [(county, year) for county in [None] + list(counties) for year in year_ranges]
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    if workers == 1:
+        results = [export_payload(*job) for job in jobs]
+    else:
+        # Forked workers inherit the data already loaded by this process
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            results = list(executor.map(export_payload, *zip(*jobs), chunksize=4))
+
+    os.makedirs(os.path.join(output_dir, "data"), exist_ok=True)
+    files = {}
+    for key, digest, content in results:
+        file_name = f"{digest}.json"
+        path = os.path.join(output_dir, "data", file_name)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(content)
+        files[key] = file_name
+
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump({"files": files}, f, sort_keys=True)
+    with open(os.path.join(output_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(make_shell_html(counties, year_ranges, live_url))
+
+    written = set(files.values())
+    total_bytes = sum(os.path.getsize(os.path.join(output_dir, "data", name)) for name in written)
+    total_bytes += os.path.getsize(os.path.join(output_dir, "manifest.json")) + os.path.getsize(os.path.join(output_dir, "index.html"))
+    return {"filter_states": len(files), "files": len(written), "bytes": total_bytes,
+            "seconds": time.perf_counter() - start, "workers": workers}
+
+
+def register_export_routes(server):
+    """
+    Adds the `/api/charts` endpoint, which the static page falls back to, to the Flask server.
+
+    The filters are query parameters: `county` and `incident_name` (repeated), `year_start`
+    and `year_end`, `granularity`, and `region` (default is California). The response has the
+    same format as the exported files. The charts of California come from the caches of the
+    dashboard callbacks (see `callbacks.chart_outputs`), those of the other regions are
+    computed on every request.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    """
+    from flask import request
+
+    @server.route("/api/charts")
+    def charts():
+        year_start, year_end = request.args.get("year_start", type=int), request.args.get("year_end", type=int)
+        filters = normalize_filters(request.args.getlist("county"),
+                                    [year_start, year_end] if year_start is not None and year_end is not None else None,
+                                    request.args.getlist("incident_name"), request.args.get("granularity", "Year"))
+        region = request.args.get("region")
+        try:
+            if (region or DEFAULT_REGION) == DEFAULT_REGION:
+                from .callbacks import chart_outputs
+                specs, total_cost = chart_outputs(filters)
+                payload = {"specs": specs, "total_cost": f'{total_cost} USD' if total_cost else "No Data Available"}
+            else:
+                payload = make_payload(filters["county"], filters["year"], filters["incident_name"],
+                                       filters["granularity"], region)
+        except UnknownRegion:
+            return {"error": f"Unknown region {request.args.get('region')!r}"}, 404, {"Access-Control-Allow-Origin": "*"}
+        # The static page may be served from another origin
+        return payload, 200, {"Access-Control-Allow-Origin": "*"}
+
+
+def main(argv=None):
+    all_counties = sorted(calfire_df["County"].unique())
+    parser = argparse.ArgumentParser(description="Precompute the dashboard for a static file server.")
+    parser.add_argument("--output", default="export", help="output directory (default %(default)s)")
+    parser.add_argument("--county", action="append", choices=all_counties, metavar="COUNTY",
+                        help="county to export, repeat for several (default every county)")
+    parser.add_argument("--workers", type=int, help="worker processes (default one per CPU)")
+    parser.add_argument("--live-url", default="", help="base URL of the live server for filters that are not precomputed")
+    args = parser.parse_args(argv)
+
+    report = export_static(args.output, args.county or all_counties, workers=args.workers, live_url=args.live_url)
+    print(f"{report['filter_states']} filter states in {report['files']} files, "
+          f"{report['bytes'] / 1024 / 1024:.1f} MB in total, "
+          f"exported in {report['seconds']:.1f} s on {report['workers']} workers to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
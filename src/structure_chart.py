@@ -1,7 +1,9 @@
 import pandas as pd
 import altair as alt
 
-def make_structure_chart(calfire_df):
+from .summary_columns import split_summary_columns
+
+def make_structure_chart(calfire_df, top_counties=None, selected=None):
     """
     Creates a bar chart showing the number of damaged structures by county,
     categorized by structure type.
@@ -68,6 +70,12 @@ def make_structure_chart(calfire_df):
         - "Year": Year of the wildfire occurance.
         - "County": The county where the wildfire occurred.
         - "Total Economic Loss": Total economic loss caused by the wildfire.
+    top_counties : list of str, optional
+        The counties to show, highest first, e.g. from the precomputed leaderboard of
+        `leaderboard.py`. If `None`, the top 10 counties are computed from `calfire_df`.
+    selected : list of str, optional
+        The structure categories selected on the chart, highlighted. Clicking a bar segment
+        selects its category (see `crossfilter.py`). If `None`, the chart has no click selection.
 
     Returns
     -------
@@ -79,7 +87,8 @@ def make_structure_chart(calfire_df):
     -----
     - Groups data by County and Structure Category to calculate structure counts.
     - Renames structure categories using single-letter codes to work around Altair sorting issues.
-    - Filters to display only the top 10 counties with the most damaged structures.
+    - Filters to display only the top 10 counties with the most damaged structures, or the
+      given `top_counties`.
     - Uses a color scheme to differentiate structure categories.
     - Enables interactive tooltips for better user insights.
 
@@ -93,21 +102,34 @@ def make_structure_chart(calfire_df):
     >>> chart.show()
     """
 
-    calfire_structure = (calfire_df
-                         .iloc[:, list(range(47, 54)) + [56]]
+    if top_counties is not None:
+        # Only the rows of the ranked counties need to be melted
+        calfire_df = calfire_df[calfire_df['County'].isin(top_counties)]
+
+    _, structure_columns = split_summary_columns(calfire_df.columns)
+    calfire_structure = (calfire_df[structure_columns + ['County']]
                          .melt(id_vars='County',
                                var_name='Structure Category',
                                value_name='Count'))
 
-    top_10 = (calfire_structure
-          .groupby(['County'])['Count'].sum()
-          .nlargest(10)
-          .index.tolist())
+    if top_counties is not None:
+        top_10 = list(top_counties)
+    else:
+        top_10 = (calfire_structure
+              .groupby(['County'])['Count'].sum()
+              .nlargest(10)
+              .index.tolist())
     
-    calfire_structure = calfire_structure[calfire_structure['County'].isin(top_10)]
+    # One bar segment per county and category, whatever the rows of the data (incidents or sums)
+    calfire_structure = (calfire_structure[calfire_structure['County'].isin(top_10)]
+                         .groupby(['County', 'Structure Category'], as_index=False)['Count'].sum())
 
     alt.data_transformers.enable("vegafusion")
 
+    selection = alt.selection_point(fields=["Structure Category"], name="structure_select",
+                                    value=[{"Structure Category": category} for category in selected] or alt.Undefined) \
+        if selected is not None else None
+
     structure_chart = alt.Chart(calfire_structure).mark_bar().encode(
         y=alt.Y("County:N",
                 title=None,
@@ -128,10 +150,13 @@ def make_structure_chart(calfire_df):
                                                 "'G. Other Minor Structure': 'Other Minor Structure'}[datum.label]"
                                                 )
                                 ),
+                opacity=alt.OpacityValue(0.3, condition={"param": selection.name, "value": 1}) if selection is not None else alt.Undefined,
                 tooltip=["Structure Category:N", "Count:Q"]
                 ).properties(
         width='container',
         height=200
     )
+    if selection is not None:
+        structure_chart = structure_chart.add_params(selection)
     
     return structure_chart
\ No newline at end of file
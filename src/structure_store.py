@@ -0,0 +1,306 @@
+"""
+Structure-level Drill-down Store
+
+`data_import.py` aggregates the inspected structures into per-incident counts for the charts.
+This module keeps the cleaned per-structure records instead, as a compact columnar store that
+answers conjunctive filters such as "destroyed single residences with tile roofs over $1M
+assessed value in Butte, 2018" in milliseconds.
+
+Layout
+------
+- Every categorical column (County, Year, Incident Name, Damage, Roof Construction and
+  Structure Category) is stored as small integer codes plus its list of categories.
+- Every categorical column has a sorted index: the row ids ordered by code, with the offset of
+  each code (CSR layout), so the rows of any category are one contiguous slice.
+- Low-cardinality columns also have packed bitmaps, one bit per row and category, so dense
+  conjunctions are a few bitwise ANDs over n / 8 bytes.
+- Numeric columns ("Assessed Improved Value" and any extra ones such as coordinates) are
+  plain arrays.
+
+Examples
+--------
+>>> store = StructureStore.load('data/processed/structures.npz')
+>>> filters = {"County": ["Butte"], "Year": [2018], "Damage": ["Destroyed (>50%)"],
+...            "Roof Construction": ["Tile"], "Structure Category": ["Single Residence"]}
+>>> store.count(filters, min_value=1e6)
+>>> store.rows(filters, min_value=1e6, page=0, page_size=20)
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_COLUMNS = ["County", "Year", "Incident Name", "Damage", "Roof Construction", "Structure Category"]
+VALUE_COLUMN = "Assessed Improved Value"
+BITMAP_MAX_CATEGORIES = 32
+STRUCTURE_STORE_PATH = 'data/processed/structures.npz'
+
+
+def _code_dtype(n_categories):
+    return np.uint8 if n_categories <= np.iinfo(np.uint8).max else np.uint16 if n_categories <= np.iinfo(np.uint16).max else np.uint32
+
+
+class StructureStore:
+    """
+    Columnar store of per-structure records with secondary indexes.
+
+    Parameters
+    ----------
+    codes : dict of np.ndarray
+        Integer category codes of every categorical column.
+    categories : dict of list
+        Categories of every categorical column, indexed by code.
+    numeric : dict of np.ndarray
+        Numeric columns, including "Assessed Improved Value".
+    """
+
+    def __init__(self, codes, categories, numeric):
+        self.codes = codes
+        self.categories = categories
+        self.numeric = numeric
+        self.n_rows = len(numeric[VALUE_COLUMN])
+        self.category_codes = {column: {category: code for code, category in enumerate(values)}
+                               for column, values in categories.items()}
+        self._build_indexes()
+
+    @classmethod
+    def from_frame(cls, calfire_df, numeric_columns=()):
+        """
+        Builds the store from the cleaned structure-level DataFrame of `data_import.py`.
+
+        Parameters
+        ----------
+        calfire_df : pd.DataFrame
+            One row per inspected structure with the columns in `CATEGORICAL_COLUMNS` and
+            "Assessed Improved Value".
+        numeric_columns : iterable of str, optional
+            Extra numeric columns to keep, e.g. ("Latitude", "Longitude").
+
+        Returns
+        -------
+        StructureStore
+        """
+        codes, categories = {}, {}
+        for column in CATEGORICAL_COLUMNS:
+            column_codes, uniques = pd.factorize(calfire_df[column], sort=True)
+            codes[column] = column_codes.astype(_code_dtype(len(uniques)))
+            categories[column] = uniques.tolist()
+
+        numeric = {VALUE_COLUMN: calfire_df[VALUE_COLUMN].to_numpy(dtype=np.int64)}
+        for column in numeric_columns:
+            numeric[column] = calfire_df[column].to_numpy(dtype=np.float32)
+        return cls(codes, categories, numeric)
+
+    @classmethod
+    def load(cls, path=STRUCTURE_STORE_PATH):
+        """Loads a store written by `save`."""
+        with np.load(path) as archive:
+            categories = json.loads(str(archive["categories"]))
+            codes = {column: archive[f"code:{column}"] for column in categories}
+            numeric = {name[len("num:"):]: archive[name] for name in archive.files if name.startswith("num:")}
+        return cls(codes, categories, numeric)
+
+    def save(self, path=STRUCTURE_STORE_PATH):
+        """
+        Saves the codes, categories and numeric columns to a single `.npz` file.
+
+        The indexes are rebuilt on load, which takes one counting sort per column.
+        """
+        arrays = {f"code:{column}": codes for column, codes in self.codes.items()}
+        arrays.update({f"num:{column}": values for column, values in self.numeric.items()})
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, categories=np.array(json.dumps(self.categories)), **arrays)
+
+    def _build_indexes(self):
+        self.sorted_index, self.offsets, self.bitmaps = {}, {}, {}
+        row_dtype = np.int32 if self.n_rows < np.iinfo(np.int32).max else np.int64
+        for column, codes in self.codes.items():
+            n_categories = len(self.categories[column])
+            counts = np.bincount(codes, minlength=n_categories)
+            self.offsets[column] = np.concatenate([[0], np.cumsum(counts)])
+            self.sorted_index[column] = np.argsort(codes, kind="stable").astype(row_dtype)
+            if n_categories <= BITMAP_MAX_CATEGORIES:
+                self.bitmaps[column] = np.stack([np.packbits(codes == code) for code in range(n_categories)]) \
+                    if self.n_rows else np.zeros((n_categories, 0), dtype=np.uint8)
+
+    def _wanted_codes(self, column, values):
+        if column not in self.category_codes:
+            raise KeyError(f"Unknown column '{column}', expected one of {CATEGORICAL_COLUMNS}")
+        lookup = self.category_codes[column]
+        return np.array(sorted({lookup[value] for value in values if value in lookup}), dtype=np.int64)
+
+    def _posting_rows(self, column, wanted):
+        offsets = self.offsets[column]
+        slices = [self.sorted_index[column][offsets[code]:offsets[code + 1]] for code in wanted]
+        return np.sort(np.concatenate(slices)) if slices else np.empty(0, dtype=np.int64)
+
+    def query(self, filters=None, min_value=None, max_value=None):
+        """
+        Returns the ids of the rows matching every filter.
+
+        The most selective filter drives the query. If it matches few rows, its slice of the
+        sorted index is read and the other filters are checked on those rows only. Otherwise
+        the bitmaps of the low-cardinality filters are ANDed and the remaining filters are
+        checked on the surviving rows.
+
+        Parameters
+        ----------
+        filters : dict, optional
+            Accepted values of each categorical column, e.g. {"County": ["Butte"], "Year": [2018]}.
+            Columns not listed are not filtered.
+        min_value, max_value : float, optional
+            Inclusive bounds on "Assessed Improved Value".
+
+        Returns
+        -------
+        np.ndarray
+            Sorted row ids.
+        """
+        wanted = {column: self._wanted_codes(column, values) for column, values in (filters or {}).items()}
+        if any(len(codes) == 0 for codes in wanted.values()):
+            return np.empty(0, dtype=np.int64)
+
+        estimates = {column: int(sum(self.offsets[column][code + 1] - self.offsets[column][code] for code in codes))
+                     for column, codes in wanted.items()}
+        driver = min(estimates, key=estimates.get) if estimates else None
+
+        if driver is not None and (estimates[driver] * 16 < self.n_rows or not any(column in self.bitmaps for column in wanted)):
+            rows = self._posting_rows(driver, wanted[driver])
+            remaining = [column for column in wanted if column != driver]
+        elif driver is not None:
+            mask = None
+            for column in [column for column in wanted if column in self.bitmaps]:
+                column_bits = np.bitwise_or.reduce(self.bitmaps[column][wanted[column]], axis=0)
+                mask = column_bits if mask is None else mask & column_bits
+            rows = np.flatnonzero(np.unpackbits(mask, count=self.n_rows))
+            remaining = [column for column in wanted if column not in self.bitmaps]
+        else:
+            rows = np.arange(self.n_rows)
+            remaining = []
+
+        for column in remaining:
+            accepted = np.zeros(len(self.categories[column]), dtype=bool)
+            accepted[wanted[column]] = True
+            rows = rows[accepted[self.codes[column][rows]]]
+
+        if min_value is not None or max_value is not None:
+            values = self.numeric[VALUE_COLUMN][rows]
+            keep = np.ones(len(rows), dtype=bool)
+            if min_value is not None:
+                keep &= values >= min_value
+            if max_value is not None:
+                keep &= values <= max_value
+            rows = rows[keep]
+        return rows
+
+    def count(self, filters=None, min_value=None, max_value=None):
+        """Returns the number of rows matching the filters, see `query`."""
+        return len(self.query(filters, min_value, max_value))
+
+    def rows(self, filters=None, min_value=None, max_value=None, page=0, page_size=50):
+        """
+        Returns one page of the rows matching the filters, decoded to a DataFrame.
+
+        Parameters
+        ----------
+        filters, min_value, max_value
+            See `query`.
+        page : int, optional
+            Zero-based page number (default is 0).
+        page_size : int, optional
+            Rows per page (default is 50).
+
+        Returns
+        -------
+        pd.DataFrame
+            The categorical and numeric columns of the rows on the page, in row order.
+        """
+        rows = self.query(filters, min_value, max_value)[page * page_size:(page + 1) * page_size]
+        return self.decode(rows)
+
+    def decode(self, rows):
+        """
+        Decodes the given row ids to a DataFrame.
+
+        Parameters
+        ----------
+        rows : np.ndarray
+            Row ids, e.g. a slice of the result of `query`.
+
+        Returns
+        -------
+        pd.DataFrame
+            The categorical and numeric columns of the rows.
+        """
+        page_df = pd.DataFrame({column: np.asarray(self.categories[column], dtype=object)[self.codes[column][rows]]
+                                for column in CATEGORICAL_COLUMNS})
+        for column, values in self.numeric.items():
+            page_df[column] = values[rows]
+        return page_df
+
+    def nbytes(self):
+        """Returns the memory used by the columns and indexes in bytes."""
+        arrays = [*self.codes.values(), *self.numeric.values(), *self.sorted_index.values(), *self.bitmaps.values()]
+        return int(sum(array.nbytes for array in arrays))
+
+
+_structure_store = None
+
+
+def get_structure_store(path=STRUCTURE_STORE_PATH):
+    """
+    Returns the store written by `data_import.py`, loaded on first use.
+
+    Returns
+    -------
+    StructureStore or None
+        `None` if the store has not been generated.
+    """
+    global _structure_store
+    if _structure_store is None and os.path.exists(path):
+        _structure_store = StructureStore.load(path)
+    return _structure_store
+
+
+def register_structure_routes(server):
+    """
+    Adds the `/api/structures` endpoint to the Flask server.
+
+    Every categorical column can be filtered with repeated query parameters named after the
+    column in lower case with underscores, e.g.
+    `/api/structures?county=Butte&year=2018&damage=Destroyed (>50%)&min_value=1000000&page=0`.
+    The response holds the total count and one page of rows. A year that is not an integer is
+    answered with a 400, `page` is at least 0 and `page_size` between 1 and 1000.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    """
+    from flask import request
+
+    @server.route("/api/structures")
+    def structures():
+        store = get_structure_store()
+        if store is None:
+            return {"error": "The structure store has not been generated, run src/data_import.py"}, 503
+
+        filters = {}
+        for column in CATEGORICAL_COLUMNS:
+            values = request.args.getlist(column.lower().replace(" ", "_"))
+            if values and column == "Year":
+                try:
+                    values = [int(value) for value in values]
+                except ValueError:
+                    return {"error": f"Invalid year {values!r}, expected integers"}, 400
+            if values:
+                filters[column] = values
+        rows = store.query(filters, request.args.get("min_value", type=float), request.args.get("max_value", type=float))
+
+        page = max(request.args.get("page", 0, type=int), 0)
+        page_size = min(max(request.args.get("page_size", 50, type=int), 1), 1000)
+        page_df = store.decode(rows[page * page_size:(page + 1) * page_size])
+        return {"count": len(rows), "page": page, "page_size": page_size,
+                "rows": json.loads(page_df.to_json(orient="records"))}
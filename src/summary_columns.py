@@ -0,0 +1,46 @@
+"""
+Column Layout of the Summary Dataset
+
+`data_import.py` writes one row per incident, year and county. The counted columns come first:
+one per roof construction x damage category pair, named by the (roof, damage) tuple, then one
+per structure category. "Incident Name", "Year", "County" and "Total Economic Loss" follow.
+
+Which pairs and categories there are depends on the raw data: a region, a subset of the raw
+files or synthetic data can have fewer than the California extract. Code reading the counts
+finds their columns with `split_summary_columns` instead of by position.
+
+This module has no imports, so it can be imported both from the `src` package and by the
+scripts run with `src` on the path (`data_import.py`, `synthetic_dins.py`).
+"""
+
+
+def split_summary_columns(columns):
+    """
+    Splits the counted columns of the summary dataset.
+
+    Parameters
+    ----------
+    columns : pd.Index or list
+        The columns of a summary dataset, or of a frame with the same layout (e.g. the chart
+        data of a cross-filter state).
+
+    Returns
+    -------
+    tuple of (list of tuple, list of str)
+        The roof x damage columns, (roof construction, damage category) tuples, and the
+        structure category columns, in the order of the frame.
+
+    Raises
+    ------
+    ValueError
+        If there is no "Incident Name" column ending the counted columns.
+
+    Examples
+    --------
+    >>> roof_damage_columns, structure_columns = split_summary_columns(calfire_df.columns)
+    >>> calfire_df[structure_columns].sum(axis=1)
+    """
+    columns = list(columns)
+    counted = columns[:columns.index("Incident Name")]
+    return ([column for column in counted if isinstance(column, tuple)],
+            [column for column in counted if not isinstance(column, tuple)])
@@ -0,0 +1,302 @@
+"""
+Synthetic DINS Data Generator
+
+Writes raw CAL FIRE Damage Inspection (DINS) shaped CSV files, with the columns read by
+`data_import.py`, at any scale, to stress test the data pipeline and the dashboard.
+
+The distributions are taken from the processed summary data:
+
+- structures are spread over the real incidents (incident, year and county) in proportion to
+  their number of inspected structures, raised to the power `skew` (1 keeps the real
+  distribution, 0 spreads structures evenly over incidents, above 1 concentrates them on the
+  largest fires),
+- the roof construction x damage and the structure category of every structure follow the
+  counts of its incident,
+- the assessed value follows a log-normal distribution with the mean value per structure of
+  its incident,
+- every incident gets a start date in its year, most likely during the fire season, and a
+  center inside its county, around which its structures are scattered.
+
+Rows are generated and appended in chunks, so the memory used does not depend on the size of
+the output.
+
+Usage
+-----
+Run from the root of the repository:
+
+    ```bash
+    python src/synthetic_dins.py data/raw/synthetic.csv --rows 10000000
+    python src/synthetic_dins.py data/raw/synthetic/ --rows 10000000 --files 8 --skew 1.5 --copies 10
+    python src/data_import.py data/raw/synthetic/ --workers 8
+    ```
+"""
+
+import argparse
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+from summary_columns import split_summary_columns
+
+SUMMARY_PATH = 'data/processed/processed_cal_fire.pkl'
+GEOJSON_PATH = 'data/processed/county_boundaries.geojson'
+# Share of incidents starting in each month, most fires start in the summer and fall
+MONTH_WEIGHTS = np.array([1, 1, 1, 2, 3, 6, 10, 12, 12, 10, 6, 2], dtype=float)
+VALUE_SIGMA = 1.0
+COORDINATE_SPREAD = 0.05
+RAW_COLUMNS = ["* Damage", "County", "* Incident Name", "Incident Start Date", "Structure Category",
+               "* Roof Construction", "Assessed Improved Value (parcel)", "Latitude", "Longitude"]
+
+
+def _strip_prefix(category):
+    # The summary columns carry sorting prefixes such as "A. No Damage", see data_import.py
+    return category.split(". ", 1)[1] if ". " in category[:4] else category
+
+
+def _county_bounds(geojson_path):
+    with open(geojson_path) as f:
+        features = json.load(f)["features"]
+
+    bounds = {}
+    for feature in features:
+        if not feature.get("geometry"):
+            continue
+        points = []
+        stack = [feature["geometry"]["coordinates"]]
+        while stack:
+            value = stack.pop()
+            if value and isinstance(value[0], (int, float)):
+                points.append(value[:2])
+            else:
+                stack.extend(value)
+        points = np.asarray(points)
+        bounds[feature["id"]] = (*points.min(axis=0), *points.max(axis=0))
+    return bounds
+
+
+def load_profile(summary_path=SUMMARY_PATH, geojson_path=GEOJSON_PATH):
+    """
+    Extracts the per-incident distributions from the processed data.
+
+    Parameters
+    ----------
+    summary_path : str, optional
+        The summary dataset (default is 'data/processed/processed_cal_fire.pkl').
+    geojson_path : str, optional
+        The county boundaries (default is 'data/processed/county_boundaries.geojson').
+
+    Returns
+    -------
+    dict
+        The incidents ("Incident Name", "Year", "County", "Structures" and "Mean Value"), the
+        probabilities of every roof x damage pair and structure category per incident, their
+        raw labels, and the bounding box of every county.
+    """
+    with open(summary_path, 'rb') as f:
+        summary_df = pickle.load(f)
+
+    roof_damage_columns, structure_columns = split_summary_columns(summary_df.columns)
+    roof_damage = summary_df[roof_damage_columns].to_numpy(dtype=float)
+    structure = summary_df[structure_columns].to_numpy(dtype=float)
+    n_structures = structure.sum(axis=1)
+    keep = n_structures > 0
+
+    incidents = summary_df.loc[keep, ["Incident Name", "Year", "County"]].reset_index(drop=True)
+    incidents["Structures"] = n_structures[keep]
+    incidents["Mean Value"] = summary_df.loc[keep, "Total Economic Loss"].to_numpy() / n_structures[keep]
+
+    return {
+        "incidents": incidents,
+        "roof_damage_probs": roof_damage[keep] / roof_damage[keep].sum(axis=1, keepdims=True),
+        "structure_probs": structure[keep] / structure[keep].sum(axis=1, keepdims=True),
+        "roofs": [roof for roof, _ in roof_damage_columns],
+        "damages": [_strip_prefix(damage) for _, damage in roof_damage_columns],
+        "structure_categories": [_strip_prefix(category) for category in structure_columns],
+        "county_bounds": _county_bounds(geojson_path),
+    }
+
+
+def make_incidents(profile, copies=1, skew=1.0, seed=0):
+    """
+    Draws the incidents of the synthetic data, with their weight, start date and center.
+
+    Parameters
+    ----------
+    profile : dict
+        The output of `load_profile`.
+    copies : int, optional
+        Number of synthetic incidents per real incident (default is 1). Copies are named
+        "<name> 2", "<name> 3" and so on, and get their own date and center.
+    skew : float, optional
+        Exponent applied to the number of structures of every incident (default is 1).
+    seed : int, optional
+        Seed of the random draws.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per synthetic incident with "Source" (the index of the real incident),
+        "Incident Name", "County", "Weight", "Incident Start Date" (formatted as in the raw
+        data), "Latitude", "Longitude" and "Mean Value".
+    """
+    rng = np.random.default_rng(seed)
+    real = profile["incidents"]
+    source = np.repeat(np.arange(len(real)), copies)
+    copy_number = np.tile(np.arange(1, copies + 1), len(real))
+
+    incidents = pd.DataFrame({"Source": source})
+    incidents["Incident Name"] = [name if number == 1 else f"{name} {number}"
+                                  for name, number in zip(real["Incident Name"].to_numpy()[source], copy_number)]
+    incidents["County"] = real["County"].to_numpy()[source]
+    incidents["Mean Value"] = real["Mean Value"].to_numpy()[source]
+
+    weights = real["Structures"].to_numpy()[source] ** skew
+    incidents["Weight"] = weights / weights.sum()
+
+    months = rng.choice(12, len(incidents), p=MONTH_WEIGHTS / MONTH_WEIGHTS.sum()) + 1
+    starts = pd.to_datetime(pd.DataFrame({"year": real["Year"].to_numpy()[source], "month": months, "day": 1}))
+    starts += pd.to_timedelta(rng.integers(0, 28, len(incidents)), unit="D") + pd.to_timedelta(rng.integers(0, 24, len(incidents)), unit="h")
+    incidents["Incident Start Date"] = starts.dt.strftime("%m/%d/%Y %I:%M:%S %p")
+
+    bounds = np.array([profile["county_bounds"].get(county, (np.nan,) * 4) for county in incidents["County"]])
+    incidents["Longitude"] = rng.uniform(bounds[:, 0], bounds[:, 2]) if len(bounds) else []
+    incidents["Latitude"] = rng.uniform(bounds[:, 1], bounds[:, 3]) if len(bounds) else []
+    return incidents
+
+
+def generate_chunks(profile, incidents, n_rows, chunk_size=250_000, dirty_fraction=0.02, seed=0):
+    """
+    Generates the structures in chunks.
+
+    Parameters
+    ----------
+    profile : dict
+        The output of `load_profile`.
+    incidents : pd.DataFrame
+        The output of `make_incidents`.
+    n_rows : int
+        Total number of rows.
+    chunk_size : int, optional
+        Rows per chunk (default is 250,000).
+    dirty_fraction : float, optional
+        Share of rows with an "Inaccessible" damage or a blank roof construction, which
+        `data_import.py` drops (default is 0.02).
+    seed : int, optional
+        Seed of the random draws.
+
+    Yields
+    ------
+    pd.DataFrame
+        Chunks of rows with the raw DINS column names.
+    """
+    rng = np.random.default_rng(seed + 1)
+    roofs, damages = np.array(profile["roofs"], dtype=object), np.array(profile["damages"], dtype=object)
+    structure_categories = np.array(profile["structure_categories"], dtype=object)
+    source = incidents["Source"].to_numpy()
+    mean_values = incidents["Mean Value"].to_numpy()
+    mu = np.log(np.maximum(mean_values, 1)) - VALUE_SIGMA ** 2 / 2
+
+    for start in range(0, n_rows, chunk_size):
+        size = min(chunk_size, n_rows - start)
+        # Rows stay grouped by incident as in the raw extracts
+        counts = rng.multinomial(size, incidents["Weight"].to_numpy())
+        rows = np.repeat(np.arange(len(incidents)), counts)
+
+        roof_damage = np.empty(size, dtype=np.int64)
+        structure = np.empty(size, dtype=np.int64)
+        offset = 0
+        for incident in np.flatnonzero(counts):
+            count = counts[incident]
+            roof_damage[offset:offset + count] = rng.choice(len(roofs), count, p=profile["roof_damage_probs"][source[incident]])
+            structure[offset:offset + count] = rng.choice(len(structure_categories), count, p=profile["structure_probs"][source[incident]])
+            offset += count
+
+        values = np.where(mean_values[rows] > 0, rng.lognormal(mu[rows], VALUE_SIGMA), 0).round()
+        chunk = pd.DataFrame({
+            "* Damage": damages[roof_damage],
+            "County": incidents["County"].to_numpy()[rows],
+            "* Incident Name": incidents["Incident Name"].to_numpy()[rows],
+            "Incident Start Date": incidents["Incident Start Date"].to_numpy()[rows],
+            "Structure Category": structure_categories[structure],
+            "* Roof Construction": roofs[roof_damage],
+            "Assessed Improved Value (parcel)": values,
+            "Latitude": incidents["Latitude"].to_numpy()[rows] + rng.normal(0, COORDINATE_SPREAD, size),
+            "Longitude": incidents["Longitude"].to_numpy()[rows] + rng.normal(0, COORDINATE_SPREAD, size),
+        })
+
+        dirty = np.flatnonzero(rng.random(size) < dirty_fraction)
+        half = len(dirty) // 2
+        chunk.loc[dirty[:half], "* Damage"] = "Inaccessible"
+        chunk.loc[dirty[half:], "* Roof Construction"] = " "
+        yield chunk
+
+
+def write_synthetic_dins(output, n_rows, files=1, copies=1, skew=1.0, chunk_size=250_000, dirty_fraction=0.02, seed=0,
+                         summary_path=SUMMARY_PATH, geojson_path=GEOJSON_PATH):
+    """
+    Writes synthetic raw DINS data to one or more CSV files.
+
+    Parameters
+    ----------
+    output : str
+        A CSV file if `files` is 1, otherwise a directory for "synthetic_<i>.csv" files.
+    n_rows : int
+        Total number of rows.
+    files : int, optional
+        Number of files, each holding a share of the rows (default is 1).
+    copies, skew
+        See `make_incidents`.
+    chunk_size, dirty_fraction
+        See `generate_chunks`.
+    seed : int, optional
+        Seed of the random draws.
+    summary_path, geojson_path
+        See `load_profile`.
+
+    Returns
+    -------
+    list of str
+        The files written.
+    """
+    profile = load_profile(summary_path, geojson_path)
+    incidents = make_incidents(profile, copies, skew, seed)
+
+    if files == 1:
+        paths = [output]
+    else:
+        os.makedirs(output, exist_ok=True)
+        paths = [os.path.join(output, f"synthetic_{i}.csv") for i in range(files)]
+    os.makedirs(os.path.dirname(paths[0]) or ".", exist_ok=True)
+
+    rows_per_file = [n_rows // files + (i < n_rows % files) for i in range(files)]
+    for i, (path, file_rows) in enumerate(zip(paths, rows_per_file)):
+        with open(path, "w", newline="") as f:
+            for j, chunk in enumerate(generate_chunks(profile, incidents, file_rows, chunk_size, dirty_fraction, seed + i)):
+                chunk.to_csv(f, header=j == 0, index=False)
+            if file_rows == 0:
+                pd.DataFrame(columns=RAW_COLUMNS).to_csv(f, index=False)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic raw DINS data.")
+    parser.add_argument("output", help="CSV file, or directory when --files is above 1")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="number of structures (default %(default)s)")
+    parser.add_argument("--files", type=int, default=1, help="number of CSV files (default 1)")
+    parser.add_argument("--copies", type=int, default=1, help="synthetic incidents per real incident (default 1)")
+    parser.add_argument("--skew", type=float, default=1.0,
+                        help="exponent on incident sizes: 1 keeps the real distribution, 0 is uniform (default 1)")
+    parser.add_argument("--chunk-size", type=int, default=250_000, help="rows generated at once (default %(default)s)")
+    parser.add_argument("--dirty-fraction", type=float, default=0.02, help="share of rows dropped by the cleaning (default 0.02)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default 0)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = write_synthetic_dins(args.output, args.rows, args.files, args.copies, args.skew, args.chunk_size, args.dirty_fraction, args.seed)
+    seconds = time.perf_counter() - start
+    size = sum(os.path.getsize(path) for path in paths)
+    print(f"{args.rows} rows in {len(paths)} files, {size / 1024 / 1024:.1f} MB, "
+          f"written in {seconds:.1f} s ({args.rows / seconds:,.0f} rows/s)")
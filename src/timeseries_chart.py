@@ -1,9 +1,17 @@
 import pandas as pd
 import altair as alt
 
-def make_time_series_chart(calfire_df, selected_counties=None):
+# x-axis encoding for each supported time granularity
+GRANULARITY_AXES = {
+    "Year": {"type": "O", "time_unit": None, "format": None},
+    "Month": {"type": "T", "time_unit": "yearmonth", "format": "%b %Y"},
+    "Week": {"type": "T", "time_unit": "yearmonthdate", "format": "%d %b %Y"},
+}
+
+def make_time_series_chart(calfire_df, selected_counties=None, granularity="Year", top_counties=None):
     """
-    Generate an Altair time-series line chart visualizing total economic losses from wildfires by county and year.
+    Generate an Altair time-series line chart visualizing total economic losses from wildfires by county and
+    year, month or week.
 
     The chart aggregates total economic loss per county per year, automatically adjusting units to billions, millions,
     or dollars depending on the magnitude of the maximum loss. If no counties are explicitly selected, the chart defaults
@@ -15,11 +23,20 @@ def make_time_series_chart(calfire_df, selected_counties=None):
         DataFrame containing wildfire data. Required columns include:
         - 'County': County names.
         - 'Year': Year of the reported economic loss.
+        - 'Month' or 'Week': Start of the period of the reported economic loss, only required when
+          `granularity` is "Month" or "Week" (see the rollups written by `data_import.py`).
         - 'Total Economic Loss': Numeric economic losses per event or year.
 
     selected_counties : list of str, optional
         Specific counties to visualize. If `None`, defaults to showing the top 10 counties.
 
+    granularity : str, optional
+        Time period of each point, one of "Year", "Month" or "Week" (default is "Year").
+
+    top_counties : list of str, optional
+        The counties to show when none are selected, e.g. from the precomputed leaderboard of
+        `leaderboard.py`. If `None`, the top 10 counties are computed from `calfire_df`.
+
     Returns
     -------
     alt.Chart or dict
@@ -41,13 +58,17 @@ def make_time_series_chart(calfire_df, selected_counties=None):
     -----
     - The chart includes interactive elements that allow users to filter data by clicking on counties in the legend.
     - Numeric formatting automatically adapts based on the magnitude of the economic loss data.
+    - Monthly and weekly points are read from the precomputed rollups, so a finer granularity
+      costs the same as the yearly chart.
     """
     
     if calfire_df.empty:
         return {}
+
+    axis = GRANULARITY_AXES[granularity]
     
     calfire_time_series = (calfire_df
-                           .groupby(['County', 'Year'])["Total Economic Loss"]
+                           .groupby(['County', granularity])["Total Economic Loss"]
                            .sum().reset_index())
 
     #calfire_time_series["Total Economic Loss (Billions of USD)"] /= 1e9
@@ -65,12 +86,15 @@ def make_time_series_chart(calfire_df, selected_counties=None):
         y_axis_title = "Total Economic Loss (USD)"
         y_axis_format = ",.0f"
 
-    top_10_counties = (
-        calfire_time_series.groupby("County")["Total Economic Loss"]
-        .sum()
-        .nlargest(10)
-        .index.tolist()
-    )
+    if top_counties is not None:
+        top_10_counties = list(top_counties)
+    else:
+        top_10_counties = (
+            calfire_time_series.groupby("County")["Total Economic Loss"]
+            .sum()
+            .nlargest(10)
+            .index.tolist()
+        )
 
     if not selected_counties:
         filtered_df = calfire_time_series[calfire_time_series["County"].isin(top_10_counties)]
@@ -83,9 +107,10 @@ def make_time_series_chart(calfire_df, selected_counties=None):
     color_scale = alt.Scale(scheme="category20")
     timeseries_chart = alt.Chart(filtered_df).mark_line(point=True).encode(
         x=alt.X(
-            "Year:O",
-            title="Year",
-            axis=alt.Axis(labelAngle=45, tickMinStep=1)
+            f"{granularity}:{axis['type']}",
+            title=granularity,
+            timeUnit=axis["time_unit"] or alt.Undefined,
+            axis=alt.Axis(labelAngle=45, tickMinStep=1, format=axis["format"] or alt.Undefined)
         ),
        y=alt.Y(
             "Total Economic Loss:Q",
@@ -103,7 +128,7 @@ def make_time_series_chart(calfire_df, selected_counties=None):
             )
         ),
         opacity=opacity_rule,
-        tooltip=["Year:O", "County", alt.Tooltip("Total Economic Loss:Q", title=y_axis_title, format=y_axis_format)]
+        tooltip=[alt.Tooltip(f"{granularity}:{axis['type']}", timeUnit=axis["time_unit"] or alt.Undefined), "County", alt.Tooltip("Total Economic Loss:Q", title=y_axis_title, format=y_axis_format)]
 
     ).properties(
         width='container',
@@ -0,0 +1,220 @@
+"""
+Quantile Sketches of Assessed Improved Values
+
+The summary dataset only holds sums of the assessed improved value of the inspected
+structures. Percentiles (the median structure, the 90th or 99th percentile) cannot be derived
+from sums, and computing them exactly needs the value of every structure of a filter. Instead,
+`data_import.py` summarizes the values of every County x Year and of every incident (Incident
+Name x Year x County, the rows of the summary dataset) in a DDSketch [1]: the values are
+counted in logarithmic buckets, bucket k holding the values in (gamma^(k-1), gamma^k] with
+gamma = (1 + alpha) / (1 - alpha), and values under $1 in a bucket of their own.
+
+Sketches are merged by adding their bucket counts, so the sketch of any filter is the sum of
+the sketches of its rows. A percentile query costs one pass over the (row, bucket) counts of
+the filter, at most about 1,000 buckets per row, whatever the number of structures.
+
+Error bounds
+------------
+For the n structures matching a filter and a quantile q, the estimate returned for q is within
+a relative error of alpha (1% by default) of the exact value of rank floor(q * (n - 1)) in the
+sorted values: |estimate - exact| <= alpha * exact. Ranks and counts are exact, only the
+values are approximated, and merging sketches adds no error. Values under $1 (structures
+without an assessment) are reported as 0. With alpha = 1% values up to $1B span about 1,050
+buckets.
+
+References
+----------
+[1] C. Masson, J. E. Rim and H. K. Lee. DDSketch: A Fast and Fully-Mergeable Quantile Sketch
+    with Relative-Error Guarantees. PVLDB 12(12), 2019.
+
+Examples
+--------
+>>> distribution = ValueDistribution(make_value_sketches(structures_df))
+>>> distribution.quantiles(county=["Butte"], year=[2017, 2020], quantiles=[0.5, 0.9, 0.99])["quantiles"]
+"""
+
+import numpy as np
+import pandas as pd
+
+RELATIVE_ACCURACY = 0.01
+VALUE_COLUMN = "Assessed Improved Value"
+COUNTY_YEAR_INDEX = ["County", "Year"]
+INCIDENT_INDEX = ["Incident Name", "Year", "County"]
+# Bucket of the values under $1
+ZERO_BUCKET = -1
+PERCENTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+
+def _gamma(alpha):
+    return (1 + alpha) / (1 - alpha)
+
+
+def bucket_index(values, alpha=RELATIVE_ACCURACY):
+    """
+    Returns the bucket of every value.
+
+    Parameters
+    ----------
+    values : array-like of float
+        Non-negative values, missing ones count as 0.
+    alpha : float, optional
+        The relative accuracy of the sketch (default is 1%).
+
+    Returns
+    -------
+    np.ndarray of int32
+        `ceil(log_gamma(value))` for values of at least 1, `ZERO_BUCKET` for the others.
+    """
+    values = np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+    buckets = np.full(values.shape, ZERO_BUCKET, dtype=np.int32)
+    positive = values >= 1
+    buckets[positive] = np.ceil(np.log(values[positive]) / np.log(_gamma(alpha)) - 1e-9).astype(np.int32)
+    return buckets
+
+
+def bucket_value(buckets, alpha=RELATIVE_ACCURACY):
+    """Returns the value standing for every bucket, within `alpha` of all the values it holds."""
+    buckets = np.asarray(buckets)
+    gamma = _gamma(alpha)
+    return np.where(buckets == ZERO_BUCKET, 0.0, 2 * gamma ** buckets.astype(float) / (gamma + 1))
+
+
+def _sketch_table(calfire_df, index, buckets):
+    table = calfire_df[index].assign(Bucket=buckets)
+    return table.groupby(index + ["Bucket"], observed=True).size().rename("Count").reset_index()
+
+
+def make_value_sketches(calfire_df, alpha=RELATIVE_ACCURACY):
+    """
+    Builds the sketches of the assessed improved values of the structures.
+
+    Parameters
+    ----------
+    calfire_df : pd.DataFrame
+        Structure-level records with "Incident Name", "Year", "County" and "Assessed Improved Value".
+    alpha : float, optional
+        The relative accuracy of the sketches (default is 1%).
+
+    Returns
+    -------
+    dict
+        "alpha", and the bucket counts per County x Year ("county_year") and per incident
+        ("incident"), one row per key and non-empty bucket with its "Bucket" and "Count".
+    """
+    buckets = bucket_index(calfire_df[VALUE_COLUMN].to_numpy(), alpha)
+    return {"alpha": alpha,
+            "county_year": _sketch_table(calfire_df, COUNTY_YEAR_INDEX, buckets),
+            "incident": _sketch_table(calfire_df, INCIDENT_INDEX, buckets)}
+
+
+def merge_value_sketches(sketches):
+    """
+    Merges the sketches of several sets of structures, e.g. the partial aggregates of several raw files.
+
+    Parameters
+    ----------
+    sketches : list of dict
+        Outputs of `make_value_sketches` with the same accuracy.
+
+    Returns
+    -------
+    dict
+        The sketches of all the structures, as if built from a single set.
+    """
+    alpha = sketches[0]["alpha"]
+    if any(sketch["alpha"] != alpha for sketch in sketches):
+        raise ValueError("Sketches of different accuracies cannot be merged")
+
+    def merge(name, index):
+        combined = pd.concat([sketch[name] for sketch in sketches], ignore_index=True)
+        return combined.groupby(index + ["Bucket"], as_index=False, observed=True)["Count"].sum()
+
+    return {"alpha": alpha,
+            "county_year": merge("county_year", COUNTY_YEAR_INDEX),
+            "incident": merge("incident", INCIDENT_INDEX)}
+
+
+def sketch_quantiles(buckets, counts, quantiles=PERCENTILES, alpha=RELATIVE_ACCURACY):
+    """
+    Estimates quantiles from bucket counts.
+
+    Parameters
+    ----------
+    buckets, counts : array-like of int
+        The buckets of a sketch and their counts, buckets may repeat (they are summed).
+    quantiles : sequence of float, optional
+        Quantiles between 0 and 1 (default is `PERCENTILES`).
+    alpha : float, optional
+        The relative accuracy of the sketch.
+
+    Returns
+    -------
+    dict
+        The number of values ("count") and the estimate of every quantile ("quantiles"),
+        `None` when the sketch is empty.
+    """
+    buckets = np.asarray(buckets, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    if counts.sum() == 0:
+        return {"count": 0, "quantiles": {q: None for q in quantiles}}
+
+    totals = np.bincount(buckets - ZERO_BUCKET, weights=counts)
+    nonempty = np.flatnonzero(totals)
+    cumulative = np.cumsum(totals[nonempty])
+    n = int(cumulative[-1])
+    # The bucket holding the value of rank floor(q * (n - 1)) of the sorted values
+    ranks = np.floor(np.asarray(quantiles, dtype=float) * (n - 1))
+    positions = np.searchsorted(cumulative, ranks, side="right")
+    values = bucket_value(nonempty[positions] + ZERO_BUCKET, alpha)
+    return {"count": n, "quantiles": {q: round(float(value), 2) for q, value in zip(quantiles, values)}}
+
+
+class ValueDistribution:
+    """
+    Answers percentile queries on the assessed improved values for any dashboard filter.
+
+    The County x Year sketches answer the filters without incidents, the incident sketches
+    the others.
+
+    Parameters
+    ----------
+    sketches : dict
+        The output of `make_value_sketches`.
+    """
+
+    def __init__(self, sketches):
+        self.alpha = sketches["alpha"]
+        self._tables = {}
+        for name in ("county_year", "incident"):
+            table = sketches[name]
+            self._tables[name] = {column: table[column].to_numpy() for column in table.columns}
+
+    def quantiles(self, county=None, year=None, incident_name=None, quantiles=PERCENTILES):
+        """
+        Estimates the quantiles of the values of the structures matching a filter.
+
+        Parameters
+        ----------
+        county : list of str, optional
+            Counties to keep, all if `None` or empty.
+        year : list of int, optional
+            Inclusive [first, last] year range, all years if `None`.
+        incident_name : list of str, optional
+            Incidents to keep, all if `None` or empty.
+        quantiles : sequence of float, optional
+            Quantiles between 0 and 1 (default is `PERCENTILES`).
+
+        Returns
+        -------
+        dict
+            See `sketch_quantiles`, the estimates are within `alpha` of the exact values.
+        """
+        table = self._tables["incident" if incident_name else "county_year"]
+        mask = np.ones(len(table["Count"]), dtype=bool)
+        if year:
+            mask &= (table["Year"] >= year[0]) & (table["Year"] <= year[1])
+        if county:
+            mask &= np.isin(table["County"], list(county))
+        if incident_name:
+            mask &= np.isin(table["Incident Name"], list(incident_name))
+        return sketch_quantiles(table["Bucket"][mask], table["Count"][mask], quantiles, self.alpha)
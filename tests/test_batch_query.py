@@ -0,0 +1,78 @@
+import pytest
+import numpy as np
+import pandas as pd
+import pickle
+import flask
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import batch_query
+from src.batch_query import BatchAggregator, register_batch_routes
+from src.summary_columns import split_summary_columns
+
+
+@pytest.fixture(scope="module")
+def calfire_df():
+    with open('data/processed/processed_cal_fire.pkl', 'rb') as f:
+        return pickle.load(f)
+
+
+def filter_like_the_callbacks(calfire_df, spec):
+    if spec.get("years"):
+        calfire_df = calfire_df[calfire_df["Year"].between(*spec["years"])]
+    if spec.get("counties"):
+        calfire_df = calfire_df[calfire_df["County"].isin(spec["counties"])]
+    if spec.get("incidents"):
+        calfire_df = calfire_df[calfire_df["Incident Name"].isin(spec["incidents"])]
+    return calfire_df
+
+
+def test_aggregate_matches_pandas(calfire_df):
+    """Test that every filter set gets the same totals as filtering the summary data like the chart callbacks."""
+    counties = sorted(calfire_df["County"].unique())
+    specs = [{}, {"years": [2018, 2018]}, {"counties": counties[:3], "years": [2015, 2020]},
+             {"incidents": list(calfire_df["Incident Name"].unique()[:2])}, {"counties": ["Nowhere"]}]
+    specs += [{"counties": [county], "years": [year, year]} for county in counties[:5] for year in range(2013, 2026)]
+
+    for spec, result in zip(specs, BatchAggregator(calfire_df).aggregate(specs)):
+        expected = filter_like_the_callbacks(calfire_df, spec)
+        assert result["filter"] == spec
+        assert result["records"] == len(expected)
+        assert result["economic_loss"] == pytest.approx(expected["Total Economic Loss"].sum())
+        assert sum(result["structure"].values()) == expected[split_summary_columns(expected.columns)[1]].to_numpy().sum()
+        roof, damage = expected.columns[0]
+        assert result["roof_damage"][roof][damage[3:]] == expected.iloc[:, 0].sum()
+
+
+def test_aggregates_endpoint(calfire_df, monkeypatch):
+    """Test the batch endpoint and its validation of filter sets."""
+    monkeypatch.setattr(batch_query, "_batch_aggregator", BatchAggregator(calfire_df))
+    server = flask.Flask(__name__)
+    register_batch_routes(server)
+    client = server.test_client()
+
+    response = client.post("/api/aggregates", json={"filters": [{"years": [2018, 2018]}, {}]})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert len(results) == 2 and results[0]["economic_loss"] <= results[1]["economic_loss"]
+
+    assert client.post("/api/aggregates", json=[{"year": [2018, 2018]}]).status_code == 400
+    assert client.post("/api/aggregates", json=[{"years": [2018]}]).status_code == 400
+    assert client.post("/api/aggregates", data="not json").status_code == 400
+    assert client.post("/api/aggregates", json=[{"counties": [[1]]}]).status_code == 400
+    assert client.post("/api/aggregates", json=[{"incidents": [1]}]).status_code == 400
+
+
+def test_aggregate_other_categories(calfire_df):
+    """Test that the counts of a summary with another category set go to their own roof, damage and structure keys."""
+    roof_damage_columns, structure_columns = split_summary_columns(calfire_df.columns)
+    summary_df = calfire_df.drop(columns=[column for column in roof_damage_columns if column[0] != "Wood"]
+                                 + structure_columns[:2])
+    result, = BatchAggregator(summary_df).aggregate([{"years": [2017, 2020]}])
+    expected = filter_like_the_callbacks(summary_df, {"years": [2017, 2020]})
+    assert list(result["roof_damage"]) == ["Wood"]
+    assert result["roof_damage"]["Wood"]["Destroyed (>50%)"] == expected[("Wood", "E. Destroyed (>50%)")].sum()
+    assert len(result["structure"]) == len(structure_columns) - 2
+    assert result["structure"]["Agriculture"] == expected["F. Agriculture"].sum()
@@ -1,12 +1,9 @@
-from contextvars import copy_context
-from dash._callback_context import context_value
-from dash._utils import AttributeDict
-from dash import callback_context
 import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from src.callbacks import update_charts, toggle_button
+from src.callbacks import (update_filters, update_roof_chart, update_damage_chart, update_structure_chart,
+                           update_timeseries_chart, chart_data_cache, toggle_button)
 
 def test_toggle_button():
     output = toggle_button(1, False)
@@ -19,80 +16,62 @@ def test_toggle_button():
     assert output is False
 
 
-# Test reset button
-def test_reset_button():
+def run_request(trigger, county, year, incident_name=None):
+    """Answers a chart request like the browser does, with the filter step and every chart callback."""
+    request = {"key": "k", "trigger": trigger, "county": county, "year": year, "incident_name": incident_name,
+               "selectedData": None, "granularity": "Year"}
+    outputs = dict(update_filters(request)["outputs"])
+    for update_chart in [update_roof_chart, update_damage_chart, update_structure_chart, update_timeseries_chart]:
+        outputs.update(update_chart(request)["outputs"])
+    return outputs
 
-    def run_callback(trigger):
-        context_value.set(AttributeDict(**{"triggered_inputs": [trigger]}))
-        return update_charts(0, 1, None, ["Butte"], [2017, 2020], None)
-    
-    ctx = copy_context()
-    trigger={"prop_id": "reset.n_clicks"}
 
-    output = ctx.run(run_callback, trigger)
+def check_outputs(outputs):
+    assert isinstance(outputs["roof_chart"], dict), "Returned roof chart should be a dicionary"
+    assert isinstance(outputs["damage_chart"], dict), "Returned damage chart should be a dictionary"
+    assert isinstance(outputs["structure_chart"], dict), "Returned structure chart should be a dictionary"
+    assert isinstance(outputs["timeseries_chart"], dict), "Returned timeseries chart should be a dictionary"
+    assert isinstance(outputs["summary_card"], list), "Returned summary card should be a dictionary"
 
-    (roof_chart, damage_chart, structure_chart, summary_card_update, 
-     timeseries_chart, county, year, incident_name) = output
-    
-    assert isinstance(roof_chart, dict), "Returned roof chart should be a dicionary"
-    assert isinstance(damage_chart, dict), "Returned damage chart should be a dictionary"
-    assert isinstance(structure_chart, dict), "Returned structure chart should be a dictionary"
-    assert isinstance(timeseries_chart, dict), "Returned timeseries chart should be a dictionary"
-    assert isinstance(summary_card_update, list), "Returned summary card should be a dictionary"
-    assert county is None, "County input should be cleared"
-    assert year == [2014, 2025], "Year input should reset to min and max years"
-    assert incident_name is None, "Incident name should be cleared"
+
+# Test reset button
+def test_reset_button():
+    outputs = run_request("reset", ["Butte"], [2017, 2020])
+
+    check_outputs(outputs)
+    assert outputs["county"] is None, "County input should be cleared"
+    assert outputs["year"] == [2014, 2025], "Year input should reset to min and max years"
+    assert outputs["incident_name"] is None, "Incident name should be cleared"
 
 # Test year imput
 def test_submit_button():
+    outputs = run_request("submit", None, [2017, 2020])
 
-    def run_callback(trigger):
-        context_value.set(AttributeDict(**{"triggered_inputs": [trigger]}))
-        return update_charts(1, 0, None, [2017, 2020], None, None)
-    
-    ctx = copy_context()
-    trigger={"prop_id": "submit.n_clicks"}
-
-    output = ctx.run(run_callback, trigger)
-
-
-    (roof_chart, damage_chart, structure_chart, summary_card_update, 
-     timeseries_chart, county, year, incident_name) = output
-    print(county),
-    print(incident_name)
-    print(year)
-    assert isinstance(roof_chart, dict), "Returned roof chart should be a dicionary"
-    assert isinstance(damage_chart, dict), "Returned damage chart should be a dictionary"
-    assert isinstance(structure_chart, dict), "Returned structure chart should be a dictionary"
-    assert isinstance(timeseries_chart, dict), "Returned timeseries chart should be a dictionary"
-    assert isinstance(summary_card_update, list), "Returned summary card should be a dictionary"
-    assert county is None
-    assert year == [2017, 2020], "Returned year should be the same as input"
-    assert incident_name is None 
+    check_outputs(outputs)
+    assert outputs["county"] is None
+    assert outputs["year"] == [2017, 2020], "Returned year should be the same as input"
+    assert outputs["incident_name"] is None
 
 # Test county input
 def test_county_input():
-
-    def run_callback(trigger):
-        context_value.set(AttributeDict(**{"triggered_inputs": [trigger]}))
-        return update_charts(1, 0, ["Butte"], [2017, 2020], None, None)
-    
-    ctx = copy_context()
-    trigger={"prop_id": "submit.n_clicks"}
-
-    output = ctx.run(run_callback, trigger)
-
-
-    (roof_chart, damage_chart, structure_chart, summary_card_update, 
-     timeseries_chart, county, year, incident_name) = output
-    print(county),
-    print(incident_name)
-    print(year)
-    assert isinstance(roof_chart, dict), "Returned roof chart should be a dicionary"
-    assert isinstance(damage_chart, dict), "Returned damage chart should be a dictionary"
-    assert isinstance(structure_chart, dict), "Returned structure chart should be a dictionary"
-    assert isinstance(timeseries_chart, dict), "Returned timeseries chart should be a dictionary"
-    assert isinstance(summary_card_update, list), "Returned summary card should be a dictionary"
-    assert county == ["Butte"], "Returned County should be same as input"
-    assert year == [2017, 2020], "Returned year should be the same as input"
-    assert incident_name is None, "Returned incident should be none" 
\ No newline at end of file
+    outputs = run_request("submit", ["Butte"], [2017, 2020])
+
+    check_outputs(outputs)
+    assert outputs["county"] == ["Butte"], "Returned County should be same as input"
+    assert outputs["year"] == [2017, 2020], "Returned year should be the same as input"
+    assert outputs["incident_name"] is None, "Returned incident should be none"
+
+# Test the chart requests of the client-side cache
+def test_chart_request():
+    request = {"key": "[null,[2014,2025],null,\"Year\"]", "trigger": "reset", "county": ["Butte"],
+               "year": [2017, 2020], "incident_name": None, "selectedData": None, "granularity": "Year"}
+    misses = chart_data_cache.misses
+    filters = update_filters(request)
+    chart = update_roof_chart(request)
+
+    assert filters["key"] == chart["key"] == request["key"], "The responses should carry the cache key of the request"
+    assert set(filters["outputs"]) == {"summary_card", "county", "year", "incident_name"}
+    assert filters["outputs"]["county"] is None, "County input should be cleared on reset"
+    assert filters["outputs"]["year"] == [2014, 2025], "Year input should reset to min and max years"
+    assert isinstance(chart["outputs"]["roof_chart"], dict), "Returned roof chart should be a dictionary"
+    assert chart_data_cache.misses <= misses + 1, "The charts of a request should share the filtered data"
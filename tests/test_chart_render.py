@@ -0,0 +1,102 @@
+import pytest
+import threading
+import flask
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import chart_render
+from src.chart_render import ChartRenderer, RenderBusy, RenderCache, RenderTimeout, normalize_filters, register_render_routes
+from src.data import calfire_df
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(chart_render, "_chart_renderer", ChartRenderer(calfire_df, workers=1, queue=1, cache_mb=8))
+    server = flask.Flask(__name__)
+    register_render_routes(server)
+    return server.test_client()
+
+
+def test_render_endpoint(client):
+    """Test SVG and PNG rendering, sizes and errors."""
+    response = client.get("/render/roof_chart.svg?county=Butte&year_start=2017&year_end=2020&width=640")
+    assert response.status_code == 200 and response.mimetype == "image/svg+xml"
+    assert b'width="640"' in response.data
+
+    response = client.get("/render/timeseries_chart.png?scale=2")
+    assert response.status_code == 200 and response.data.startswith(b"\x89PNG")
+
+    assert client.get("/render/timeseries_chart.svg?county=Nowhere").status_code == 404
+    assert client.get("/render/pie_chart.svg").status_code == 404
+    assert client.get("/render/roof_chart.gif").status_code == 404
+
+
+def test_render_cache_hits_equal_filter_states():
+    """Test that equivalent filter states share one cache entry."""
+    renderer = ChartRenderer(calfire_df, workers=1, queue=0, cache_mb=8)
+    first = renderer.render("damage_chart", {"county": ["Napa", "Butte"], "year": [2017, 2020]}, "svg")
+    second = renderer.render("damage_chart", {"county": ["Butte", "Napa", "Butte"], "year": (2017, 2020)}, "svg")
+    assert first == second
+    assert (renderer.cache.hits, renderer.cache.misses, len(renderer.cache)) == (1, 1, 1)
+
+
+def test_render_cache_eviction():
+    """Test that the least recently used images are evicted first."""
+    cache = RenderCache(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    cache.get("a")
+    cache.put("c", b"1234")
+    assert cache.get("b") is None and cache.get("a") == b"1234" and cache.get("c") == b"1234"
+    assert cache.nbytes == 8
+
+
+def test_render_pool_is_bounded(monkeypatch):
+    """Test that renders beyond the pool and its queue are rejected instead of waiting."""
+    started, release = threading.Event(), threading.Event()
+
+    def slow_render(*args):
+        started.set()
+        release.wait(5)
+        return b"<svg/>"
+
+    monkeypatch.setattr(chart_render, "render_chart", slow_render)
+    renderer = ChartRenderer(calfire_df, workers=1, queue=0, cache_mb=1)
+    thread = threading.Thread(target=renderer.render, args=("roof_chart", {}, "svg"))
+    thread.start()
+    started.wait(5)
+    with pytest.raises(RenderBusy):
+        renderer.render("damage_chart", {}, "svg")
+    release.set()
+    thread.join()
+
+
+def test_render_timeout_keeps_its_slot(monkeypatch):
+    """Test that a timed out render is answered with a 503 and holds its slot until it finishes."""
+    release = threading.Event()
+
+    def slow_render(*args):
+        release.wait(5)
+        return b"<svg/>"
+
+    monkeypatch.setattr(chart_render, "render_chart", slow_render)
+    renderer = ChartRenderer(calfire_df, workers=1, queue=0, cache_mb=1, timeout=0.05)
+    monkeypatch.setattr(chart_render, "_chart_renderer", renderer)
+    server = flask.Flask(__name__)
+    register_render_routes(server)
+    response = server.test_client().get("/render/roof_chart.svg")
+    assert response.status_code == 503 and "Retry-After" in response.headers
+
+    with pytest.raises(RenderBusy):
+        renderer.render("damage_chart", {}, "svg")
+    release.set()
+    renderer._executor.submit(lambda: None).result(5)
+    assert renderer.render("roof_chart", {}, "svg") == b"<svg/>"
+    assert renderer.cache.hits == 1
+
+
+def test_normalize_filters():
+    assert normalize_filters(["b", "a"], (2017, 2018), [], None) == \
+        {"county": ["a", "b"], "year": [2017, 2018], "incident_name": None, "granularity": "Year"}
@@ -0,0 +1,71 @@
+import pytest
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import chart_specs
+from src.chart_specs import ChartDataCache, build_chart_spec, make_chart_specs
+from src.chart_render import normalize_filters
+from src.data import calfire_df
+
+
+def test_charts_built_one_by_one_match_make_chart_specs():
+    """Test that the charts built from a cached entry are the charts of make_chart_specs."""
+    cache = ChartDataCache(calfire_df=calfire_df)
+    filters = normalize_filters(["Butte"], [2017, 2020])
+    specs, filtered_df = make_chart_specs(calfire_df, county=["Butte"], year=[2017, 2020])
+    chart_data = cache.get(filters)
+    assert chart_data.calfire_df.equals(filtered_df)
+    assert build_chart_spec("structure_chart", chart_data) == specs["structure_chart"]
+
+
+def test_concurrent_requests_filter_once(monkeypatch):
+    """Test that concurrent requests for the same filter state share one entry and that old entries are evicted."""
+    calls = []
+    prepare_chart_data = chart_specs.prepare_chart_data
+
+    def counting_prepare(*args, **kwargs):
+        calls.append(args[1:])
+        return prepare_chart_data(*args, **kwargs)
+
+    monkeypatch.setattr(chart_specs, "prepare_chart_data", counting_prepare)
+    cache = ChartDataCache(size=2, calfire_df=calfire_df)
+    filters = normalize_filters(["Napa"], [2014, 2025])
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(filters))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and all(result is results[0] for result in results)
+    assert cache.misses == 1 and cache.hits == 7
+
+    cache.get(normalize_filters(["Butte"]))
+    cache.get(normalize_filters(["Lake"]))
+    cache.get(filters)
+    assert len(calls) == 4, "The least recently used entry should have been evicted"
+
+
+def test_failed_filter_is_not_left_in_flight(monkeypatch):
+    """Test that a filter state whose data fails to build can be requested again."""
+    prepare_chart_data = chart_specs.prepare_chart_data
+    failures = [RuntimeError("backend down")]
+
+    def failing_prepare(*args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return prepare_chart_data(*args, **kwargs)
+
+    monkeypatch.setattr(chart_specs, "prepare_chart_data", failing_prepare)
+    cache = ChartDataCache(calfire_df=calfire_df)
+    filters = normalize_filters(["Napa"])
+    with pytest.raises(RuntimeError):
+        cache.get(filters)
+    assert not cache._computing
+
+    thread = threading.Thread(target=cache.get, args=(filters,))
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive() and cache.misses == 1
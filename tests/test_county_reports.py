@@ -0,0 +1,42 @@
+import pytest
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.county_reports import generate_reports, summarize, report_file_name, format_report
+from src.chart_specs import filter_data
+from src.summary_columns import split_summary_columns
+from src.data import calfire_df
+
+
+def test_summarize():
+    """Test the headline numbers of a report against the summary data."""
+    butte, _ = filter_data(calfire_df, calfire_df, county=["Butte"], year=[2018, 2018])
+    summary = summarize(butte)
+    assert summary["Incidents"] == butte["Incident Name"].nunique()
+    roof_damage_columns, structure_columns = split_summary_columns(butte.columns)
+    assert summary["Inspected Structures"] == butte[structure_columns].to_numpy().sum()
+    assert 0 < summary["Destroyed Structures"] <= summary["Inspected Structures"]
+    assert summary["Total Economic Loss"].endswith("USD")
+    assert summarize(calfire_df.iloc[:0])["Total Economic Loss"] == "No Data Available"
+
+    # Another category set than California's
+    wood = butte.drop(columns=[column for column in roof_damage_columns if column[0] != "Wood"] + structure_columns[1:])
+    summary = summarize(wood)
+    assert summary["Inspected Structures"] == butte[structure_columns[0]].sum()
+    assert summary["Destroyed Structures"] == butte[("Wood", "E. Destroyed (>50%)")].sum()
+
+
+def test_generate_reports(tmp_path):
+    """Test that every county gets an HTML and a PDF report with its charts."""
+    results, wall_time = generate_reports(["Butte", "Los Angeles"], [2017, 2020], ["html", "pdf"], str(tmp_path), workers=1)
+    assert [result["county"] for result in results] == ["Butte", "Los Angeles"]
+
+    html_path = tmp_path / report_file_name("Los Angeles", [2017, 2020], "html")
+    assert html_path.name == "Los_Angeles_2017-2020.html"
+    page = html_path.read_text()
+    assert "Los Angeles County Wildfire Impact Report, 2017-2020" in page
+    assert page.count("<svg") >= 4
+    assert (tmp_path / "Butte_2017-2020.pdf").read_bytes().startswith(b"%PDF")
+    assert "2 counties" in format_report(results, wall_time, 1)
@@ -0,0 +1,148 @@
+import pytest
+import json
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data_import import load_calfire_df, clean_calfire_df
+from synthetic_dins import load_profile, write_synthetic_dins
+from src.crossfilter import CrossfilterCube, SELECTION_COLUMNS
+from src.chart_specs import CHART_NAMES, ChartDataCache, build_chart_spec
+from src.chart_render import normalize_filters
+from src import callbacks, data
+
+FILTER_STATES = [
+    {},
+    {"county": ["Butte", "Los Angeles"], "year": [2017, 2021]},
+    {"incident_name": ["Camp", "Woolsey"], "granularity": "Month"},
+]
+SELECTIONS = [
+    {"roof": ["Wood"]},
+    {"roof": ["Asphalt", "Tile"], "damage": ["E. Destroyed (>50%)"]},
+    {"damage": ["A. No Damage"], "structure": ["A. Single Residence"]},
+    {"roof": ["Asphalt", "Metal"], "damage": ["A. No Damage", "E. Destroyed (>50%)"], "structure": ["A. Single Residence", "E. Infrastructure"]},
+]
+
+
+@pytest.fixture(scope="module")
+def synthetic(tmp_path_factory):
+    """The structure records of two synthetic raw files and the cube written from them."""
+    tmp_path = tmp_path_factory.mktemp("crossfilter")
+    paths = write_synthetic_dins(str(tmp_path / "raw"), 20_000, files=2, chunk_size=5_000, seed=3)
+    counties = sorted(load_profile()["incidents"]["County"].unique())
+    geojson_file = tmp_path / "counties.geojson"
+    geojson_file.write_text(json.dumps({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"name": county},
+         "geometry": {"type": "Polygon", "coordinates": [[[-121, 39], [-121, 40], [-122, 40], [-121, 39]]]}}
+        for county in counties]}))
+    load_calfire_df(str(tmp_path / "raw"), workers=1, output_dir=str(tmp_path / "out"),
+                    geojson_file_path=str(geojson_file), cache_dir=None)
+
+    structures = pd.concat([clean_calfire_df(path) for path in paths], ignore_index=True)
+    structures["Assessed Improved Value"] = structures["Assessed Improved Value"].astype("int32")
+    return structures, pd.read_pickle(tmp_path / "out" / "crossfilter_cube.pkl")
+
+
+def matching(structures, filters, selection, skip=None):
+    """The structures matching the filters and the selections of the charts other than `skip`."""
+    if filters.get("year"):
+        structures = structures[structures["Year"].between(*filters["year"])]
+    for column in ("county", "incident_name"):
+        if filters.get(column):
+            structures = structures[structures["County" if column == "county" else "Incident Name"].isin(filters[column])]
+    for dimension, values in selection.items():
+        if dimension != skip:
+            structures = structures[structures[SELECTION_COLUMNS[dimension]].isin(values)]
+    return structures
+
+
+def expected_frame(structures, columns):
+    """The sums per County x Year of structure records, in the columns of the summary dataset."""
+    damage = structures.groupby(["County", "Year", "Roof Construction", "Damage_Category"]).size().unstack([2, 3])
+    damage.columns = damage.columns.to_flat_index()
+    structure = structures.groupby(["County", "Year", "Structure_Category"]).size().unstack(2)
+    expected = pd.concat([damage, structure], axis=1).reindex(columns=list(columns[:54])).fillna(0).astype("int64")
+    expected["Total Economic Loss"] = structures.groupby(["County", "Year"])["Assessed Improved Value"].sum().astype("int64")
+    return expected
+
+
+@pytest.mark.parametrize("filters", FILTER_STATES)
+@pytest.mark.parametrize("selection", SELECTIONS)
+def test_chart_frames_match_the_structure_records(synthetic, filters, selection):
+    """Test that every chart of a cross-filter state counts the structures of the other selections exactly."""
+    structures, cube = synthetic
+    crossfilter = CrossfilterCube(cube, data.calfire_df)
+    frames = crossfilter.chart_frames(filters.get("county"), filters.get("year"), filters.get("incident_name"),
+                                      filters.get("granularity", "Year"), selection)
+    assert list(frames["summary"].columns) == list(data.calfire_df.columns)
+    assert (frames["summary"].dtypes == data.calfire_df.dtypes).all()
+
+    for name, skip in [("summary", None), ("roof_chart", "roof"), ("damage_chart", "damage"), ("structure_chart", "structure")]:
+        actual = frames[name].set_index(["County", "Year"]).drop(columns="Incident Name").astype("int64")
+        expected = expected_frame(matching(structures, filters, selection, skip), data.calfire_df.columns)
+        pd.testing.assert_frame_equal(actual, expected, check_names=False)
+
+    if filters.get("granularity") == "Month":
+        expected = matching(structures, filters, selection).groupby(["County", "Month", "Year"])["Assessed Improved Value"].sum()
+        actual = frames["timeseries"].set_index(["County", "Month", "Year"])["Total Economic Loss"]
+        pd.testing.assert_series_equal(actual, expected.astype("int64"), check_names=False)
+    else:
+        assert frames["timeseries"] is frames["summary"]
+
+
+def test_partial_aggregates_are_reused(synthetic):
+    """Test that the clicks on the charts of a filter state reuse its partial aggregates."""
+    crossfilter = CrossfilterCube(synthetic[1], data.calfire_df, cache_size=2)
+    for selection in SELECTIONS:
+        crossfilter.chart_frames(["Butte"], [2017, 2021], selection=selection)
+    assert (crossfilter.misses, crossfilter.hits) == (1, len(SELECTIONS) - 1)
+    for county in ["Napa", "Lake", "Butte"]:
+        crossfilter.chart_frames([county], [2017, 2021], selection=SELECTIONS[0])
+    assert crossfilter.misses == 4, "The least recently used filter states should be evicted"
+
+
+def test_crossfiltered_chart_specs(synthetic):
+    """Test that every chart keeps its own selection, drawn from inline values, and the cube is optional."""
+    cache = ChartDataCache(calfire_df=data.calfire_df, crossfilter=CrossfilterCube(synthetic[1], data.calfire_df))
+    chart_data = cache.get(normalize_filters(["Butte", "Los Angeles"], [2017, 2021], roof=["Wood"]))
+    assert chart_data.crossfiltered and chart_data.top_structure_counties is None
+    # The roof chart shows every roof construction, the other charts the wood roofs only
+    assert chart_data.chart_df("roof_chart") is not chart_data.calfire_df
+    assert chart_data.chart_df("damage_chart") is chart_data.calfire_df
+
+    specs = {name: build_chart_spec(name, chart_data) for name in CHART_NAMES}
+    store = next(dataset for dataset in specs["roof_chart"]["data"] if dataset["name"] == "roof_select_store")
+    assert store["values"][0]["values"] == ["Wood"]
+    assert all("url" not in dataset for spec in specs.values() for dataset in spec["data"])
+    assert any(dataset.get("values") for dataset in specs["damage_chart"]["data"] if dataset["name"] == "source_0")
+
+    # The charts of the sidebar filters alone can be clicked
+    unselected = cache.get(normalize_filters(["Butte", "Los Angeles"], [2017, 2021]))
+    assert unselected.selection == {"roof": [], "damage": [], "structure": []}
+    assert "damage_select_store" in [dataset["name"] for dataset in build_chart_spec("damage_chart", unselected)["data"]]
+
+    # Without the cube the selections are ignored and the charts have no click selection
+    chart_data = ChartDataCache(calfire_df=data.calfire_df).get(normalize_filters(["Butte"], roof=["Wood"]))
+    assert chart_data.selection is None and not chart_data.crossfiltered
+    assert "roof_select_store" not in [dataset["name"] for dataset in build_chart_spec("roof_chart", chart_data)["data"]]
+
+
+def test_chart_requests_with_a_selection(synthetic, monkeypatch):
+    """Test that a chart request carries the selections into the summary card and that a reset clears them."""
+    crossfilter = CrossfilterCube(synthetic[1], data.calfire_df)
+    monkeypatch.setattr(callbacks, "chart_data_cache", ChartDataCache(calfire_df=data.calfire_df, crossfilter=crossfilter))
+    monkeypatch.setattr(callbacks, "spec_cache", None)
+    request = {"key": "k", "trigger": "submit", "county": ["Butte"], "year": [2017, 2020], "incident_name": None,
+               "selectedData": None, "granularity": "Year", "roof": ["Wood"], "damage": None, "structure": None}
+    assert callbacks._request_filter_state(request)["roof"] == ["Wood"]
+    assert "roof" not in callbacks._request_filter_state({**request, "trigger": "reset"})
+
+    wood = callbacks.update_filters(request)["outputs"]["summary_card"][1].children
+    everything = callbacks.update_filters({**request, "roof": None})["outputs"]["summary_card"][1].children
+    assert wood != everything
+    spec = callbacks.update_damage_chart(request)["outputs"]["damage_chart"]
+    assert "damage_select_store" in [dataset["name"] for dataset in spec["data"]]
@@ -0,0 +1,131 @@
+import pytest
+import numpy as np
+import pandas as pd
+import pickle
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data_import import load_calfire_df, resolve_raw_files
+from structure_store import StructureStore
+from stage_cache import StageCache
+
+COUNTIES = ["Butte", "Los Angeles", "Napa"]
+
+
+def make_raw_df(seed, n=400):
+    """Random records with the columns of the raw DINS extract."""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2017-01-01") + pd.to_timedelta(rng.integers(0, 8 * 365, n), unit="D")
+    return pd.DataFrame({
+        "* Damage": rng.choice(["No Damage", "Affected (1-9%)", "Destroyed (>50%)", "Inaccessible"], n),
+        "County": rng.choice(COUNTIES, n),
+        "* Incident Name": rng.choice(["Camp", "Woolsey", "Atlas", "Eaton"], n),
+        "Incident Start Date": dates.strftime("%m/%d/%Y %I:%M:%S %p"),
+        "Structure Category": rng.choice(["Single Residence", "Infrastructure", "Agriculture"], n),
+        "* Roof Construction": rng.choice(["Asphalt", "Tile", "Metal", " "], n),
+        "Assessed Improved Value (parcel)": rng.integers(0, 2_000_000, n).astype(float),
+        "* City": "Somewhere",
+        "Latitude": np.where(rng.random(n) < 0.1, np.nan, rng.uniform(34, 40, n)),
+        "Longitude": rng.uniform(-122, -118, n),
+    })
+
+
+@pytest.fixture
+def geojson_file(tmp_path):
+    """A minimal county boundaries file."""
+    path = tmp_path / "counties.geojson"
+    features = [{"type": "Feature", "properties": {"name": county},
+                 "geometry": {"type": "Polygon", "coordinates": [[[-121, 39 + i], [-121, 40 + i], [-122, 40 + i], [-121, 39 + i]]]}}
+                for i, county in enumerate(COUNTIES)]
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    return str(path)
+
+
+def read_outputs(output_dir):
+    outputs = {}
+    for name in ["processed_cal_fire.pkl", "county_stats.pkl", "global_vars.pkl", "timeseries_rollups.pkl", "hex_density.pkl",
+                 "value_sketches.pkl"]:
+        with open(os.path.join(output_dir, name), "rb") as f:
+            outputs[name] = pickle.load(f)
+    return outputs
+
+
+def test_parallel_ingestion_matches_single_file(tmp_path, geojson_file):
+    """Test that ingesting several files on a process pool gives the same outputs as one file."""
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    parts = [make_raw_df(seed) for seed in range(3)]
+    for i, part in enumerate(parts):
+        part.to_csv(raw_dir / f"extract_{i}.csv", index=False)
+    single_file = tmp_path / "all.csv"
+    pd.concat(parts).to_csv(single_file, index=False)
+
+    load_calfire_df(str(single_file), output_dir=str(tmp_path / "single"), geojson_file_path=geojson_file, cache_dir=None)
+    load_calfire_df(str(raw_dir), workers=2, output_dir=str(tmp_path / "parallel"), geojson_file_path=geojson_file, cache_dir=None)
+
+    single, parallel = read_outputs(tmp_path / "single"), read_outputs(tmp_path / "parallel")
+    pd.testing.assert_frame_equal(single["processed_cal_fire.pkl"], parallel["processed_cal_fire.pkl"])
+    pd.testing.assert_frame_equal(single["county_stats.pkl"], parallel["county_stats.pkl"])
+    assert single["global_vars.pkl"] == parallel["global_vars.pkl"]
+    for granularity in ["Month", "Week"]:
+        pd.testing.assert_frame_equal(single["timeseries_rollups.pkl"][granularity], parallel["timeseries_rollups.pkl"][granularity])
+    for resolution, cells in single["hex_density.pkl"].items():
+        pd.testing.assert_frame_equal(cells, parallel["hex_density.pkl"][resolution])
+    for name in ["county_year", "incident"]:
+        pd.testing.assert_frame_equal(single["value_sketches.pkl"][name], parallel["value_sketches.pkl"][name])
+
+    summary = parallel["processed_cal_fire.pkl"]
+    assert list(summary.columns[-4:]) == ["Incident Name", "Year", "County", "Total Economic Loss"]
+    assert summary.iloc[:, :-4].to_numpy().sum() == 2 * StructureStore.load(str(tmp_path / "parallel" / "structures.npz")).n_rows, \
+        "Every structure should be counted once in the damage and once in the structure columns"
+
+
+def test_resolve_raw_files(tmp_path):
+    """Test that directories and glob patterns are expanded in a deterministic order."""
+    for name in ["b.csv", "a.csv", "notes.txt"]:
+        (tmp_path / name).write_text("")
+    assert resolve_raw_files(str(tmp_path)) == [str(tmp_path / "a.csv"), str(tmp_path / "b.csv")]
+    assert resolve_raw_files(str(tmp_path / "b*.csv")) == [str(tmp_path / "b.csv")]
+    with pytest.raises(FileNotFoundError):
+        resolve_raw_files(str(tmp_path / "missing_*.csv"))
+
+
+def test_stage_cache_skips_unchanged_stages(tmp_path, geojson_file):
+    """Test that a rerun only recomputes the stages downstream of a changed raw file."""
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for seed in range(2):
+        make_raw_df(seed).to_csv(raw_dir / f"extract_{seed}.csv", index=False)
+    run = lambda: load_calfire_df(str(raw_dir), workers=1, output_dir=str(tmp_path / "out"),
+                                  geojson_file_path=geojson_file, cache_dir=str(tmp_path / "cache"))
+
+    first = {timing["stage"]: timing["hit"] for timing in run().timings}
+    assert not any(first.values()), "Nothing should be cached on the first run"
+    summary = read_outputs(tmp_path / "out")["processed_cal_fire.pkl"]
+
+    second = {timing["stage"]: timing["hit"] for timing in run().timings}
+    assert second == {"ingest:extract_0.csv": True, "ingest:extract_1.csv": True, "merge": True,
+                      "county_boundaries": True, "summary": True, "save": False}
+    pd.testing.assert_frame_equal(read_outputs(tmp_path / "out")["processed_cal_fire.pkl"], summary)
+
+    make_raw_df(7).to_csv(raw_dir / "extract_1.csv", index=False)
+    third = {timing["stage"]: timing["hit"] for timing in run().timings}
+    assert third["ingest:extract_0.csv"] is True, "Unchanged files should not be parsed again"
+    assert not third["ingest:extract_1.csv"] and not third["merge"] and not third["summary"]
+
+
+def test_stage_key_follows_the_helpers(tmp_path, monkeypatch):
+    """Test that editing a helper called by a stage function changes the key of the stage."""
+    module_file = tmp_path / "stage_helpers.py"
+    module_file.write_text("def helper(x):\n    return x + 1\n\n\ndef stage(x):\n    return helper(x)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import stage_helpers
+
+    cache = StageCache(None)
+    key = cache.key("stage", code=[stage_helpers.stage])
+    assert cache.key("stage", code=[stage_helpers.stage]) == key
+    module_file.write_text("def helper(x):\n    return x + 10\n\n\ndef stage(x):\n    return helper(x)\n")
+    assert cache.key("stage", code=[stage_helpers.stage]) != key
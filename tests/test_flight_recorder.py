@@ -0,0 +1,82 @@
+import pytest
+import os
+import sys
+import threading
+from werkzeug.serving import make_server
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import src.flight_recorder
+from src.app import server
+from src.flight_recorder import FlightRecorder
+from load_test import PayloadFactory
+from replay_slow_requests import replay, format_replays
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    monkeypatch.setenv("CALFIRE_DEBUG_TOKEN", "secret")
+    recorder = FlightRecorder(threshold_ms=0)
+    monkeypatch.setattr(src.flight_recorder, "flight_recorder", recorder)
+    return recorder
+
+
+def test_slow_calls_are_recorded_and_replayed(recorder, monkeypatch):
+    """Test that slow chart request callbacks are recorded with their stages and can be replayed."""
+    client = server.test_client()
+    factory = PayloadFactory(client.get("/_dash-layout").get_json(), client.get("/_dash-dependencies").get_json())
+    bodies = factory.build_from_values({"county.value": ["Napa"],
+                                        "fire_damage_map.selectedData": {"points": [{"hovertext": "Butte"}]}}, "submit.n_clicks")
+    for body in bodies:
+        assert client.post("/_dash-update-component", json=body).status_code == 200
+
+    dump = client.get("/debug/slow-requests?token=secret").json
+    assert dump["pid"] == os.getpid() and dump["threshold_ms"] == 0
+    assert [entry["callback"] for entry in dump["entries"]] == ["update_filters", "update_roof_chart", "update_damage_chart",
+                                                               "update_structure_chart", "update_timeseries_chart"]
+    filter_entry, entry = dump["entries"][:2]
+    assert filter_entry["stages_ms"].keys() == {"aggregation", "summary"} and filter_entry["payload_bytes"]["summary_card"] > 0
+    assert entry["trigger"] == "chart_request" and entry["request"] == bodies[1]
+    assert entry["filters"]["county"] == ["Butte", "Napa"] and entry["filters"]["granularity"] == "Year"
+    assert entry["stages_ms"].keys() == {"aggregation", "chart:roof_chart"}
+    assert entry["payload_bytes"]["roof_chart"] > 1000 and entry["duration_ms"] >= max(entry["stages_ms"].values())
+
+    recorder.threshold_ms = 1e9
+    http_server = make_server("127.0.0.1", 0, server, threaded=True)
+    thread = threading.Thread(target=http_server.serve_forever)
+    thread.start()
+    try:
+        latencies = replay(entry, f"http://127.0.0.1:{http_server.server_port}", repeat=2)
+    finally:
+        http_server.shutdown()
+        thread.join()
+    assert len(latencies) == 2 and len(recorder.entries()) == 5, "Calls under the threshold should not be recorded"
+    assert "chart:" in format_replays([(entry, latencies)])
+
+    assert client.get("/debug/slow-requests?token=secret&clear=1").json["recorded"] == 5
+    assert client.get("/debug/slow-requests?token=secret").json["entries"] == []
+    assert client.get("/debug/slow-requests").status_code == 403
+
+
+def test_ring_buffer_is_bounded():
+    """Test that the recorder keeps the most recent entries only."""
+    recorder = FlightRecorder(threshold_ms=0, size=2)
+    for i in range(5):
+        recorder.add({"i": i})
+    assert recorder.entries() == [{"i": 3}, {"i": 4}] and recorder.recorded == 5
+
+
+def test_recording_never_fails_the_call():
+    """Test that a filter state that cannot be normalized is recorded as None, and a failed recording is skipped."""
+    from src.flight_recorder import record_slow_calls
+
+    recorder = FlightRecorder(threshold_ms=0)
+    recorded = record_slow_calls(["value"], lambda year: [int(year[0])], recorder)(lambda year: ["ok"])
+    assert recorded(["Butte"]) == ["ok"]
+    assert recorder.entries()[0]["filters"] is None and recorder.entries()[0]["trigger"] is None
+
+    # Outputs that cannot be sized are not recorded, and the call still returns them
+    outputs = [object()]
+    assert record_slow_calls(["value"], lambda year: year, recorder)(lambda year: outputs)([2017]) is outputs
+    assert (recorder.recorded, recorder.errors) == (1, 1)
@@ -0,0 +1,83 @@
+import pytest
+import numpy as np
+import pandas as pd
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.hex_grid import (aggregate_hex_density, merge_hex_density, hex_cells, hex_centers,
+                          choose_resolution, hexes_in_view, zoomed_bounds, geojson_bounds, DAMAGE_COLUMNS)
+from src.create_map import make_density_trace
+
+CALIFORNIA = (-124.4, 32.5, -114.1, 42.0)
+
+
+@pytest.fixture
+def structures_df():
+    rng = np.random.default_rng(0)
+    n = 2000
+    return pd.DataFrame({
+        "Longitude": np.where(rng.random(n) < 0.05, np.nan, rng.uniform(-122, -118, n)),
+        "Latitude": rng.uniform(34, 40, n),
+        "County": rng.choice(["Butte", "Los Angeles", "Napa"], n),
+        "Year": rng.choice([2017, 2018, 2020], n),
+        "Damage": rng.choice(DAMAGE_COLUMNS, n),
+    })
+
+
+def test_hex_cells_round_trip():
+    """Test that the center of a cell falls back in the same cell, and that a point is near its cell center."""
+    lon, lat = np.array([-121.6, -118.2, -122.3]), np.array([39.8, 34.1, 38.3])
+    for resolution in range(6):
+        q, r = hex_cells(lon, lat, resolution)
+        center_lon, center_lat = hex_centers(q, r, resolution)
+        np.testing.assert_array_equal(hex_cells(center_lon, center_lat, resolution), (q, r))
+        assert np.all(np.abs(center_lon - lon) < 1.0 / 2 ** resolution)
+
+
+def test_aggregate_hex_density(structures_df):
+    """Test that every located structure is counted once per resolution with its damage level."""
+    hex_density = aggregate_hex_density(structures_df)
+    located = structures_df.dropna()
+    assert sorted(hex_density) == list(range(6))
+    for resolution, cells in hex_density.items():
+        assert cells["Count"].sum() == len(located)
+        assert (cells[DAMAGE_COLUMNS].sum(axis=1) == cells["Count"]).all()
+        assert not cells.duplicated(["q", "r", "County", "Year"]).any()
+    assert len(hex_density[5]) > len(hex_density[0])
+
+
+def test_merge_hex_density(structures_df):
+    """Test that merged partial aggregates equal the aggregate of all the records."""
+    merged = merge_hex_density([aggregate_hex_density(structures_df.iloc[:700]), aggregate_hex_density(structures_df.iloc[700:])])
+    for resolution, cells in aggregate_hex_density(structures_df).items():
+        pd.testing.assert_frame_equal(cells, merged[resolution])
+
+
+def test_choose_resolution_and_view(structures_df):
+    """Test that zooming in picks finer cells and that only the cells in view are returned."""
+    assert choose_resolution(CALIFORNIA) < choose_resolution(zoomed_bounds(CALIFORNIA, 8))
+    assert choose_resolution(CALIFORNIA, max_cells=1) == 0
+
+    hex_density = aggregate_hex_density(structures_df)
+    view = (-121, 35, -119, 37)
+    cells = hexes_in_view(hex_density[4], 4, view, counties=["Napa"], years=[2018, 2020])
+    expected = structures_df.dropna()
+    expected = expected[(expected["County"] == "Napa") & expected["Year"].between(2018, 2020)]
+    assert cells["lon"].between(view[0], view[2]).all() and cells["lat"].between(view[1], view[3]).all()
+    assert 0 < cells["Count"].sum() < len(expected)
+    assert not cells.duplicated(["q", "r"]).any()
+
+
+def test_make_density_trace(structures_df):
+    """Test that the density layer draws one hexagon per cell in view and is hidden when empty."""
+    cells = hexes_in_view(aggregate_hex_density(structures_df, resolutions=[2])[2], 2, CALIFORNIA)
+    trace = make_density_trace(cells, 2)
+    assert len(trace.locations) == len(cells) == len(trace.geojson["features"])
+    assert len(trace.geojson["features"][0]["geometry"]["coordinates"][0]) == 7
+    assert make_density_trace(None, 0).visible is False
+
+
+def test_geojson_bounds():
+    features = [{"geometry": {"type": "MultiPolygon", "coordinates": [[[[-121, 39], [-120, 40], [-122, 41], [-121, 39]]]]}}]
+    assert geojson_bounds(features) == (-122, 39, -120, 41)
+    assert geojson_bounds([]) is None and geojson_bounds([{"geometry": None}]) is None
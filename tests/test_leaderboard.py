@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+import pandas as pd
+import pickle
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.leaderboard import CountyLeaderboard
+from src.structure_chart import make_structure_chart
+
+
+@pytest.fixture(scope="module")
+def calfire_df():
+    with open('data/processed/processed_cal_fire.pkl', 'rb') as f:
+        return pickle.load(f)
+
+
+def regroup_top(calfire_df, measure, first, last, k):
+    """The top counties as the charts computed them before the leaderboard, with ties by name."""
+    calfire_df = calfire_df[calfire_df["Year"].between(first, last)]
+    values = calfire_df.iloc[:, 47:54].sum(axis=1) if measure == "Structures" else calfire_df["Total Economic Loss"]
+    return values.groupby(calfire_df["County"]).sum().sort_values(ascending=False, kind="stable").index[:k].tolist()
+
+
+@pytest.mark.parametrize("measure", ["Structures", "Total Economic Loss"])
+def test_top_matches_regrouping(calfire_df, measure):
+    """Test that the bounded merge gives the same ranking as regrouping the filtered data."""
+    leaderboard = CountyLeaderboard.from_summary(calfire_df)
+    years = sorted(calfire_df["Year"].unique())
+    for first in years:
+        for last in [year for year in years if year >= first]:
+            for k in [1, 3, 10, 100]:
+                assert leaderboard.top(measure, first, last, k) == regroup_top(calfire_df, measure, first, last, k)
+
+
+def test_top_edge_cases():
+    """Test ties, counties without incidents in the range and ranges outside the data."""
+    # Another category set than California's, the roof x damage counts are not structures
+    summary_df = pd.DataFrame({("Asphalt", "A. No Damage"): [9, 9, 9, 9], ("Tile", "E. Destroyed (>50%)"): [1, 1, 1, 1],
+                               "A. Single Residence": [4, 5, 0, 7], "E. Infrastructure": [1, 0, 1, 0]})
+    summary_df["Incident Name"] = ["A", "B", "C", "D"]
+    summary_df["Year"] = [2018, 2018, 2019, 2021]
+    summary_df["County"] = ["Napa", "Butte", "Napa", "Shasta"]
+    summary_df["Total Economic Loss"] = [0.0, 1.0, 2.0, 3.0]
+
+    leaderboard = CountyLeaderboard.from_summary(summary_df)
+    assert leaderboard.top("Structures", 2018, 2018, 2) == ["Butte", "Napa"]
+    assert leaderboard.top("Structures", 2018, 2019, 5) == ["Napa", "Butte"]
+    assert leaderboard.top("Total Economic Loss", 2020, 2025, 5) == ["Shasta"]
+    assert leaderboard.top("Structures", 2000, 2010, 5) == []
+    np.testing.assert_array_equal(leaderboard.range_totals("Structures", 2018, 2021), [5, 6, 7])
+
+
+def test_structure_chart_with_leaderboard(calfire_df):
+    """Test that the structure chart shows the given counties in the given order."""
+    top_counties = CountyLeaderboard.from_summary(calfire_df).top("Structures", 2013, 2025, 5)
+    chart = make_structure_chart(calfire_df, top_counties)
+    assert chart.encoding.y["sort"] == top_counties
+    assert set(chart.data["County"]) == set(top_counties)
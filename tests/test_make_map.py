@@ -51,5 +51,25 @@ def test_plot_map():
     assert fig is not None, "Function should return a valid Plotly figure"
     assert len(fig.data) >= 0, "Figure should not be empty"
 
+
+def test_make_fire_damage_map_geojson():
+    """Test the map built from plain statistics and a pre-serialized GeoJSON."""
+    county_stats = pd.DataFrame({
+        "County": ["Butte", "Napa"],
+        "Fire Count": [5, 10],
+        "Assessed Improved Value": [1.2 * 1e9, 0.8 * 1e9],
+        "Economic Loss": ["$1.2B", "$0.8B"]
+    })
+    county_geojson = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "id": county, "properties": {"name": county},
+         "geometry": {"type": "Polygon", "coordinates": [[[-121, 39], [-121, 40], [-122, 40], [-121, 39]]]}}
+        for county in ["Butte", "Napa"]]}
+
+    fig = make_fire_damage_map(county_stats, county_geojson)
+
+    assert isinstance(fig, go.Figure), "Function should return a Plotly figure"
+    assert list(fig.data[0].locations) == ["Butte", "Napa"], "Counties should be matched to the GeoJSON by name"
+    assert list(fig.data[0].hovertext) == ["Butte", "Napa"], "Map selections rely on the county name as hovertext"
+
 if __name__ == "__main__":
     pytest.main()
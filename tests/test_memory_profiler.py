@@ -0,0 +1,71 @@
+import pytest
+import tracemalloc
+import flask
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import memory_profiler
+from src.memory_profiler import track_memory, profile_memory, memory_report, register_memory_routes, SnapshotWriter
+
+
+@pytest.fixture
+def tracing():
+    """Fixture enabling memory instrumentation for one test."""
+    memory_profiler.enable()
+    yield
+    memory_profiler.disable()
+
+
+def test_disabled_is_noop():
+    """Test that nothing is recorded and functions are not wrapped when disabled."""
+    def build():
+        return [0] * 1000
+
+    assert profile_memory("build")(build) is build, "Function should be returned unchanged"
+    with track_memory("noop"):
+        build()
+    assert memory_report() == {"enabled": False}
+
+
+def test_track_memory_nested(tracing):
+    """Test that peaks of nested blocks are propagated to the outer block."""
+    with track_memory("outer"):
+        retained = [0] * 100_000
+        with track_memory("inner"):
+            temporary = [1] * 500_000
+            del temporary
+
+    report = memory_report(limit=5)
+    inner, outer = report["tracked"]["inner"], report["tracked"]["outer"]
+    assert inner["calls"] == 1 and outer["calls"] == 1
+    assert inner["max_peak_kb"] > 0.9 * 500_000 * 8 / 1024, "Inner peak should include the temporary list"
+    assert outer["max_peak_kb"] >= inner["max_peak_kb"], "Outer peak should include the inner peak"
+    assert outer["last_net_kb"] > 0.9 * 100_000 * 8 / 1024, "Retained memory should show up as net growth"
+    assert len(report["top_allocations"]) == 5
+    del retained
+
+
+def test_debug_endpoint_protected(tracing, monkeypatch):
+    """Test that the endpoint is hidden without a token and rejects a wrong token."""
+    server = flask.Flask(__name__)
+    register_memory_routes(server)
+    client = server.test_client()
+
+    monkeypatch.delenv("CALFIRE_DEBUG_TOKEN", raising=False)
+    assert client.get("/debug/memory").status_code == 404
+
+    monkeypatch.setenv("CALFIRE_DEBUG_TOKEN", "secret")
+    assert client.get("/debug/memory?token=wrong").status_code == 403
+    response = client.get("/debug/memory?limit=3", headers={"X-Debug-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json["enabled"] is True
+    assert len(response.json["top_allocations"]) <= 3
+
+
+def test_snapshot_writer(tracing, tmp_path):
+    """Test that snapshots can be loaded back for offline diffing."""
+    path = SnapshotWriter(str(tmp_path)).write()
+    snapshot = tracemalloc.Snapshot.load(path)
+    assert snapshot.traces is not None
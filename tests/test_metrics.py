@@ -0,0 +1,94 @@
+import pytest
+import flask
+import os
+import subprocess
+import sys
+from prometheus_client import REGISTRY
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.metrics import observe_callback, register_metrics_routes
+from src.callbacks import update_roof_chart
+from src.data import dataset_version
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_callback_metrics():
+    """Test that callback durations, errors and chart build times are recorded."""
+    count, chart_count = sample("calfire_callback_duration_seconds_count", callback="update_roof_chart"), \
+        sample("calfire_chart_build_duration_seconds_count", chart="roof_chart")
+
+    update_roof_chart({"key": "k", "trigger": "submit", "county": ["Butte"], "year": [2017, 2019],
+                       "incident_name": None, "selectedData": None, "granularity": "Year"})
+    assert sample("calfire_callback_duration_seconds_count", callback="update_roof_chart") == count + 1
+    assert sample("calfire_chart_build_duration_seconds_count", chart="roof_chart") == chart_count + 1
+    assert sample("calfire_callbacks_in_progress", callback="update_roof_chart") == 0
+
+    @observe_callback("failing")
+    def failing():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        failing()
+    assert sample("calfire_callback_errors_total", callback="failing") == 1
+
+
+def test_metrics_endpoint():
+    """Test that /metrics reports response sizes, the worker RSS and the dataset version."""
+    server = flask.Flask(__name__)
+    register_metrics_routes(server)
+    server.route("/api/test")(lambda: "x" * 5000)
+    client = server.test_client()
+
+    client.get("/api/test")
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'calfire_response_size_bytes_sum{route="/api/test"} 5000.0' in text
+    assert 'calfire_requests_in_progress{route="/api/test"} 0.0' in text
+    assert f'calfire_dataset_info{{version="{dataset_version}"}} 1.0' in text
+    assert "calfire_dataset_age_seconds" in text
+    assert sample("calfire_worker_rss_bytes") > 0
+
+
+def test_client_timings():
+    """Test that the latencies measured in the browser are recorded and invalid reports are rejected."""
+    server = flask.Flask(__name__)
+    register_metrics_routes(server)
+    client = server.test_client()
+    count = sample("calfire_time_to_first_chart_seconds_count", source="server")
+
+    # navigator.sendBeacon posts text/plain
+    response = client.post("/metrics/client-timings", data='{"metric": "first_chart", "seconds": 0.3, "source": "server"}',
+                           content_type="text/plain")
+    assert response.status_code == 204
+    assert sample("calfire_time_to_first_chart_seconds_count", source="server") == count + 1
+    for timing in [{"metric": "first_chart", "seconds": -1, "source": "server"},
+                   {"metric": "first_chart", "seconds": 0.3, "source": "browser"},
+                   {"metric": "unknown", "seconds": 0.3, "source": "cache"}, "not json"]:
+        assert client.post("/metrics/client-timings", json=timing).status_code == 400
+
+
+WORKER = """
+import sys
+sys.path.insert(0, {root!r})
+from src.metrics import callback_duration, worker_rss
+callback_duration.labels("update_filters").observe(0.2)
+worker_rss.set(1000)
+"""
+
+
+def test_metrics_are_aggregated_across_processes(tmp_path):
+    """Test that the metrics of several worker processes are summed in multiprocess mode."""
+    root = os.path.join(os.path.dirname(__file__), '..')
+    env = {**os.environ, "CALFIRE_METRICS_DIR": str(tmp_path)}
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    for _ in range(3):
+        subprocess.run([sys.executable, "-c", WORKER.format(root=root)], env=env, check=True, cwd=root)
+
+    scrape = "import sys; sys.path.insert(0, {root!r}); from src.metrics import collect_metrics; print(collect_metrics().decode())"
+    text = subprocess.run([sys.executable, "-c", scrape.format(root=root)], env=env, check=True, cwd=root,
+                          capture_output=True, text=True).stdout
+    assert 'calfire_callback_duration_seconds_count{callback="update_filters"} 3.0' in text
+    assert text.count("calfire_worker_rss_bytes{pid=") == 4, "Every process should report its own RSS"
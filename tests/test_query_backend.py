@@ -0,0 +1,97 @@
+import pytest
+import copy
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+pytest.importorskip("duckdb")
+
+from src.chart_specs import CHART_NAMES, ChartDataCache, build_chart_spec
+from src.query_backend import DuckDBBackend, PandasBackend, make_query_backend
+from src.summary_chart import make_summary_chart
+from src import data
+
+FILTER_STATES = [
+    {},
+    {"year": [2018, 2020]},
+    {"county": ["Butte"]},
+    {"county": ["Butte", "Los Angeles", "Sonoma"], "year": [2017, 2021]},
+    {"incident_name": ["Camp", "Woolsey"]},
+    {"county": ["Butte"], "year": [2000, 2001]},
+]
+
+
+@pytest.fixture(scope="module")
+def region():
+    """The default region with a monthly rollup of the economic loss."""
+    region = copy.copy(data.default_region)
+    calfire_df = region.calfire_df
+    month = calfire_df[["Incident Name", "Year", "County", "Total Economic Loss"]].assign(
+        Month=pd.to_datetime(calfire_df["Year"].astype(str) + "-" + (calfire_df.index % 12 + 1).astype(str) + "-01"))
+    month["Total Economic Loss"] = month["Total Economic Loss"].astype(float)
+    region.timeseries_rollups = {"Year": calfire_df, "Month": month}
+    return region
+
+
+@pytest.fixture(scope="module")
+def backends(region):
+    return PandasBackend(region), DuckDBBackend(region, database=":memory:")
+
+
+@pytest.mark.parametrize("filters", FILTER_STATES)
+@pytest.mark.parametrize("granularity", ["Year", "Month"])
+def test_duckdb_charts_match_pandas(backends, filters, granularity):
+    """Test that both backends draw the same charts and summary for a filter state."""
+    pandas_data, duckdb_data = (backend.chart_data(granularity=granularity, **filters) for backend in backends)
+    for name in CHART_NAMES:
+        assert build_chart_spec(name, duckdb_data) == build_chart_spec(name, pandas_data), name
+    assert make_summary_chart(duckdb_data.calfire_df) == make_summary_chart(pandas_data.calfire_df)
+    assert duckdb_data.granularity == pandas_data.granularity == granularity
+
+
+@pytest.mark.parametrize("filters", FILTER_STATES)
+def test_duckdb_aggregates_match_pandas(backends, filters):
+    """Test that the SQL sums per County x Year are the pandas ones."""
+    pandas_backend, duckdb_backend = backends
+    pandas_df = pandas_backend.chart_data(**filters).calfire_df
+    expected = (pandas_df.drop(columns="Incident Name").groupby(["County", "Year"], as_index=False).sum()
+                .sort_values(["County", "Year"], ignore_index=True))
+    result = duckdb_backend.aggregate(**filters)
+    assert list(result.columns) == list(pandas_df.columns)
+    pd.testing.assert_frame_equal(result.drop(columns="Incident Name"), expected[result.columns.drop("Incident Name")])
+
+
+def test_duckdb_file_database_is_shared_and_rebuilt(region, tmp_path):
+    """Test that a file database is written once per dataset version and queried with parameters."""
+    database = str(tmp_path / "calfire.duckdb")
+    first = DuckDBBackend(region, database=database)
+    modified = os.path.getmtime(database)
+    second = DuckDBBackend(region, database=database)
+    assert os.path.getmtime(database) == modified
+    assert second.query("SELECT version FROM dataset").iloc[0, 0] == region.version
+
+    loss = second.query('SELECT SUM("Total Economic Loss") AS loss FROM summary WHERE "County" = ?', ["Butte"])
+    assert loss.iloc[0, 0] == region.calfire_df.loc[region.calfire_df["County"] == "Butte", "Total Economic Loss"].sum()
+    assert "Asphalt: A. No Damage" in first.query("SELECT * FROM summary LIMIT 1").columns
+
+    changed = copy.copy(region)
+    changed.version = "changed"
+    DuckDBBackend(changed, database=database)
+    assert DuckDBBackend(region, database=database).query("SELECT version FROM dataset").iloc[0, 0] == region.version
+
+
+def test_chart_data_cache_uses_backend(backends):
+    """Test that the dashboard cache gets its data from the given backend."""
+    cache = ChartDataCache(backend=backends[1])
+    chart_data = cache.get({"county": ["Butte"], "year": None, "incident_name": None, "granularity": "Year"})
+    assert chart_data.calfire_df["Incident Name"].isna().all()
+    assert cache.misses == 1
+
+
+def test_unknown_backend(region):
+    """Test that an unknown backend name is rejected."""
+    with pytest.raises(ValueError):
+        make_query_backend("sqlite", region)
@@ -0,0 +1,72 @@
+import pytest
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.query_log import QueryLog, warm_up
+from src.spec_cache import SpecCache
+from src.chart_render import normalize_filters
+from src import callbacks
+
+
+def _state(county):
+    return normalize_filters([county], [2017, 2020], None, "Year")
+
+
+def test_log_is_rotated_and_read_across_files(tmp_path):
+    """Test that a full log is rotated, old files are dropped and the states of every file are counted."""
+    log = QueryLog(str(tmp_path / "log" / "query_log.jsonl"), max_mb=0.001, backups=2)
+    for i in range(60):
+        log.record(_state("Butte" if i % 3 else "Sonoma"))
+
+    assert [os.path.basename(path) for path in log.paths()] == ["query_log.jsonl.2", "query_log.jsonl.1", "query_log.jsonl"]
+    assert all(os.path.getsize(path) < 2 * log.max_bytes for path in log.paths())
+    states = list(log.states())
+    assert 0 < len(states) < 60 and states[-1] == _state("Butte")
+
+    with open(log.path, "a") as f:
+        f.write('{"filters": {"county": ["Cut')
+    top = log.top_states(5)
+    assert [state for state, count in top] == [_state("Butte"), _state("Sonoma")]
+    assert top[0][1] > top[1][1]
+
+
+def test_warm_up_follows_frequency_and_budget(tmp_path, capsys):
+    """Test that the most frequent states are computed first, until the count or the time budget is reached."""
+    log = QueryLog(str(tmp_path / "query_log.jsonl"))
+    for county, count in [("Butte", 5), ("Sonoma", 3), ("Napa", 2), ("Lake", 1)]:
+        for _ in range(count):
+            log.record(_state(county))
+
+    computed = []
+    report = warm_up(lambda filters: computed.append(filters["county"][0]), log, n_states=3, budget_seconds=10)
+    assert computed == ["Butte", "Sonoma", "Napa"]
+    assert (report["warmed"], report["logged"], report["failed"]) == (3, 3, 0)
+    assert "3 of the 3 most frequent filter states" in capsys.readouterr().out
+
+    def slow(filters):
+        time.sleep(0.2)
+        if filters["county"] == ["Sonoma"]:
+            raise KeyError("Sonoma")
+
+    report = warm_up(slow, log, n_states=4, budget_seconds=0.3)
+    assert (report["warmed"], report["failed"]) == (1, 1)
+    # Without CALFIRE_QUERY_LOG_PATH there is nothing to warm up
+    assert warm_up(slow, None) == {"warmed": 0, "failed": 0, "logged": 0, "seconds": 0.0}
+
+
+def test_chart_requests_are_logged_and_warmed_up(tmp_path, monkeypatch):
+    """Test that a logged chart request is precomputed into the spec cache by the warm-up."""
+    log = QueryLog(str(tmp_path / "query_log.jsonl"))
+    monkeypatch.setattr(callbacks, "query_log", log)
+    monkeypatch.setattr(callbacks, "spec_cache", SpecCache(str(tmp_path / "specs.sqlite"), "v1"))
+    request = {"key": "k", "trigger": "submit", "county": ["Butte"], "year": [2017, 2020], "incident_name": None,
+               "selectedData": None, "granularity": "Year"}
+    callbacks.update_filters(request)
+    assert list(log.states()) == [normalize_filters(["Butte"], [2017, 2020], None, "Year")]
+
+    callbacks.spec_cache.clear()
+    assert warm_up(callbacks.precompute, log)["warmed"] == 1
+    assert callbacks.spec_cache.stats()["entries"] == 5
@@ -0,0 +1,100 @@
+import pytest
+import flask
+import os
+import pickle
+import shutil
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import src.regions as regions
+from src.regions import RegionStore, UnknownRegion, available_regions, register_region_routes
+from src.static_export import make_payload, register_export_routes
+from src import data
+from src.roof_chart import make_roof_chart
+from src.summary_columns import split_summary_columns
+
+
+@pytest.fixture
+def regions_dir(tmp_path):
+    """Two region partitions made of the California data of one county each."""
+    for region, county in [("oregon", "Butte"), ("washington", "Los Angeles")]:
+        directory = tmp_path / region
+        directory.mkdir()
+        shutil.copy("data/processed/county_boundaries.geojson", directory)
+        shutil.copy("data/processed/county_stats.pkl", directory)
+        with open(directory / "processed_cal_fire.pkl", "wb") as f:
+            pickle.dump(data.calfire_df[data.calfire_df["County"] == county], f)
+    return str(tmp_path)
+
+
+def test_regions_are_loaded_on_demand_and_evicted(regions_dir):
+    """Test that the store loads partitions on first use and keeps the recently used ones under its budget."""
+    store = RegionStore(default=data.default_region, regions_dir=regions_dir)
+    assert available_regions(regions_dir) == ["california", "oregon", "washington"]
+    assert store.get() is store.get("california") is data.default_region
+    assert store.loaded() == {}
+
+    oregon = store.get("oregon")
+    assert list(oregon.calfire_df["County"].unique()) == ["Butte"]
+    assert store.get("oregon") is oregon and store.loads == 1
+    assert oregon.timeseries_rollups["Year"] is oregon.calfire_df and oregon.hex_density is None
+
+    # Room for one region only
+    store.max_bytes = oregon.nbytes
+    assert list(store.get("washington").calfire_df["County"].unique()) == ["Los Angeles"]
+    assert list(store.loaded()) == ["washington"]
+    assert store.get("oregon") is not oregon, "An evicted region should be loaded again"
+    assert list(store.loaded()) == ["oregon"] and store.evictions == 2 and store.loads == 3
+
+    for region in ["idaho", "../processed", ""]:
+        with pytest.raises(UnknownRegion):
+            store.get(region or "/")
+
+
+def test_region_payloads(regions_dir, monkeypatch):
+    """Test that chart payloads and the region listing are served per region."""
+    monkeypatch.setattr(regions, "_region_store", RegionStore(default=data.default_region, regions_dir=regions_dir))
+    server = flask.Flask(__name__)
+    register_export_routes(server)
+    register_region_routes(server)
+    client = server.test_client()
+
+    assert make_payload(region="oregon") == make_payload(["Butte"])
+    response = client.get("/api/charts?region=washington&year_start=2018&year_end=2018")
+    assert response.status_code == 200 and response.json == make_payload(["Los Angeles"], [2018, 2018])
+    assert client.get("/api/charts?region=idaho").status_code == 404
+
+    listing = client.get("/api/regions").json
+    assert listing["regions"] == ["california", "oregon", "washington"]
+    assert set(listing["loaded"]) == {"oregon", "washington"}
+
+
+def test_region_with_other_categories(tmp_path, monkeypatch):
+    """Test that a partition with fewer roof x damage pairs and structure categories than California is charted."""
+    butte = data.calfire_df[data.calfire_df["County"] == "Butte"]
+    roof_damage_columns, structure_columns = split_summary_columns(butte.columns)
+    dropped = [column for column in roof_damage_columns if column[0] not in ("Asphalt", "Metal")] + structure_columns[3:]
+    directory = tmp_path / "nevada"
+    directory.mkdir()
+    shutil.copy("data/processed/county_boundaries.geojson", directory)
+    shutil.copy("data/processed/county_stats.pkl", directory)
+    with open(directory / "processed_cal_fire.pkl", "wb") as f:
+        pickle.dump(butte.drop(columns=dropped), f)
+    store = RegionStore(default=data.default_region, regions_dir=str(tmp_path))
+    monkeypatch.setattr(regions, "_region_store", store)
+    server = flask.Flask(__name__)
+    register_export_routes(server)
+
+    response = server.test_client().get("/api/charts?region=nevada&year_start=2014&year_end=2025")
+    assert response.status_code == 200
+    assert all(response.json["specs"].values()), "Every chart should be drawn"
+    nevada = store.get("nevada").calfire_df
+    roof_chart = make_roof_chart(nevada)
+    assert set(roof_chart.data["Roof Construction"]) == {"Asphalt", "Metal"}
+    kept = [column for column in roof_damage_columns if column not in dropped]
+    assert roof_chart.data["Count"].sum() == butte[kept].to_numpy().sum()
+
+    leaderboard = store.get("nevada").county_leaderboard
+    structures = butte[[column for column in structure_columns if column not in dropped]].to_numpy().sum()
+    assert leaderboard.range_totals("Structures", 2014, 2025).sum() == structures
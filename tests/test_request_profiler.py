@@ -0,0 +1,56 @@
+import pytest
+import os
+import pstats
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import src.request_profiler as request_profiler
+from src.app import server
+from load_test import PayloadFactory
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(request_profiler, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("CALFIRE_DEBUG_TOKEN", "secret")
+    return server.test_client()
+
+
+def test_flagged_callback_is_profiled(client, tmp_path):
+    """Test that a flagged chart request saves a profile listed with its filter state."""
+    factory = PayloadFactory(client.get("/_dash-layout").get_json(), client.get("/_dash-dependencies").get_json())
+    body = factory.build_from_values({"county.value": ["Butte", "Napa"]}, "submit.n_clicks")[1]
+    assert body["output"] == "roof_chart_response.data"
+
+    assert "X-Calfire-Profile-Id" not in client.post("/_dash-update-component", json=body).headers
+    assert "X-Calfire-Profile-Id" not in client.post("/_dash-update-component?profile=1", json=body).headers, \
+        "The flag should be ignored without the token"
+    assert os.listdir(tmp_path) == []
+
+    response = client.post("/_dash-update-component", json=body, headers={"X-Calfire-Profile": "1", "X-Debug-Token": "secret"})
+    assert response.status_code == 200
+    profile_id = response.headers["X-Calfire-Profile-Id"]
+    stats = pstats.Stats(str(tmp_path / f"{profile_id}.prof"))
+    assert any(function == "build_chart_spec" for _, _, function in stats.stats)
+
+    [profile] = client.get("/debug/profiles?format=json&token=secret").json["profiles"]
+    assert profile["id"] == profile_id and profile["route"] == "callback:roof_chart_response" and profile["seconds"] > 0
+    # The charts are fetched by the clientside cache, the filter state is the request it sends
+    assert profile["filters"]["chart_request.data"]["county"] == ["Butte", "Napa"]
+    assert profile["filters"]["chart_request.data"]["trigger"] == "submit"
+
+    assert profile_id in client.get("/debug/profiles?token=secret").get_data(as_text=True)
+    assert "build_chart_spec" in client.get(f"/debug/profiles/{profile_id}?token=secret").get_data(as_text=True)
+    assert client.get(f"/debug/profiles/{profile_id}.prof?token=secret").data == (tmp_path / f"{profile_id}.prof").read_bytes()
+    assert client.get("/debug/profiles").status_code == 403
+    assert client.get("/debug/profiles/missing?token=secret").status_code == 404
+
+
+def test_old_profiles_are_deleted(client, tmp_path, monkeypatch):
+    """Test that only the most recent profiles are kept."""
+    monkeypatch.setattr(request_profiler, "PROFILE_KEEP", 2)
+    ids = [client.get("/api/regions?profile=1&token=secret").headers["X-Calfire-Profile-Id"] for _ in range(3)]
+    assert [profile["id"] for profile in request_profiler.list_profiles()] == ids[:0:-1]
+    assert len(os.listdir(tmp_path)) == 4
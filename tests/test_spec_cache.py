@@ -0,0 +1,112 @@
+import pytest
+import json
+import multiprocessing
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from plotly.utils import PlotlyJSONEncoder
+
+from src import spec_cache as spec_cache_module
+from src.spec_cache import SpecCache, outputs_version
+from src.chart_render import normalize_filters
+from src import callbacks, data, leaderboard, query_backend
+
+FILTERS = normalize_filters(["Butte"], [2017, 2020], None, "Year")
+
+
+def _write_entries(path, worker):
+    cache = SpecCache(path, "v1")
+    for i in range(20):
+        filters = normalize_filters([f"County {worker}"], [2000 + i, 2020], None, "Year")
+        assert cache.put(filters, "roof_chart", {"worker": worker, "i": i})
+
+
+def test_entries_are_kept_per_dataset_version(tmp_path):
+    """Test that a cache reopened with the same version serves its entries and a new version drops them."""
+    path = str(tmp_path / "specs.sqlite")
+    cache = SpecCache(path, "v1")
+    assert cache.get(FILTERS, "roof_chart") is None
+    assert cache.put(FILTERS, "roof_chart", {"marks": [1, 2]})
+    assert SpecCache(path, "v1").get(FILTERS, "roof_chart") == {"marks": [1, 2]}
+    assert cache.get(FILTERS, "damage_chart") is None
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    assert SpecCache(path, "v2").get(FILTERS, "roof_chart") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_configuration_changes_the_version(tmp_path, monkeypatch):
+    """Test that the outputs cached under one configuration are not served under another one."""
+    version = outputs_version("v1")
+    assert version.startswith("v1-") and outputs_version("v1") == version
+    path = str(tmp_path / "specs.sqlite")
+    SpecCache(path, version).put(FILTERS, "roof_chart", {"marks": [1]})
+
+    for module, name, value in [(leaderboard, "TOP_COUNTIES", leaderboard.TOP_COUNTIES + 1),
+                                (query_backend, "QUERY_BACKEND", "other"),
+                                (data, "crossfilter_cube", None if data.crossfilter_cube is not None else object())]:
+        with monkeypatch.context() as patch:
+            patch.setattr(module, name, value)
+            assert outputs_version("v1") != version, f"{name} should change the version"
+    assert SpecCache(path, version).get(FILTERS, "roof_chart") == {"marks": [1]}
+    assert SpecCache(path, outputs_version("v2")).get(FILTERS, "roof_chart") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    """Test that the stored bytes stay under the limit by dropping the entries used the longest ago."""
+    cache = SpecCache(str(tmp_path / "specs.sqlite"), "v1", max_mb=0.01)
+    rng = random.Random(0)
+    spec = {"values": [rng.random() for _ in range(300)]}
+    now = [1000.0]
+    monkeypatch.setattr(spec_cache_module.time, "time", lambda: now[0])
+    for year in range(2013, 2020):
+        now[0] += 100
+        cache.put(normalize_filters(None, [year, year], None, "Year"), "roof_chart", spec)
+        # The first entry stays the most recently used one
+        now[0] += 100
+        assert cache.get(normalize_filters(None, [2013, 2013], None, "Year"), "roof_chart") == spec
+
+    stats = cache.stats()
+    assert 0 < stats["bytes"] <= cache.max_bytes
+    assert stats["entries"] < 7
+    assert cache.get(normalize_filters(None, [2014, 2014], None, "Year"), "roof_chart") is None
+    assert cache.get(normalize_filters(None, [2019, 2019], None, "Year"), "roof_chart") == spec
+
+
+def test_concurrent_writers(tmp_path):
+    """Test that several processes write the same file without losing entries."""
+    path = str(tmp_path / "specs.sqlite")
+    processes = [multiprocessing.get_context("spawn").Process(target=_write_entries, args=(path, worker))
+                 for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    cache = SpecCache(path, "v1")
+    assert cache.stats()["entries"] == 80
+    assert cache.get(normalize_filters(["County 3"], [2019, 2020], None, "Year"), "roof_chart") == {"worker": 3, "i": 19}
+
+
+def test_callbacks_are_served_from_the_cache(tmp_path, monkeypatch):
+    """Test that a chart built once is served from the file, by this worker or a restarted one."""
+    path = str(tmp_path / "specs.sqlite")
+    monkeypatch.setattr(callbacks, "spec_cache", SpecCache(path, "v1"))
+    request = {"key": "k", "trigger": "submit", "county": ["Butte"], "year": [2017, 2020], "incident_name": None,
+               "selectedData": None, "granularity": "Year"}
+    spec = callbacks.update_roof_chart(request)["outputs"]["roof_chart"]
+    summary = json.dumps(callbacks.update_filters(request)["outputs"]["summary_card"], cls=PlotlyJSONEncoder)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The chart should come from the cache")
+
+    monkeypatch.setattr(callbacks, "spec_cache", SpecCache(path, "v1"))
+    monkeypatch.setattr(callbacks, "build_chart_spec", fail)
+    monkeypatch.setattr(callbacks, "make_summary_chart", fail)
+    assert callbacks.update_roof_chart(request)["outputs"]["roof_chart"] == spec
+    assert json.dumps(callbacks.update_filters(request)["outputs"]["summary_card"], cls=PlotlyJSONEncoder) == summary
+    assert callbacks.spec_cache.hits == 2
@@ -0,0 +1,51 @@
+import pytest
+import json
+import flask
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.static_export import export_static, register_export_routes, filter_key
+from src.callbacks import update_filters, update_roof_chart, update_timeseries_chart
+from src.spec_cache import SpecCache
+from src import callbacks
+
+
+def test_export_static(tmp_path):
+    """Test that the export holds one content-addressed file per distinct output and matches the chart callbacks."""
+    report = export_static(str(tmp_path), ["Butte", "Alpine"], [[2017, 2020], [2019, 2019], [2013, 2013]], workers=1)
+    manifest = json.loads((tmp_path / "manifest.json").read_text())["files"]
+    assert report["filter_states"] == len(manifest) == 9
+    assert report["files"] == len(os.listdir(tmp_path / "data")) < 9, "Filter states without data should share one file"
+    assert report["bytes"] > 0 and (tmp_path / "index.html").exists()
+
+    payload = json.loads((tmp_path / "data" / manifest[filter_key("Butte", [2017, 2020])]).read_text())
+
+    request = {"key": "k", "trigger": "submit", "county": ["Butte"], "year": [2017, 2020], "incident_name": None,
+               "selectedData": None, "granularity": "Year"}
+    assert payload["total_cost"] == update_filters(request)["outputs"]["summary_card"][1].children
+    assert json.loads(json.dumps(update_roof_chart(request)["outputs"]["roof_chart"])) == payload["specs"]["roof_chart"]
+    timeseries_chart = update_timeseries_chart(request)["outputs"]["timeseries_chart"]
+    assert json.loads(json.dumps(timeseries_chart)) == payload["specs"]["timeseries_chart"]
+
+
+def test_charts_endpoint(tmp_path, monkeypatch):
+    """Test the live fallback of the static page, served from the caches of the dashboard callbacks."""
+    monkeypatch.setattr(callbacks, "spec_cache", SpecCache(str(tmp_path / "specs.sqlite"), "v1"))
+    server = flask.Flask(__name__)
+    register_export_routes(server)
+    url = "/api/charts?county=Butte&year_start=2018&year_end=2018&granularity=Month"
+    response = server.test_client().get(url)
+    assert response.status_code == 200
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
+    payload = response.get_json()
+    assert set(payload["specs"]) == {"roof_chart", "damage_chart", "structure_chart", "timeseries_chart"}
+
+    def fail(*args, **kwargs):
+        raise AssertionError("A repeated request should come from the cache")
+
+    monkeypatch.setattr(callbacks, "build_chart_spec", fail)
+    monkeypatch.setattr(callbacks, "make_summary_chart", fail)
+    assert server.test_client().get(url).get_json() == payload
+    assert server.test_client().get("/api/charts?region=atlantis").status_code == 404
@@ -0,0 +1,90 @@
+import pytest
+import numpy as np
+import pandas as pd
+import flask
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src import structure_store
+from src.structure_store import StructureStore, register_structure_routes
+
+
+@pytest.fixture
+def structures():
+    """Fixture providing random structure-level records."""
+    rng = np.random.default_rng(27)
+    n = 20_000
+    return pd.DataFrame({
+        "County": rng.choice(["Butte", "Los Angeles", "Napa", "Shasta", "Sonoma"], n, p=[0.5, 0.3, 0.1, 0.07, 0.03]),
+        "Year": rng.choice([2017, 2018, 2020, 2025], n),
+        "Incident Name": rng.choice([f"Fire {i}" for i in range(300)], n),
+        "Damage": rng.choice(["No Damage", "Affected (1-9%)", "Destroyed (>50%)"], n),
+        "Roof Construction": rng.choice(["Asphalt", "Tile", "Metal"], n),
+        "Structure Category": rng.choice(["Single Residence", "Infrastructure"], n),
+        "Assessed Improved Value": rng.integers(0, 3_000_000, n),
+    })
+
+
+def pandas_query(df, filters, min_value=None):
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in filters.items():
+        mask &= df[column].isin(values).to_numpy()
+    if min_value is not None:
+        mask &= (df["Assessed Improved Value"] >= min_value).to_numpy()
+    return np.flatnonzero(mask)
+
+
+@pytest.mark.parametrize("filters, min_value", [
+    ({}, None),
+    ({"County": ["Butte"], "Year": [2018], "Damage": ["Destroyed (>50%)"],
+      "Roof Construction": ["Tile"], "Structure Category": ["Single Residence"]}, 1e6),
+    ({"Damage": ["No Damage", "Affected (1-9%)"], "Roof Construction": ["Asphalt"]}, None),
+    ({"Incident Name": ["Fire 3", "Fire 250"], "County": ["Napa", "Sonoma"]}, None),
+    ({"County": ["Sonoma"], "Year": [2020]}, 500_000),
+    ({"County": ["Unknown County"]}, None),
+])
+def test_query_matches_pandas(structures, filters, min_value):
+    """Test that both the sorted index and the bitmap paths match a pandas filter."""
+    store = StructureStore.from_frame(structures)
+    expected = pandas_query(structures, filters, min_value)
+    np.testing.assert_array_equal(store.query(filters, min_value=min_value), expected)
+    assert store.count(filters, min_value=min_value) == len(expected)
+
+
+def test_rows_paging_and_roundtrip(structures, tmp_path):
+    """Test paged rows and saving and loading the store."""
+    path = str(tmp_path / "structures.npz")
+    StructureStore.from_frame(structures).save(path)
+    store = StructureStore.load(path)
+    filters = {"County": ["Butte"], "Year": [2018]}
+    expected = structures.iloc[pandas_query(structures, filters)]
+
+    page = store.rows(filters, page=1, page_size=10)
+    assert len(page) == 10
+    assert page["County"].tolist() == expected["County"].iloc[10:20].tolist()
+    assert page["Assessed Improved Value"].tolist() == expected["Assessed Improved Value"].iloc[10:20].tolist()
+    assert store.codes["County"].dtype == np.uint8, "Codes should use the smallest integer type"
+
+
+def test_structures_endpoint(structures, tmp_path, monkeypatch):
+    """Test the JSON endpoint, including when the store has not been generated."""
+    server = flask.Flask(__name__)
+    register_structure_routes(server)
+    client = server.test_client()
+
+    monkeypatch.setattr(structure_store, "_structure_store", None)
+    monkeypatch.setattr(structure_store.get_structure_store, "__defaults__", (str(tmp_path / "missing.npz"),))
+    assert client.get("/api/structures").status_code == 503
+
+    monkeypatch.setattr(structure_store, "_structure_store", StructureStore.from_frame(structures))
+    response = client.get("/api/structures?county=Butte&year=2018&damage=Destroyed (>50%)&page_size=5")
+    assert response.status_code == 200
+    assert response.json["count"] == len(pandas_query(structures, {"County": ["Butte"], "Year": [2018], "Damage": ["Destroyed (>50%)"]}))
+    assert len(response.json["rows"]) == 5
+    assert {row["County"] for row in response.json["rows"]} == {"Butte"}
+
+    assert client.get("/api/structures?year=abc").status_code == 400
+    response = client.get("/api/structures?county=Butte&page=-1&page_size=-5")
+    assert (response.json["page"], response.json["page_size"], len(response.json["rows"])) == (0, 1, 1)
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pickle
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data_import import load_calfire_df
+from synthetic_dins import load_profile, make_incidents, generate_chunks, write_synthetic_dins
+
+
+def test_synthetic_data_runs_through_the_pipeline(tmp_path):
+    """Test that the synthetic files are ingested like raw extracts and keep the real county distribution."""
+    paths = write_synthetic_dins(str(tmp_path / "raw"), 20_000, files=2, chunk_size=3_000, seed=1)
+    assert [os.path.basename(path) for path in paths] == ["synthetic_0.csv", "synthetic_1.csv"]
+
+    profile = load_profile()
+    counties = sorted(profile["incidents"]["County"].unique())
+    geojson_file = tmp_path / "counties.geojson"
+    geojson_file.write_text(json.dumps({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"name": county},
+         "geometry": {"type": "Polygon", "coordinates": [[[-121, 39], [-121, 40], [-122, 40], [-121, 39]]]}}
+        for county in counties]}))
+    load_calfire_df(str(tmp_path / "raw"), workers=1, output_dir=str(tmp_path / "out"),
+                    geojson_file_path=str(geojson_file), cache_dir=None)
+
+    with open(tmp_path / "out" / "processed_cal_fire.pkl", "rb") as f:
+        summary = pickle.load(f)
+    real_columns = list(pd.read_pickle("data/processed/processed_cal_fire.pkl").columns)
+    assert set(summary.columns) <= set(real_columns), "Rare roof x damage pairs may be missing from a small sample"
+    structure_columns = real_columns[47:54]
+    structures = summary[structure_columns].to_numpy().sum()
+    assert 0.95 * 20_000 < structures < 20_000, "Only the dirty rows should be dropped"
+
+    real = profile["incidents"].groupby("County")["Structures"].sum()
+    synthetic = summary[structure_columns].sum(axis=1).groupby(summary["County"]).sum()
+    real_share, synthetic_share = real / real.sum(), (synthetic / synthetic.sum()).reindex(real.index, fill_value=0)
+    assert np.abs(real_share - synthetic_share).sum() < 0.1
+
+
+def test_skew_and_copies():
+    """Test that skew flattens or concentrates the incident weights and copies get their own names."""
+    profile = load_profile()
+    real = make_incidents(profile)
+    uniform = make_incidents(profile, skew=0)
+    concentrated = make_incidents(profile, skew=2)
+    assert np.allclose(uniform["Weight"], 1 / len(uniform))
+    assert concentrated["Weight"].max() > real["Weight"].max()
+
+    copies = make_incidents(profile, copies=3)
+    assert len(copies) == 3 * len(real)
+    assert set(copies["Incident Name"]) >= {f"{name} {number}" for name in real["Incident Name"] for number in [2, 3]}
+    assert np.isclose(copies["Weight"].sum(), 1)
+
+    chunks = list(generate_chunks(profile, real, 2_500, chunk_size=1_000))
+    assert [len(chunk) for chunk in chunks] == [1_000, 1_000, 500]
@@ -45,6 +45,20 @@ def test_make_time_series_chart_with_selection(sample_data):
     counties_in_chart = set(entry["County"] for entry in data_values)
     assert counties_in_chart == {"Los Angeles", "San Francisco"}, f"Chart should only contain selected counties, but found: {counties_in_chart}"
 
+def test_make_time_series_chart_monthly():
+    """Test that monthly rollups are plotted on a temporal axis."""
+    monthly_data = pd.DataFrame({
+        "Year": [2018, 2018, 2018],
+        "Month": pd.to_datetime(["2018-07-01", "2018-11-01", "2018-11-01"]),
+        "County": ["Butte", "Butte", "Los Angeles"],
+        "Total Economic Loss": [2e6, 3e9, 1e9]
+    })
+    result = make_time_series_chart(monthly_data, granularity="Month")
+    assert isinstance(result, alt.Chart), "Function should return an Altair Chart"
+    assert result.encoding.x.shorthand == "Month:T", "Monthly points should use a temporal month axis"
+    assert result.encoding.x["timeUnit"] == "yearmonth", "Monthly points should be labelled by month"
+    assert len(result.data) == 3, "There should be one point per county and month"
+
     
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,71 @@
+import pytest
+import numpy as np
+import pandas as pd
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.value_sketches import ValueDistribution, make_value_sketches, merge_value_sketches, sketch_quantiles
+from src.distribution_panel import make_distribution_panel
+
+QUANTILES = [0, 0.1, 0.5, 0.9, 0.99, 1]
+
+
+@pytest.fixture
+def structures():
+    rng = np.random.default_rng(0)
+    n = 50_000
+    return pd.DataFrame({
+        "Incident Name": rng.choice(["Camp", "Woolsey", "Atlas", "Eaton"], n),
+        "Year": rng.integers(2014, 2026, n),
+        "County": rng.choice(["Butte", "Los Angeles", "Napa"], n),
+        # Some structures have no assessed value
+        "Assessed Improved Value": np.where(rng.random(n) < 0.05, 0, rng.lognormal(12, 1.5, n)).astype("int32"),
+    })
+
+
+def exact_quantiles(values, quantiles):
+    values = np.sort(values)
+    return [values[int(np.floor(q * (len(values) - 1)))] for q in quantiles]
+
+
+@pytest.mark.parametrize("filters", [{}, {"county": ["Butte"], "year": [2017, 2020]},
+                                     {"incident_name": ["Camp", "Atlas"], "county": ["Napa"]}])
+def test_quantiles_are_within_the_relative_accuracy(structures, filters):
+    """Test that every estimated percentile is within alpha of the exact one and that counts are exact."""
+    result = ValueDistribution(make_value_sketches(structures)).quantiles(quantiles=QUANTILES, **filters)
+
+    matching = structures
+    if filters.get("county"):
+        matching = matching[matching["County"].isin(filters["county"])]
+    if filters.get("year"):
+        matching = matching[matching["Year"].between(*filters["year"])]
+    if filters.get("incident_name"):
+        matching = matching[matching["Incident Name"].isin(filters["incident_name"])]
+
+    assert result["count"] == len(matching)
+    for q, exact in zip(QUANTILES, exact_quantiles(matching["Assessed Improved Value"].to_numpy(), QUANTILES)):
+        assert abs(result["quantiles"][q] - exact) <= 0.01 * exact + 0.01
+
+
+def test_merged_sketches_match_a_single_sketch(structures):
+    """Test that merging the sketches of parts of the data gives the sketch of all of it."""
+    parts = [make_value_sketches(part) for part in np.array_split(structures, 3)]
+    merged, single = merge_value_sketches(parts), make_value_sketches(structures)
+    for name in ["county_year", "incident"]:
+        pd.testing.assert_frame_equal(merged[name], single[name])
+
+    with pytest.raises(ValueError):
+        merge_value_sketches([single, make_value_sketches(structures, alpha=0.02)])
+
+
+def test_empty_filters_and_panel(structures):
+    """Test that filters without structures have no percentiles and that the panel shows them."""
+    distribution = ValueDistribution(make_value_sketches(structures))
+    assert sketch_quantiles([], [], [0.5]) == {"count": 0, "quantiles": {0.5: None}}
+    assert distribution.quantiles(county=["Nowhere"])["count"] == 0
+    assert make_distribution_panel(county=["Nowhere"], distribution=distribution) == "No Data Available"
+
+    table, note = make_distribution_panel(county=["Butte"], distribution=distribution)
+    assert "Median" in str(table) and "±1%" in note.children